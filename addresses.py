@@ -1,177 +1,213 @@
-import os
-import tkinter as tk
-from tkinter import filedialog
-import pdfplumber
-import re
-import openpyxl
-
-def read_pdf(pdf_path):
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            # Read only the first page
-            page = pdf.pages[0]
-            text = page.extract_text()
-            # Split text into lines
-            lines = text.split('\n')
-
-            # Skip lines containing specific headers and "California Gr"
-            new_lines = []
-            skip_next_lines = 0
-            for line in lines:
-                if "California Gr" in line:
-                    skip_next_lines = 2
-                    continue
-                if "Hawaii Gr" in line:
-                    skip_next_lines = 2
-                if "Colorado" in line:
-                    skip_next_lines = 2
-                if "Member R" in line:
-                    skip_next_lines = 2
-                if "Nine Pied" in line:
-                    skip_next_lines = 2
-                if "CA Medic" in line:
-                    skip_next_lines = 2
-                if "Grievance" in line:
-                    skip_next_lines = 2
-                if "PO Box 1809" in line:
-                    skip_next_lines = 1
-                if "PO Box 939001" in line:
-                    skip_next_lines = 1
-                if skip_next_lines > 0:
-                    skip_next_lines -= 1
-                    continue
-                new_lines.append(line)
-
-            text = '\n'.join(new_lines)
-    except:
-        print(f"Failed to read PDF: {pdf_path}")
-        return {key: "NOT FOUND" for key in ['Name', 'Address Line 1', 'Address Line 2', 'City', 'State', 'ZIP Code', 'File Name']}
-
-    # Initialize dictionary to store extracted data
-    info = {
-        'Name': '',
-        'Address Line 1': '',
-        'Address Line 2': '',
-        'City': '',
-        'State': '',
-        'ZIP Code': '',
-    }
-
-    lines = text.split('\n')
-
-    # Find Name, Address, City, and State using patterns
-    for i, line in enumerate(lines):
-        # Pattern for City
-        city_pattern = re.compile(r'([A-Za-z\s]+),\s([A-Z]{2})')
-        city_match = city_pattern.search(line)
-
-        # Updated Pattern for Address to include PO Box and street address
-        address_pattern = re.compile(r'(\d{2,5}\s[^,]+|PO Box \d+)')
-        address_match = address_pattern.search(lines[i-1]) if i > 0 else None
-
-        # If City is found
-        if city_match and address_match:
-            info['City'] = city_match.group(1).strip()
-            info['State'] = city_match.group(2).strip()
-            
-            # Extract and process Address Line 1
-            full_address = address_match.group().strip()
-
-            if full_address.startswith("PO Box"):
-                # If the address is a PO Box, set it directly
-                info['Address Line 1'] = full_address
-            else:
-                # Existing logic for street addresses
-                # Pattern to identify apartment or unit in the address
-                apt_unit_pattern = re.compile(r'\b(Apt|Unit|UNIT|APT|SPC|Suite|No|no|Spc)\b\s.*')
-                apt_unit_match = apt_unit_pattern.search(full_address)
-
-                # Check for keywords to cut off Address Line 1
-                keywords_to_cut_off = ["Health", "Med", "MED", "HEA", "MRN", " 醫", "醫","COMPRAD","Comprad"]
-                for keyword in keywords_to_cut_off:
-                    keyword_position = full_address.find(keyword)
-                    if keyword_position != -1:
-                        full_address = full_address[:keyword_position].strip()
-                        break
-
-                if apt_unit_match:
-                    split_index = apt_unit_match.start()
-                    info['Address Line 1'] = full_address[:split_index].strip()
-                    info['Address Line 2'] = full_address[split_index:].strip()
-                else:
-                    info['Address Line 1'] = full_address
-
-            # Extracting Name from the line before Address
-            if i > 1:
-                name_line = lines[i-2].strip()
-                # Modify the regular expression to capture name until specified keywords
-                name_line = re.sub(r'\s*(GROUP|PURCHASER|Purchaser|Medical|MRN|MED|購|IDENTIF|Enrole|Enroll|N.º|COMPRA).*', '', name_line, flags=re.IGNORECASE)
-                info['Name'] = name_line
-
-            # Extract ZIP Code
-            zip_pattern = re.compile(r'([A-Z]{2})\s(\d{5}(-\d{4})?)')
-            zip_match = zip_pattern.search(line)
-            if zip_match:
-                info['ZIP Code'] = zip_match.group(2).strip()
-
-            break
-
-    return info
-
-
-def select_folder():
-    root = tk.Tk()
-    root.withdraw()  # Hide the main window
-    folder_selected = filedialog.askdirectory()
-    return folder_selected
-
-def get_pdf_files(folder_path):
-    pdf_files = []
-    # Iterate over the immediate subdirectories
-    for subdir in next(os.walk(folder_path))[1]:
-        subdir_path = os.path.join(folder_path, subdir)
-        # Process files in the immediate subdirectory
-        for file in os.listdir(subdir_path):
-            if file.endswith('.pdf'):
-                pdf_files.append(os.path.join(subdir_path, file))
-                break  # Only take one PDF per subfolder
-    return pdf_files
-
-
-def create_spreadsheet(data, filename='addresses.xlsx'):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-
-    # Adding 'File Name' to headers
-    headers = ['Name', 'Address Line 1', 'Address Line 2', 'City', 'State', 'ZIP Code', 'File Name']
-    ws.append(headers)
-
-    # Writing the data
-    for entry in data:
-        row = [entry.get(h, "NOT FOUND") for h in headers]
-        ws.append(row)
-
-    wb.save(filename)
-
-
-def main():
-    folder_path = select_folder()
-    pdf_files = get_pdf_files(folder_path)
-
-    extracted_data = []
-    for pdf_file in pdf_files:
-        info = read_pdf(pdf_file)
-        info['File Name'] = pdf_file  # Add 'File Name' to the info dictionary
-        extracted_data.append(info)
-
-
-    # Define the spreadsheet filename
-    spreadsheet_filename = 'addresses.xlsx'
-    create_spreadsheet(extracted_data, spreadsheet_filename)
-
-    # Print the path where the spreadsheet is saved
-    spreadsheet_path = os.path.join(os.getcwd(), spreadsheet_filename)
-    print(f"Spreadsheet created at {spreadsheet_path}")
-
-if __name__ == "__main__":
+import os
+import re
+from functools import partial
+from parallel import imap_ordered
+from instrumentation import RunReport
+from pdf_cache import read_cached, use_directory
+from sheet_writer import SheetWriter
+from layouts import layout_extractor
+from raw_text import tiered_extractor, extract_raw_pages
+from page_memory import read_page_texts
+
+# Bump when the parsing in parse_pages changes, so cached results from the old parser are not reused
+PARSER_VERSION = 2
+
+# Plan header lines to drop: marker text -> number of lines to drop, counting the marker's own line.
+# To support a new plan header just add it here, the table is compiled into one pattern below.
+SKIP_MARKERS = {
+    "California Gr": 3,
+    "Hawaii Gr": 2,
+    "Colorado": 2,
+    "Member R": 2,
+    "Nine Pied": 2,
+    "CA Medic": 2,
+    "Grievance": 2,
+    "PO Box 1809": 1,
+    "PO Box 939001": 1,
+}
+
+# Text printed to the right of the street address, Address Line 1 ends where the first one starts
+CUTOFF_KEYWORDS = ["Health", "Med", "MED", "HEA", "MRN", " 醫", "醫", "COMPRAD", "Comprad"]
+
+# Words that start Address Line 2
+UNIT_TOKENS = ["Apt", "Unit", "UNIT", "APT", "SPC", "Suite", "No", "no", "Spc"]
+
+# Labels printed after the name on the name line
+NAME_CUTOFF_TOKENS = ["GROUP", "PURCHASER", "Purchaser", "Medical", "MRN", "MED", "購", "IDENTIF", "Enrole", "Enroll", "N.º", "COMPRA"]
+
+
+def literal_alternation(words):
+    # Longest first, so a marker that contains another one still wins
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+SKIP_PATTERN = re.compile(literal_alternation(SKIP_MARKERS))
+CUTOFF_PATTERN = re.compile(literal_alternation(CUTOFF_KEYWORDS))
+UNIT_PATTERN = re.compile(r'\b(' + '|'.join(UNIT_TOKENS) + r')\b\s.*')
+NAME_CUTOFF_PATTERN = re.compile(r'\s*(' + '|'.join(NAME_CUTOFF_TOKENS) + r').*', flags=re.IGNORECASE)
+CITY_PATTERN = re.compile(r'([A-Za-z\s]+),\s([A-Z]{2})')
+ADDRESS_PATTERN = re.compile(r'(\d{2,5}\s[^,]+|PO Box \d+)')
+ZIP_PATTERN = re.compile(r'([A-Z]{2})\s(\d{5}(-\d{4})?)')
+
+
+def extract_first_page(pdf_path):
+    # Read only the first page
+    return read_page_texts(pdf_path, max_pages=1)
+
+
+def fields_found(info):
+    # A cropped read is only trusted when it found the address block
+    return bool(info['City'] and info['Address Line 1'])
+
+
+def read_pdf(pdf_path):
+    # Extracted page text and parsed fields are cached on disk by PDF content hash.
+    # The raw content-stream text is tried first, pdfplumber only reads the letters where it
+    # doesn't parse cleanly, and only the top strip of those with a known layout.
+    extractor, extract = layout_extractor('addresses', 'first-page', extract_first_page, parse_pages, fields_found)
+    extractor, extract = tiered_extractor(extractor, partial(extract_raw_pages, max_pages=1), extract, parse_pages, fields_found)
+    try:
+        return read_cached(pdf_path, extractor, extract, f'addresses/{PARSER_VERSION}', parse_pages)
+    except:
+        print(f"Failed to read PDF: {pdf_path}")
+        return {key: "NOT FOUND" for key in ['Name', 'Address Line 1', 'Address Line 2', 'City', 'State', 'ZIP Code', 'File Name']}
+
+
+def parse_pages(pages):
+    text = pages[0]
+    # Split text into lines
+    lines = text.split('\n')
+
+    # Initialize dictionary to store extracted data
+    info = {
+        'Name': '',
+        'Address Line 1': '',
+        'Address Line 2': '',
+        'City': '',
+        'State': '',
+        'ZIP Code': '',
+    }
+
+    # Walk the lines once: drop the plan header blocks listed in SKIP_MARKERS, and stop
+    # as soon as the address block is found instead of filtering the rest of the letter
+    kept = []
+    skip_next_lines = 0
+    for line in lines:
+        if SKIP_PATTERN.search(line):
+            # Several markers on one line: the longest skip wins
+            skip_next_lines = max(SKIP_MARKERS[match.group()] for match in SKIP_PATTERN.finditer(line))
+        if skip_next_lines > 0:
+            skip_next_lines -= 1
+            continue
+        kept.append(line)
+        i = len(kept) - 1
+
+        # Pattern for City, then the address on the line before it (PO Box or street address)
+        city_match = CITY_PATTERN.search(line)
+        address_match = ADDRESS_PATTERN.search(kept[i-1]) if city_match and i > 0 else None
+
+        # If City is found
+        if city_match and address_match:
+            info['City'] = city_match.group(1).strip()
+            info['State'] = city_match.group(2).strip()
+            
+            # Extract and process Address Line 1
+            full_address = address_match.group().strip()
+
+            if full_address.startswith("PO Box"):
+                # If the address is a PO Box, set it directly
+                info['Address Line 1'] = full_address
+            else:
+                # Existing logic for street addresses
+                # Pattern to identify apartment or unit in the address
+                apt_unit_match = UNIT_PATTERN.search(full_address)
+
+                # Cut Address Line 1 at the first cutoff keyword
+                cutoff_match = CUTOFF_PATTERN.search(full_address)
+                if cutoff_match:
+                    full_address = full_address[:cutoff_match.start()].strip()
+
+                if apt_unit_match:
+                    split_index = apt_unit_match.start()
+                    info['Address Line 1'] = full_address[:split_index].strip()
+                    info['Address Line 2'] = full_address[split_index:].strip()
+                else:
+                    info['Address Line 1'] = full_address
+
+            # Extracting Name from the line before Address
+            if i > 1:
+                name_line = kept[i-2].strip()
+                # Modify the regular expression to capture name until specified keywords
+                name_line = NAME_CUTOFF_PATTERN.sub('', name_line)
+                info['Name'] = name_line
+
+            # Extract ZIP Code
+            zip_match = ZIP_PATTERN.search(line)
+            if zip_match:
+                info['ZIP Code'] = zip_match.group(2).strip()
+
+            break
+
+    return info
+
+
+def select_folder():
+    # tkinter is only needed for the folder picker, headless runs never load it
+    import tkinter as tk
+    from tkinter import filedialog
+
+    root = tk.Tk()
+    root.withdraw()  # Hide the main window
+    folder_selected = filedialog.askdirectory()
+    return folder_selected
+
+def get_pdf_files(folder_path):
+    pdf_files = []
+    # Iterate over the immediate subdirectories
+    for subdir in sorted(next(os.walk(folder_path))[1]):
+        subdir_path = os.path.join(folder_path, subdir)
+        # Process files in the immediate subdirectory
+        for file in sorted(os.listdir(subdir_path)):
+            if file.endswith('.pdf'):
+                pdf_files.append(os.path.join(subdir_path, file))
+                break  # Only take one PDF per subfolder
+    return pdf_files
+
+
+def create_spreadsheet(data, filename='addresses.xlsx'):
+    # Adding 'File Name' to headers
+    headers = ['Name', 'Address Line 1', 'Address Line 2', 'City', 'State', 'ZIP Code', 'File Name']
+
+    # Writing the data, rows are streamed to disk so data can be a generator
+    with SheetWriter(filename, headers, sheet_title='Sheet', bold_headers=False, missing="NOT FOUND") as writer:
+        writer.write_all(data)
+
+
+def main(workers=None, folder_path=None, spreadsheet_filename='addresses.xlsx'):
+    # Ask for the folder unless one is given (the CLI always gives one)
+    folder_path = folder_path or select_folder()
+    output_base = os.path.splitext(spreadsheet_filename)[0]
+    use_directory(os.path.dirname(os.path.abspath(spreadsheet_filename)))
+    report = RunReport('addresses', f'{output_base}_report.json', f'{output_base}_progress.jsonl')
+    with report.stage('scan'):
+        pdf_files = get_pdf_files(folder_path)
+    report.count('folders', len(pdf_files))
+
+    # Read the PDFs across the worker pool, results come back in the same order as pdf_files
+    def extracted_data():
+        for pdf_file, (info, seconds, counts) in zip(pdf_files, imap_ordered(read_pdf, [(pdf_file,) for pdf_file in pdf_files], workers, timed=True)):
+            # read_pdf catches its own errors, only its failure result carries a 'File Name'
+            report.file_done(pdf_file, seconds, failed='File Name' in info, counts=counts)
+            info['File Name'] = pdf_file  # Add 'File Name' to the info dictionary
+            yield info
+
+    with report.stage('extract', total=len(pdf_files)):
+        create_spreadsheet(extracted_data(), spreadsheet_filename)
+
+    # Print the path where the spreadsheet is saved
+    spreadsheet_path = os.path.abspath(spreadsheet_filename)
+    print(f"Spreadsheet created at {spreadsheet_path}")
+    report.save()
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
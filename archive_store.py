@@ -0,0 +1,126 @@
+import os
+import json
+import errno
+import shutil
+import hashlib
+import datetime
+
+
+# Linux ioctl that makes dst share src's data blocks (btrfs, XFS, ...), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def copy_range(src, dst):
+    # Kernel-side copy, the data never passes through user space
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        remaining = os.fstat(src_file.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(src_file.fileno(), dst_file.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+        if remaining > 0:
+            raise OSError(errno.EIO, 'copy_file_range stopped early', src)
+
+
+def hardlink(src, dst):
+    os.link(src, dst)
+
+
+def place_file(src, dst, link=False):
+    # Put src's content at dst as cheaply as the filesystem allows. A reflink comes first because
+    # it is copy-on-write, then copy_file_range, then a plain copy. A hardlink shares the inode, so
+    # it is only tried with link=True, for a src this store owns and never rewrites: an inbound
+    # zip redelivered in place would otherwise change the archived copy along with it.
+    tmp = dst + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    methods = [('reflink', reflink), ('copy_file_range', copy_range)]
+    if link:
+        methods.insert(1, ('hardlink', hardlink))
+    for method, place in methods:
+        try:
+            place(src, tmp)
+            break
+        except (OSError, AttributeError, ImportError):
+            # Not supported here (other filesystem, other OS, cross-device), try the next one
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    else:
+        shutil.copyfile(src, tmp)
+        method = 'copy'
+
+    os.replace(tmp, dst)
+    return method
+
+
+class ArchiveStore:
+    # The Complete folder as a content-addressed store. Each distinct zip is kept once as
+    # blobs/<sha256>.zip, index.jsonl maps original file names and dates to those blobs, and
+    # Complete/<name> is linked to its blob so the folder still looks like before.
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.blob_folder = os.path.join(folder, 'blobs')
+        self.index_path = os.path.join(folder, 'index.jsonl')
+        os.makedirs(self.blob_folder, exist_ok=True)
+
+        # (name, size, mtime_ns) -> digest, and the (name, date, digest) entries already recorded
+        self.by_stat = {}
+        self.recorded = set()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        self.remember(json.loads(line))
+
+    def remember(self, entry):
+        self.by_stat[(entry['name'], entry['size'], entry['mtime_ns'])] = entry['digest']
+        self.recorded.add((entry['name'], entry['date'], entry['digest']))
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_folder, f'{digest}.zip')
+
+    def add(self, path, date=None):
+        name = os.path.basename(path)
+        date = date or datetime.date.today().isoformat()
+        stat = os.stat(path)
+
+        # Same name, size and modification time as something already archived: don't hash it again
+        digest = self.by_stat.get((name, stat.st_size, stat.st_mtime_ns))
+        if digest is None or not os.path.exists(self.blob_path(digest)):
+            digest = file_digest(path)
+        blob = self.blob_path(digest)
+
+        if not os.path.exists(blob):
+            # A copy of its own, read-only, so nothing written through Complete/<name> reaches it
+            place_file(path, blob)
+            os.chmod(blob, 0o444)
+
+        # Keep Complete/<name> pointing at the stored content
+        named_path = os.path.join(self.folder, name)
+        if not (os.path.exists(named_path) and os.path.samefile(named_path, blob)):
+            place_file(blob, named_path, link=True)
+
+        if (name, date, digest) not in self.recorded:
+            entry = {'name': name, 'date': date, 'digest': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            # Append-only, so the index stays cheap to update however many days it covers
+            with open(self.index_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.remember(entry)
+        return digest
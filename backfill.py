@@ -0,0 +1,143 @@
+import os
+import re
+import sys
+import time
+import datetime
+
+from parallel import DEFAULT_WORKERS, JobFailed, imap_unordered, largest_first
+from instrumentation import RunReport
+from pdf_cache import use_directory
+from trying import date_folder_jobs, extract_record, write_date_folder
+
+
+# Date folders are named M.D, without the year
+DATE_FOLDER_PATTERN = re.compile(r'(\d{1,2})\.(\d{1,2})$')
+
+
+def folders_in_range(main_directory, start, end):
+    # [(date folder name, date)] for the days from start to end (both included) that have a
+    # folder in the main directory, oldest first. A range longer than a year meets the same M.D
+    # folder again, it is kept once with its latest date.
+    days = {}
+    day = start
+    while day <= end:
+        name = f'{day.month}.{day.day}'
+        if os.path.isdir(os.path.join(main_directory, name)):
+            days.pop(name, None)
+            days[name] = day
+        day += datetime.timedelta(days=1)
+    return list(days.items())
+
+
+def folder_date(name, today=None):
+    # The date of an M.D folder: the latest such day that isn't after today
+    today = today or datetime.date.today()
+    match = DATE_FOLDER_PATTERN.match(name)
+    if not match:
+        raise ValueError(f'{name} is not an M.D date folder')
+    month, day = int(match.group(1)), int(match.group(2))
+    date = datetime.date(today.year, month, day)
+    return date if date <= today else datetime.date(today.year - 1, month, day)
+
+
+class Day:
+    # One date folder of the backfill: its jobs, and their results as they come back
+
+    def __init__(self, name, date, path, jobs, folders):
+        self.name = name
+        self.date = date
+        self.path = path
+        self.jobs = jobs
+        self.folders = folders
+        self.results = [None] * len(jobs)
+        self.pending = len(jobs)
+        self.failed = 0
+        self.done_after = None  # Seconds into the backfill at which extracted.xlsx was written
+
+    def write(self, report, started):
+        errors = write_date_folder(self.path, self.jobs, self.results)
+        self.results = None  # Rows are in the spreadsheet now
+        self.done_after = time.perf_counter() - started
+        for folder_name, folder_errors in errors.items():
+            if folder_errors:
+                report.failure('backfill', f'{self.name}/{folder_name}', '; '.join(folder_errors))
+
+
+def backfill(main_directory, date_folders, workers=None, report=None):
+    # Regenerate extracted.xlsx for each of the (date folder name, date) pairs, with the folder's
+    # date as the rows' Order Received (and so their Parquet partition). The letters of all of them go
+    # through one worker pool, day after day (biggest PDFs first within a day) so the pool never
+    # runs dry between days, and each day's spreadsheet is written as soon as its last letter
+    # is back. A broken PDF is skipped and reported instead of stopping the backfill.
+    workers = workers or DEFAULT_WORKERS
+    report = report or RunReport('backfill')
+    started = time.perf_counter()
+
+    days, jobs, owners = [], [], []  # owners: (day, position in the day's jobs) of each job
+    with report.stage('inventory'):
+        for name, date in date_folders:
+            path = os.path.join(main_directory, name)
+            day_jobs, folders = date_folder_jobs(path, date.strftime('%m/%d/%Y'))
+            day = Day(name, date, path, day_jobs, folders)
+            days.append(day)
+            report.count('folders', len(folders))
+            for position in largest_first(day_jobs):
+                jobs.append(day_jobs[position])
+                owners.append((day, position))
+
+    with report.stage('extract', total=len(jobs)):
+        # A day without letters still gets its (empty) spreadsheet, like a run by hand would
+        for day in days:
+            if not day.jobs:
+                day.write(report, started)
+
+        for i, (row, seconds, counts) in imap_unordered(extract_record, jobs, workers, keep_going=True, timed=True):
+            day, position = owners[i]
+            failed = isinstance(row, JobFailed)
+            report.file_done(jobs[i][0], seconds, failed, counts)
+            day.results[position] = (row, seconds, counts)
+            day.failed += failed
+            day.pending -= 1
+            if day.pending == 0:
+                day.write(report, started)
+
+    print_summary(days, time.perf_counter() - started, workers)
+    report.save()
+    return days
+
+
+def print_summary(days, seconds, workers):
+    letters = sum(len(day.jobs) for day in days)
+    failed = sum(day.failed for day in days)
+    rate = letters / seconds if seconds > 0 else 0.0
+    print(f'Backfilled {len(days)} date folders, {letters} letters ({failed} failed) in {seconds:.1f}s: '
+          f'{rate:.2f} letters/s with {workers} workers')
+    for day in days:
+        print(f'  {day.name:>5}  {len(day.folders):4} folders  {len(day.jobs):6} letters  '
+              f'{day.failed:4} failed  done after {day.done_after:.1f}s')
+
+
+def parse_date(value):
+    # YYYY-MM-DD, or M.D for the latest such day that isn't after today
+    if DATE_FOLDER_PATTERN.match(value):
+        return folder_date(value)
+    return datetime.date.fromisoformat(value)
+
+
+def main(main_directory, start=None, end=None, date_folders=(), workers=None):
+    # Backfill the named date folders, or else every date folder from start to end (end
+    # defaults to today)
+    date_folders = [(name, folder_date(name)) for name in date_folders]
+    if not date_folders and start is not None:
+        date_folders = folders_in_range(main_directory, start, end or datetime.date.today())
+    if not date_folders:
+        print('No date folders to backfill')
+        return []
+    use_directory(main_directory)
+    report = RunReport('backfill', os.path.join(main_directory, 'backfill_report.json'),
+                       os.path.join(main_directory, 'backfill_progress.jsonl'))
+    return backfill(main_directory, date_folders, workers, report)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], date_folders=sys.argv[2:])
@@ -0,0 +1,148 @@
+import os
+import re
+import sys
+import time
+
+from parallel import imap_ordered
+from inventory import scan_folder, scan_order_folders
+from trying import MRN_PATTERN, parse_pages, read_pages
+
+
+# The fields trying.parse_pages returns, in its order
+PARSED_FIELDS = ('First Name', 'Last Name', 'Address Line', 'Address Line 2', 'City', 'State',
+                 'Prefix of MRN', 'Medical Record Number')
+
+# Lines 3, 4 and 5 of a letter, the ones parse_pages takes the name, address and city from
+FIELD_LINES_PATTERN = re.compile(r'^[^\n]*\n[^\n]*\n([^\n]*)\n([^\n]*)\n([^\n]*)')
+
+# parse_pages' Address Line 2 regex, with what comes before it as a group of its own
+ADDRESS_LINE_2_PATTERN = re.compile(r'^(?P<before>.*?)(?P<unit>\b(?:UNIT|unit|APT|Apt|Apt\.)\s.{1,7})')
+
+# Same keywords, same order as parse_pages
+STOP_KEYWORDS = ['Medical', 'COMPRADOR', 'Comprador', '醫', 'Health', 'Me', 'He', 'Co']
+STOP_PATTERN = re.compile('(?:' + '|'.join(map(re.escape, STOP_KEYWORDS)) + ').*', flags=re.DOTALL)
+
+
+def parse_texts(page_lists):
+    # The parse_pages fields of many letters at once, with pandas string operations over whole
+    # columns instead of Python string handling per letter. page_lists holds the page texts of
+    # each letter. Returns one row per letter; a letter parse_pages would raise on (fewer than
+    # five lines, a one-word name) gets a row of None.
+    import pandas as pd  # Loaded on first use, the pipelines themselves don't need it
+
+    if not page_lists:
+        return pd.DataFrame(columns=PARSED_FIELDS)
+    texts = pd.Series([''.join(pages) for pages in page_lists], dtype=object)
+
+    # Lines 2-4 (name, address, city) in one regex pass, NaN where the text has fewer than 5 lines
+    lines = texts.str.extract(FIELD_LINES_PATTERN)
+    lines.columns = [2, 3, 4]
+    ok = lines[4].notna()
+
+    # Name on line 3: the third word is the last name when the second is a middle initial
+    names = lines[2].where(ok, '').str.split(n=3, expand=True).reindex(columns=range(3))
+    ok &= names[1].notna()
+    result = pd.DataFrame(index=texts.index, columns=PARSED_FIELDS, dtype=object)
+    result['First Name'] = names[0]
+    result['Last Name'] = names[2].where(names[2].notna() & (names[1].str.len() == 1), names[1])
+
+    # Address on line 4. Address Line 2 is cut at the first stop keyword (in list order) it
+    # holds, only the few letters with a unit go through that loop.
+    address = lines[3].where(ok, '').str.strip()
+    unit = address.str.extract(ADDRESS_LINE_2_PATTERN)
+    has_unit = unit['unit'].notna()
+    address_2 = unit['unit'][has_unit]
+    cut = pd.Series(False, index=address_2.index)
+    for keyword in STOP_KEYWORDS:
+        found = ~cut & address_2.str.contains(keyword, regex=False)
+        address_2 = address_2.mask(found, address_2.str.split(keyword, n=1, regex=False).str[0].str.strip())
+        cut |= found
+    result['Address Line 2'] = address_2.reindex(texts.index, fill_value='')
+
+    # Address Line 1 is cut at every stop keyword in turn. No keyword ends with the start of
+    # another, so that comes down to one cut at the earliest keyword of any kind.
+    address = address.mask(has_unit, unit['before'].str.strip())
+    result['Address Line'] = address.str.replace(STOP_PATTERN, '', regex=True).str.strip()
+
+    # City and State from line 5 when it has exactly one comma
+    city_line = lines[4].where(ok, '')
+    one_comma = city_line.str.count(',') == 1
+    city_parts = city_line.str.split(',', n=1, expand=True).reindex(columns=range(2))
+    result['City'] = city_parts[0].str.strip().where(one_comma, '')
+    result['State'] = city_parts[1].fillna('').str.strip().str.split(' ', n=1).str[0].where(one_comma, '')
+
+    # First MRN match anywhere in the text, NN-NNNNNN... or a labelled number
+    mrn = texts.str.extract(MRN_PATTERN)
+    dashed = mrn[0].notna() & mrn[1].notna()
+    result['Prefix of MRN'] = mrn[0].where(dashed, '')
+    result['Medical Record Number'] = mrn[1].where(dashed, mrn[2].fillna(''))
+
+    result.loc[~ok] = None
+    return result
+
+
+def compare_parsers(page_lists, parse=parse_pages):
+    # Where the batch parser and parse() on each letter disagree, as (letter index, field,
+    # batch value, per-letter value). field is None when only one of them failed on the letter.
+    batch = parse_texts(page_lists)
+    differences = []
+    for i, pages in enumerate(page_lists):
+        try:
+            info = parse(pages)
+        except Exception:
+            info = None
+        row = batch.iloc[i]
+        failed = row.isna().all()
+        if info is None or failed:
+            if not (info is None and failed):
+                differences.append((i, None, None if failed else 'parsed', None if info is None else 'parsed'))
+            continue
+        for field in PARSED_FIELDS:
+            if row[field] != info[field]:
+                differences.append((i, field, row[field], info[field]))
+    return differences
+
+
+def letter_paths(folder_path):
+    # The PDFs of a date folder (one order folder after another) or of a single order folder
+    folders = scan_order_folders(folder_path)
+    if not folders:
+        folders = {'': scan_folder(folder_path)}
+    return [os.path.join(folder_path, folder_name, pdf_file)
+            for folder_name in sorted(folders) for pdf_file in sorted(folders[folder_name].pdfs)]
+
+
+def parse_folder(folder_path, workers=None):
+    # Page texts across the worker pool (from the PDF cache where they are in it), then all the
+    # letters of the folder parsed in one batch. Returns the PDF paths and their parsed rows.
+    pdf_paths = letter_paths(folder_path)
+    page_lists = list(imap_ordered(read_pages, [(pdf_path,) for pdf_path in pdf_paths], workers))
+    return pdf_paths, parse_texts(page_lists)
+
+
+def main(folder_path, workers=None):
+    # Check the batch parser against parse_pages on the letters of a folder, and time both
+    pdf_paths = letter_paths(folder_path)
+    page_lists = list(imap_ordered(read_pages, [(pdf_path,) for pdf_path in pdf_paths], workers))
+
+    start = time.perf_counter()
+    parse_texts(page_lists)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for pages in page_lists:
+        try:
+            parse_pages(pages)
+        except Exception:
+            pass
+    single_seconds = time.perf_counter() - start
+
+    differences = compare_parsers(page_lists)
+    print(f'{len(pdf_paths)} letters, batch {batch_seconds:.3f}s, one by one {single_seconds:.3f}s')
+    for i, field, batch_value, single_value in differences:
+        print(f'DIFFERENT {pdf_paths[i]} {field}: batch {batch_value!r}, parse_pages {single_value!r}')
+    return differences
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(sys.argv[1]) else 0)
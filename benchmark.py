@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import datetime
+
+# Measure the real extraction cost, not the on-disk cache (use --cache to time warm reruns)
+if '--cache' not in sys.argv:
+    os.environ['PDF_CACHE'] = 'off'
+
+import trying
+import folder_excel
+import addresses
+import status_feedback
+import batch_parse
+import pdf_cache
+from inventory import Inventory, scan_order_folders, order_xml_path
+from sheet_writer import SheetWriter, EXTRACTED_COLUMNS
+
+
+FIRST_NAMES = ['John', 'Mary', 'Ana', 'Wei', 'Luis', 'Sara', 'Ahmed', 'Linh', 'Maria', 'David']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Lopez', 'Nguyen', 'Kim', 'Patel', 'Johnson', 'Rivera']
+STREETS = ['Main St', 'Oak Ave', 'Pine Rd', 'Elm St', 'Broadway', 'Mission Blvd', 'Market St']
+CITIES = [('Oakland', 'CA', '94612'), ('Honolulu', 'HI', '96813'), ('Denver', 'CO', '80202'), ('Atlanta', 'GA', '30303')]
+PLAN_LINES = ['Kaiser Permanente', 'Member Services']
+LETTER_BODY = 'This letter explains a change to your coverage and the benefits available to you under your plan.'
+SKUS = ['AIA_0300', 'AIB_0200']
+
+
+def pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(pages):
+    # Smallest PDF pdfplumber reads the way it reads our letters: one Helvetica text block per page,
+    # one text line per entry of each page
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    }
+    kids = []
+    number = 4
+    for lines in pages:
+        content = ['BT /F1 11 Tf 72 740 Td 14 TL'] + [f'({pdf_escape(line)}) Tj T*' for line in lines] + ['ET']
+        stream = '\n'.join(content).encode('latin-1')
+        objects[number] = (b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                           b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (number + 1))
+        objects[number + 1] = b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream'
+        kids.append(number)
+        number += 2
+    objects[2] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids))
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = {}
+    for object_number in sorted(objects):
+        offsets[object_number] = len(out)
+        out += b'%d 0 obj\n' % object_number + objects[object_number] + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % number
+    for object_number in range(1, number):
+        out += b'%010d 00000 n \n' % offsets[object_number]
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (number, xref)
+    return bytes(out)
+
+
+def make_recipient(rng, index):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    middle = f' {rng.choice("ABCDEFGHJK")}' if rng.random() < 0.3 else ''
+    street = f'{rng.randint(10, 9999)} {rng.choice(STREETS)}'
+    unit = f' Apt {rng.randint(1, 400)}' if rng.random() < 0.3 else ''
+    city, state, zip_code = rng.choice(CITIES)
+    return {
+        'name': f'{first}{middle} {last}',
+        'street': street,
+        'unit': unit,
+        'city_line': f'{city}, {state} {zip_code}',
+        'mrn': f'{rng.randint(10, 99)}-{rng.randint(1000000, 99999999)}',
+        'sku': rng.choice(SKUS),
+        'docid': f'DOC{index:05d}',
+        'region': rng.choice(['NCA', 'SCA', 'HI', 'CO', 'GA']),
+    }
+
+
+def make_letter(recipient, body_pages):
+    # Name on line 3, street on line 4 and City, ST ZIP on line 5: the layout trying.py and
+    # folder_excel.py index into, and that addresses.py finds through its city pattern
+    first_page = PLAN_LINES + [
+        recipient['name'],
+        f'{recipient["street"]}{recipient["unit"]}',
+        recipient['city_line'],
+        f'MRN {recipient["mrn"]}',
+    ] + [LETTER_BODY] * 20
+    return make_pdf([first_page] + [[LETTER_BODY] * 40 for _ in range(body_pages)])
+
+
+def make_order_xml(order_id, recipients):
+    parts = [f'<order><details><orderId>{order_id}</orderId><vendorIndicator>N</vendorIndicator></details><recipients>']
+    for recipient in recipients:
+        parts.append(f'<recipient><mailadr1>{recipient["street"]}{recipient["unit"]}</mailadr1>'
+                     f'<sku>{recipient["sku"]}</sku><DOCID>{recipient["docid"]}</DOCID>'
+                     f'<region_cd>{recipient["region"]}</region_cd></recipient>')
+    parts.append('</recipients></order>')
+    return ''.join(parts)
+
+
+def generate_batch(root, orders=20, letters=5, body_pages=1, seed=1):
+    # Inbound directory as the client delivers it: NNNNNNNN_k.zip parts holding the order XML and
+    # letter PDFs, an empty daily_status.tsv, and a status/ folder with 'done' zips for status_feedback
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    open(os.path.join(root, 'daily_status.tsv'), 'w').close()
+    status_dir = os.path.join(root, 'status')
+    os.makedirs(status_dir, exist_ok=True)
+
+    order_ids = []
+    for order in range(orders):
+        order_id = f'{10000000 + order * 7919 % 89999999:08d}'
+        order_ids.append(order_id)
+        recipients = [make_recipient(rng, order * 1000 + i) for i in range(rng.randint(1, letters * 2 - 1))]
+        members = [(f'order_{order_id}.xml', make_order_xml(order_id, recipients).encode())]
+        members += [(f'letter_{i:03d}.pdf', make_letter(recipient, rng.randint(0, body_pages)))
+                    for i, recipient in enumerate(recipients)]
+
+        # Large orders arrive split over two zips with the same prefix
+        parts = [members] if len(members) < 4 else [members[:len(members) // 2], members[len(members) // 2:]]
+        if len(parts) == 2 and not any(name.endswith('.xml') for name, _ in parts[1]):
+            parts[1].insert(0, members[0])
+        for part, part_members in enumerate(parts, start=1):
+            with zipfile.ZipFile(os.path.join(root, f'{order_id}_{part}.zip'), 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+                for name, data in part_members:
+                    zip_ref.writestr(name, data)
+
+    # Status feedback: the status of ten orders at a time, delivered as two 'done' zip parts
+    # (combine_and_move_zips merges the parts that share an 8-digit prefix)
+    for start in range(0, len(order_ids), 10):
+        group = order_ids[start:start + 10]
+        for part in (1, 2):
+            zip_path = os.path.join(status_dir, f'{group[0]}_{part}_done.zip')
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+                for order_id in group[part - 1::2]:
+                    zip_ref.writestr(f'status_{order_id}.xml', f'<status><details><orderId>{order_id}</orderId>'
+                                                               f'<vendorIndicator>N</vendorIndicator></details></status>')
+                    zip_ref.writestr(f'status_{order_id}.DTL', f'{order_id}\tDONE\n')
+    return order_ids
+
+
+def timed(results, name, func, *args, items=None, **kwargs):
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    if items is None and isinstance(value, list):
+        items = len(value)
+    results[name] = {'seconds': seconds, 'items': items}
+    if items:
+        results[name]['ms_per_item'] = seconds * 1000 / items
+    return value
+
+
+def run_once(batch_dir, work_dir, workers):
+    results = {}
+    main_directory = os.path.join(work_dir, 'main')
+    shutil.copytree(batch_dir, main_directory)
+    status_dir = os.path.join(main_directory, 'status')
+    shutil.move(status_dir, os.path.join(work_dir, 'status'))
+    status_dir = os.path.join(work_dir, 'status')
+
+    # Pipeline stages, in the order trying.main runs them
+    inventory = timed(results, 'stage.inventory', Inventory, main_directory)
+    zips = len(inventory.zips)
+    timed(results, 'stage.copy_zips_to_complete', trying.copy_zips_to_complete, main_directory, inventory=inventory, items=zips)
+    timed(results, 'stage.extract_and_combine_zips', trying.extract_and_combine_zips, main_directory, inventory=inventory, items=zips)
+    orders = len(inventory.order_folders())
+    timed(results, 'stage.create_fulfillment_xml', trying.create_fulfillment_xml, main_directory, inventory=inventory, items=orders)
+    timed(results, 'stage.update_daily_status', trying.update_daily_status, main_directory, items=orders)
+    timed(results, 'stage.separate_pdf_files', trying.separate_pdf_files, main_directory, inventory=inventory, items=orders)
+    folders = len(inventory.all_folders())
+    timed(results, 'stage.move_folders_to_date_directory', trying.move_folders_to_date_directory, main_directory, inventory=inventory, items=folders)
+
+    now = datetime.datetime.now()
+    date_folder_path = os.path.join(main_directory, f'{now.month}.{now.day}')
+    pdf_jobs = []
+    for folder_name, contents in sorted(scan_order_folders(date_folder_path).items()):
+        folder_path = os.path.join(date_folder_path, folder_name)
+        xml_path = order_xml_path(folder_path, contents)
+        pdf_jobs.extend((os.path.join(folder_path, f), xml_path) for f in sorted(contents.pdfs) if xml_path)
+    timed(results, 'stage.process_data_in_date_folder', trying.process_data_in_date_folder, date_folder_path, workers=workers, items=len(pdf_jobs))
+
+    # Each extractor on its own, single process, so the numbers are per-file costs
+    pdf_paths = [pdf_path for pdf_path, _ in pdf_jobs]
+    timed(results, 'extract.trying.read_pdf', lambda: [trying.read_pdf(p) for p in pdf_paths])
+    timed(results, 'extract.folder_excel.read_pdf', lambda: [folder_excel.read_pdf(p) for p in pdf_paths])
+    timed(results, 'extract.addresses.read_pdf', lambda: [addresses.read_pdf(p) for p in pdf_paths])
+    infos = [trying.read_pdf(p) for p in pdf_paths]
+    timed(results, 'extract.trying.read_xml', lambda: [trying.read_xml(xml_path, info['Address Line'])
+                                                       for (_, xml_path), info in zip(pdf_jobs, infos)])
+
+    # Field parsing alone on the same page texts: letter by letter, and all in one batch
+    page_lists = [trying.read_pages(p) for p in pdf_paths]
+    timed(results, 'parse.trying.parse_pages', lambda: [trying.parse_pages(pages) for pages in page_lists])
+    timed(results, 'parse.batch_parse.parse_texts', batch_parse.parse_texts, page_lists, items=len(page_lists))
+
+    # Spreadsheet export alone, with a fixed number of rows
+    rows = [{column: f'{column} {i}' for column in EXTRACTED_COLUMNS} for i in range(5000)]
+    def export():
+        with SheetWriter(os.path.join(work_dir, 'export.xlsx'), EXTRACTED_COLUMNS) as writer:
+            writer.write_all(rows)
+    timed(results, 'export.extracted_xlsx', export, items=len(rows))
+
+    # Status feedback over the 'done' zips
+    done_zips = len([f for f in os.listdir(status_dir) if f.endswith('.zip')])
+    timed(results, 'stage.status_feedback.process_zip_files', status_feedback.process_zip_files, status_dir, items=done_zips)
+    return results
+
+
+def run_benchmark(orders, letters, body_pages, seed, repeat, workers):
+    with tempfile.TemporaryDirectory(prefix='kp_bench_') as temp_dir:
+        batch_dir = os.path.join(temp_dir, 'batch')
+        generate_batch(batch_dir, orders=orders, letters=letters, body_pages=body_pages, seed=seed)
+        pdf_cache.use_directory(temp_dir)  # With --cache, the repeats after the first read it warm
+
+        # Keep the best of the repeats, it is the least disturbed by whatever else the box is doing
+        best = {}
+        for attempt in range(repeat):
+            work_dir = os.path.join(temp_dir, f'run{attempt}')
+            os.makedirs(work_dir)
+            for name, result in run_once(batch_dir, work_dir, workers).items():
+                if name not in best or result['seconds'] < best[name]['seconds']:
+                    best[name] = result
+            shutil.rmtree(work_dir)
+    return best
+
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    # Print new vs baseline per metric, return the metrics that got slower by more than tolerance.
+    # Differences under min_seconds are timer noise on the millisecond stages, not regressions.
+    regressions = []
+    print(f'{"metric":45} {"baseline":>10} {"now":>10} {"change":>8}')
+    for name in sorted(set(results) | set(baseline)):
+        if name not in results or name not in baseline:
+            print(f'{name:45} {"-" if name not in baseline else baseline[name]["seconds"]:>10} '
+                  f'{"-" if name not in results else results[name]["seconds"]:>10}')
+            continue
+        old, new = baseline[name]['seconds'], results[name]['seconds']
+        change = (new - old) / old if old else 0.0
+        flag = ''
+        if change > tolerance and new - old >= min_seconds:
+            regressions.append(name)
+            flag = '  SLOWER'
+        print(f'{name:45} {old:10.3f} {new:10.3f} {change:+8.1%}{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the pipeline stages and extractors on a synthetic order batch.')
+    parser.add_argument('--orders', type=int, default=20, help='orders in the batch')
+    parser.add_argument('--letters', type=int, default=5, help='average letters per order')
+    parser.add_argument('--body-pages', type=int, default=1, help='most extra pages per letter')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per metric, the fastest one is kept')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes for process_data_in_date_folder')
+    parser.add_argument('--cache', action='store_true', help='leave the PDF cache on (times warm reruns)')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the results')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown before a metric counts as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='ignore slowdowns smaller than this many seconds')
+    parser.add_argument('--generate', metavar='DIR', help='only write the synthetic batch to DIR and exit')
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        generate_batch(args.generate, orders=args.orders, letters=args.letters, body_pages=args.body_pages, seed=args.seed)
+        print(f'Synthetic batch written to {args.generate}')
+        return 0
+
+    results = run_benchmark(args.orders, args.letters, args.body_pages, args.seed, args.repeat, args.workers)
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'settings': {'orders': args.orders, 'letters': args.letters, 'body_pages': args.body_pages,
+                     'seed': args.seed, 'repeat': args.repeat, 'workers': args.workers, 'cache': args.cache},
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != report['settings']:
+            print('Warning: the baseline was recorded with different settings')
+        regressions = compare(results, baseline['results'], args.tolerance, args.min_seconds)
+        if regressions:
+            print(f'{len(regressions)} metric(s) slower than the baseline by more than {args.tolerance:.0%}')
+            return 1
+    else:
+        for name, result in sorted(results.items()):
+            print(f'{name:45} {result["seconds"]:10.3f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import os
+import datetime
+
+
+# Business days between receiving an order and shipping it
+SHIP_BUSINESS_DAYS = 5
+
+# Closed days on top of the federal holidays: a file with one YYYY-MM-DD per line ('#' starts a
+# comment). SHIP_FEDERAL_HOLIDAYS=off leaves only the days from that file.
+HOLIDAYS_FILE = os.environ.get('SHIP_HOLIDAYS_FILE')
+FEDERAL_HOLIDAYS = os.environ.get('SHIP_FEDERAL_HOLIDAYS', 'on').lower() != 'off'
+
+
+def nth_weekday(year, month, weekday, n):
+    # The nth given weekday (0=Monday) of a month, n=-1 for the last one
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    following = datetime.date(year + month // 12, month % 12 + 1, 1)
+    last = following - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    # A holiday on a Saturday is observed the Friday before, on a Sunday the Monday after
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+
+def federal_holidays(year):
+    holidays = [
+        observed(datetime.date(year, 1, 1)),  # New Year's Day
+        nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        observed(datetime.date(year, 7, 4)),  # Independence Day
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 10, 0, 2),  # Columbus Day
+        observed(datetime.date(year, 11, 11)),  # Veterans Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving Day
+        observed(datetime.date(year, 12, 25)),  # Christmas Day
+    ]
+    if year >= 2021:
+        holidays.append(observed(datetime.date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def read_holidays_file(path):
+    days = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                days.append(datetime.date.fromisoformat(line))
+    return days
+
+
+class BusinessCalendar:
+    # Weekdays minus holidays, for whole batches of dates at once with numpy's busday functions
+
+    def __init__(self, holidays=(), federal=FEDERAL_HOLIDAYS):
+        self.extra = sorted(set(holidays))
+        self.federal = federal
+        self.years = None
+        self.busdaycal = None
+
+    def calendar_for(self, years):
+        # numpy wants the holidays up front, build the calendar over the years the batch can reach
+        import numpy as np  # Loaded on first use, the pipelines that never ship don't need it
+
+        first, last = min(years) - 1, max(years) + 1
+        if self.years is None or first < self.years[0] or last > self.years[-1]:
+            if self.years is not None:
+                first, last = min(first, self.years[0]), max(last, self.years[-1])
+            years = range(first, last + 1)
+            holidays = list(self.extra)
+            if self.federal:
+                holidays += [day for year in years for day in federal_holidays(year)]
+            self.busdaycal = np.busdaycalendar(holidays=np.array(holidays, dtype='datetime64[D]'))
+            self.years = years
+        return self.busdaycal
+
+    def add_days(self, dates, days):
+        # The date `days` business days after each date (the first business day after a date
+        # counts as 1, whether or not the date itself is one). Returns datetime.date objects.
+        import numpy as np
+
+        dates = [date.date() if isinstance(date, datetime.datetime) else date for date in dates]
+        if not dates:
+            return []
+        busdaycal = self.calendar_for({date.year for date in dates})
+        # Rolling a closed day back to the business day before it and counting from there gives
+        # the same day as stepping forward one day at a time and skipping the closed ones
+        shifted = np.busday_offset(np.array(dates, dtype='datetime64[D]'), days, roll='backward', busdaycal=busdaycal)
+        return shifted.tolist()
+
+
+_calendar = None
+
+
+def get_calendar():
+    # One calendar per process, with the holidays file read once
+    global _calendar
+    if _calendar is None:
+        _calendar = BusinessCalendar(read_holidays_file(HOLIDAYS_FILE) if HOLIDAYS_FILE else ())
+    return _calendar
+
+
+def ship_dates(received_dates, days=SHIP_BUSINESS_DAYS):
+    # Ship dates of a whole batch of orders in one call
+    return get_calendar().add_days(received_dates, days)
@@ -0,0 +1,148 @@
+import os
+import sys
+import argparse
+
+
+# Each command imports its module only when it runs, so `cli.py status` never loads
+# pdfplumber or openpyxl and no command loads tkinter
+
+def run_status(args):
+    import status_feedback
+    status_feedback.process_zip_files(args.directory, stream=not args.legacy, workers=args.workers)
+
+
+def run_split(args):
+    import trying
+    trying.main(workers=args.workers, main_directory=os.path.abspath(args.directory))
+
+
+def run_extract(args):
+    import folder_excel
+    folder_excel.main(workers=args.workers, folder_path=args.folder, output_path=args.output)
+
+
+def run_addresses(args):
+    import addresses
+    addresses.main(workers=args.workers, folder_path=args.folder, spreadsheet_filename=args.output)
+
+
+def run_watch(args):
+    from watcher import FolderWatcher
+    FolderWatcher(os.path.abspath(args.directory), settle=args.settle, interval=args.interval, queue_size=args.queue_size,
+                  threads=args.threads, workers=args.workers, polling=args.poll).run(once=args.once)
+
+
+def run_backfill(args):
+    import backfill
+    if not args.folders and args.start is None:
+        raise SystemExit('backfill needs date folders or --from')
+    directory = os.path.abspath(args.directory)
+    for name in args.folders:
+        if not os.path.isdir(os.path.join(directory, name)):
+            raise SystemExit(f'{name} is not a folder in {directory}')
+        try:
+            backfill.folder_date(name)
+        except ValueError:
+            raise SystemExit(f'{name} is not an M.D date folder')
+    backfill.main(directory, start=args.start, end=args.end, date_folders=args.folders, workers=args.workers)
+
+
+def run_ledger(args):
+    from order_ledger import open_ledger
+    ledger = open_ledger(args.directory, os.path.join(args.directory, 'daily_status.tsv'))
+    try:
+        count = ledger.export_tsv(args.output, status=args.status, received_from=args.received_from,
+                                  received_to=args.received_to)
+    finally:
+        ledger.close()
+    print(f'{count} orders written to {args.output}')
+
+
+def run_clear_cache(args):
+    from pdf_cache import clear_cache
+    from layouts import clear_layouts
+    path = clear_cache(args.directory)
+    print(f'Emptied the PDF cache at {path}' if path else f'No PDF cache in {args.directory}')
+    path = clear_layouts(args.directory)
+    print(f'Removed the learned layouts at {path}' if path else f'No learned layouts in {args.directory}')
+
+
+def existing_directory(path):
+    if not os.path.isdir(path):
+        raise argparse.ArgumentTypeError(f'{path} is not a directory')
+    return path
+
+
+def date_argument(value):
+    from backfill import parse_date
+    try:
+        return parse_date(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value} is not a YYYY-MM-DD or M.D date')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Order processing without the folder dialogs, e.g. for cron.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    status = commands.add_parser('status', help="turn the 'done' zips in a directory into fulfillment XMLs and daily_status.tsv")
+    status.add_argument('directory', type=existing_directory)
+    status.add_argument('--legacy', action='store_true', help='extract the zips to disk like the old version did')
+    status.set_defaults(func=run_status)
+
+    split = commands.add_parser('split', help='run the daily pipeline (what trying.py does) on a main directory')
+    split.add_argument('directory', type=existing_directory)
+    split.set_defaults(func=run_split)
+
+    extract = commands.add_parser('extract', help='write extracted.xlsx for a date folder or a single order folder')
+    extract.add_argument('folder', type=existing_directory)
+    extract.add_argument('-o', '--output', default='extracted.xlsx')
+    extract.set_defaults(func=run_extract)
+
+    addresses = commands.add_parser('addresses', help='write addresses.xlsx with one letter per order folder')
+    addresses.add_argument('folder', type=existing_directory)
+    addresses.add_argument('-o', '--output', default='addresses.xlsx')
+    addresses.set_defaults(func=run_addresses)
+
+    watch = commands.add_parser('watch', help='process zips as they land in a main directory, until stopped')
+    watch.add_argument('directory', type=existing_directory)
+    watch.add_argument('--settle', type=float, default=5.0, help='seconds a zip must stay unchanged before it is picked up')
+    watch.add_argument('--interval', type=float, default=2.0, help='seconds between rescans of the directory')
+    watch.add_argument('--queue-size', type=int, default=16, help='orders waiting to be processed at most')
+    watch.add_argument('--threads', type=int, default=2, help='orders processed at the same time')
+    watch.add_argument('--poll', action='store_true', help='rescan on a timer only, without inotify')
+    watch.add_argument('--once', action='store_true', help='stop once everything delivered so far is processed')
+    watch.set_defaults(func=run_watch)
+
+    backfill = commands.add_parser('backfill', help='regenerate extracted.xlsx for several date folders through one worker pool')
+    backfill.add_argument('directory', type=existing_directory)
+    backfill.add_argument('folders', nargs='*', help='date folders (M.D) to regenerate, instead of --from/--to')
+    backfill.add_argument('--from', dest='start', type=date_argument, default=None, help='first day, YYYY-MM-DD or M.D')
+    backfill.add_argument('--to', dest='end', type=date_argument, default=None, help='last day (default: today)')
+    backfill.set_defaults(func=run_backfill)
+
+    ledger = commands.add_parser('ledger', help="export the latest row of every order in a directory's order ledger as a TSV")
+    ledger.add_argument('directory', type=existing_directory)
+    ledger.add_argument('-o', '--output', default='daily_status_export.tsv')
+    ledger.add_argument('--status', default=None, help='only orders with this status')
+    ledger.add_argument('--received-from', default=None, help='only orders received on or after this YYYY-MM-DD')
+    ledger.add_argument('--received-to', default=None, help='only orders received on or before this YYYY-MM-DD')
+    ledger.set_defaults(func=run_ledger)
+
+    clear_cache = commands.add_parser('clear-cache', help='empty the cache of letter text and the learned layouts kept in a directory for reruns')
+    clear_cache.add_argument('directory', type=existing_directory)
+    clear_cache.set_defaults(func=run_clear_cache)
+
+    for command in (status, split, extract, addresses, watch, backfill):
+        command.add_argument('--workers', type=int, default=None, help='worker processes / threads (default: PDF_WORKERS or the CPU count)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import os
+from xml.sax.saxutils import escape
+
+
+# The elements of a fulfillment XML, in order. A fulfillment row (the daily_status.tsv columns)
+# holds their texts in the same order.
+FULFILLMENT_FIELDS = ('VendorID', 'OrderID', 'Status', 'ReceivedDate', 'ShipDate',
+                      'ShippingMethod', 'ShippingCost', 'Comments', 'PackagesCount', 'Tracking')
+
+
+def render_fulfillment(row):
+    # The bytes ElementTree.write gave for the <fulfillment> element built from these texts:
+    # us-ascii with character references, no declaration, empty elements as <Tag />
+    parts = ['<fulfillment>']
+    for tag, text in zip(FULFILLMENT_FIELDS, row):
+        if text:
+            parts.append(f'<{tag}>{escape(text)}</{tag}>')
+        else:
+            parts.append(f'<{tag} />')
+    parts.append('</fulfillment>')
+    return ''.join(parts).encode('ascii', 'xmlcharrefreplace')
+
+
+def fulfillment_path(xml_folder, order_id):
+    return os.path.join(xml_folder, f'order_{order_id}.xml')
+
+
+def write_fulfillment_batch(xml_folder, rows):
+    # One order_<OrderID>.xml per row, each rendered in memory and written with a single write
+    if not rows:
+        return
+    os.makedirs(xml_folder, exist_ok=True)
+    for row in rows:
+        with open(fulfillment_path(xml_folder, row[1]), 'wb') as f:
+            f.write(render_fulfillment(row))
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import heapq
+import datetime
+import cProfile
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: CPU time falls back to this process only and peak RSS is not reported
+
+
+# How many of the slowest PDFs the report keeps
+SLOWEST_FILES = int(os.environ.get('RUN_REPORT_SLOWEST', '20'))
+
+# RUN_PROFILE=<folder> writes a cProfile dump per stage into that folder (main process only,
+# the worker processes are not profiled)
+PROFILE_DIR = os.environ.get('RUN_PROFILE')
+
+# Progress lines are written at most this often while files are being processed
+PROGRESS_INTERVAL = 1.0
+
+
+# Events counted inside a job (e.g. in a worker process), handed back with the job's result
+_events = {}
+
+
+def count_event(name, amount=1):
+    _events[name] = _events.get(name, 0) + amount
+
+
+def take_counts():
+    # The events counted since the last call, and start over
+    global _events
+    counts, _events = _events, {}
+    return counts
+
+
+def cpu_seconds():
+    # User + system time of this process and of the child processes that have finished
+    # (the worker pool is shut down at the end of every stage that uses one)
+    if resource is None:
+        return time.process_time()
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def peak_rss_mb():
+    # Highest resident set size so far of this process or any single finished child
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class RunReport:
+    # Timings of one run: wall time, CPU time and peak RSS per stage, latency per file, counters
+    # and failures. Written as one JSON report at the end, with a JSONL progress stream
+    # (files/sec and ETA of the running stage) appended while the run goes.
+
+    def __init__(self, name, report_path=None, progress_path=None, slowest=SLOWEST_FILES, profile_dir=PROFILE_DIR):
+        self.name = name
+        self.report_path = report_path
+        self.progress_path = progress_path
+        self.slowest = slowest
+        self.profile_dir = profile_dir
+
+        self.started = time.time()
+        self.cpu_started = cpu_seconds()
+        self.stages = []
+        self.counters = {}
+        self.failures = []
+        self.slowest_files = []  # Heap of (seconds, path), the fastest of the kept files on top
+        self.file_seconds = 0.0
+        self.current = None
+        self.progress_at = 0.0
+
+    @contextmanager
+    def stage(self, name, total=None):
+        # Measure everything that runs inside the with block as one stage
+        record = {'name': name}
+        self.current = {'name': name, 'total': total, 'done': 0, 'started': time.time()}
+        profiler = None
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        wall_start = time.perf_counter()
+        cpu_start = cpu_seconds()
+        try:
+            yield self
+        except BaseException as e:
+            record['error'] = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - wall_start, 3)
+            record['cpu_seconds'] = round(cpu_seconds() - cpu_start, 3)
+            record['peak_rss_mb'] = peak_rss_mb()
+            if profiler is not None:
+                profiler.disable()
+                record['profile'] = os.path.join(self.profile_dir, f'{self.name}.{name}.prof')
+                profiler.dump_stats(record['profile'])
+            if self.current['done']:
+                record['files'] = self.current['done']
+            self.stages.append(record)
+            self.write_progress('stage_done', force=True)
+            self.current = None
+
+    def set_total(self, total):
+        # Number of files the running stage will go through, used for the ETA
+        if self.current is not None:
+            self.current['total'] = total
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def file_done(self, path, seconds, failed=False, counts=None):
+        self.count('files')
+        for name, amount in (counts or {}).items():
+            self.count(name, amount)
+        if failed:
+            self.count('files_failed')
+        self.file_seconds += seconds
+        if len(self.slowest_files) < self.slowest:
+            heapq.heappush(self.slowest_files, (seconds, path))
+        elif self.slowest and seconds > self.slowest_files[0][0]:
+            heapq.heapreplace(self.slowest_files, (seconds, path))
+        if self.current is not None:
+            self.current['done'] += 1
+        self.write_progress('files')
+
+    def failure(self, stage, item, error):
+        self.failures.append({'stage': stage, 'item': item, 'error': str(error)})
+        self.count('failures')
+
+    def write_progress(self, event, force=False):
+        if self.progress_path is None or self.current is None:
+            return
+        now = time.time()
+        if not force and now - self.progress_at < PROGRESS_INTERVAL:
+            return
+        self.progress_at = now
+
+        done, total = self.current['done'], self.current['total']
+        elapsed = now - self.current['started']
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'run': self.name,
+            'event': event,
+            'stage': self.current['name'],
+            'done': done,
+            'total': total,
+            'files_per_sec': round(rate, 2),
+            'eta_seconds': round((total - done) / rate, 1) if total and rate > 0 else None,
+        }
+        with open(self.progress_path, 'a') as f:
+            f.write(json.dumps(line) + '\n')
+
+    def as_dict(self):
+        files = self.counters.get('files', 0)
+        return {
+            'run': self.name,
+            'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'wall_seconds': round(time.time() - self.started, 3),
+            'cpu_seconds': round(cpu_seconds() - self.cpu_started, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': self.stages,
+            'counters': self.counters,
+            'mean_file_seconds': round(self.file_seconds / files, 4) if files else None,
+            'page_tiers': self.page_tiers(),
+            'slowest_files': [{'path': path, 'seconds': round(seconds, 4)}
+                              for seconds, path in sorted(self.slowest_files, reverse=True)],
+            'failures': self.failures,
+        }
+
+    def page_tiers(self):
+        # Share of the pages each extraction tier handled (pages.raw, pages.layout, pages.pdfplumber)
+        tiers = {name[len('pages.'):]: amount for name, amount in self.counters.items() if name.startswith('pages.')}
+        total = sum(tiers.values())
+        return {tier: round(amount / total, 3) for tier, amount in tiers.items()} if total else {}
+
+    def save(self, path=None):
+        path = path or self.report_path
+        if path is None:
+            return None
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,120 @@
+import os
+import re
+
+
+SPLIT_FOLDER = re.compile(r'\d{8}\.\d+')
+
+# A split folder can hold <name>.xml.ref instead of a copy of the order XML, naming the parent
+# folder's XML by a relative path
+XML_REF_SUFFIX = '.xml.ref'
+
+
+class FolderContents:
+    # PDFs, XMLs and XML pointers directly inside one order folder
+
+    def __init__(self, pdfs=(), xmls=(), xml_refs=()):
+        self.pdfs = set(pdfs)
+        self.xmls = set(xmls)
+        self.xml_refs = set(xml_refs)
+
+    def add(self, name):
+        if name.endswith('.pdf'):
+            self.pdfs.add(name)
+        elif name.endswith('.xml'):
+            self.xmls.add(name)
+        elif name.endswith(XML_REF_SUFFIX):
+            self.xml_refs.add(name)
+
+    def discard(self, name):
+        self.pdfs.discard(name)
+        self.xmls.discard(name)
+        self.xml_refs.discard(name)
+
+
+def order_xml_path(folder_path, contents):
+    # The order XML for the PDFs of a folder: its own first XML, else the one its first pointer
+    # names, None when it has neither
+    if contents.xmls:
+        return os.path.join(folder_path, sorted(contents.xmls)[0])
+    if contents.xml_refs:
+        with open(os.path.join(folder_path, sorted(contents.xml_refs)[0]), 'r') as f:
+            return os.path.normpath(os.path.join(folder_path, f.read().strip()))
+    return None
+
+
+def scan_folder(folder_path):
+    # One os.scandir pass over an order folder
+    contents = FolderContents()
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                contents.add(entry.name)
+    return contents
+
+
+def scan_order_folders(parent_path):
+    # Every subfolder of parent_path with its PDFs and XMLs, e.g. for a date folder
+    folders = {}
+    with os.scandir(parent_path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                folders[entry.name] = scan_folder(entry.path)
+    return folders
+
+
+class Inventory:
+    # Zips and order folders in the main directory, scanned once with os.scandir (which gets the
+    # file type from the directory listing instead of a stat per entry). The stages update it as
+    # they extract, split and move things, so nothing has to list the share again.
+
+    def __init__(self, main_directory):
+        self.main_directory = main_directory
+        self.zips = set()
+        self.folders = {}  # Order folder name (NNNNNNNN or NNNNNNNN.k) -> FolderContents
+
+        with os.scandir(main_directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.zip') and entry.is_file():
+                    self.zips.add(entry.name)
+                elif is_order_folder(entry.name) and entry.is_dir():
+                    self.folders[entry.name] = scan_folder(entry.path)
+
+    def zip_files(self):
+        return sorted(self.zips)
+
+    def order_folders(self):
+        # The original NNNNNNNN folders, not the NNNNNNNN.k ones split off them
+        return sorted(name for name in self.folders if name.isdigit())
+
+    def all_folders(self):
+        return sorted(self.folders)
+
+    def split_folders_of(self, folder_name):
+        return sorted(name for name in self.folders if name.startswith(f'{folder_name}.'))
+
+    def contents(self, folder_name):
+        return self.folders[folder_name]
+
+    def add_folder(self, folder_name):
+        return self.folders.setdefault(folder_name, FolderContents())
+
+    def add_extracted(self, folder_name, member_names):
+        # Record the members of a zip extracted into folder_name (only top-level files are listed)
+        contents = self.add_folder(folder_name)
+        for member in member_names:
+            if '/' not in member.rstrip('/'):
+                contents.add(member)
+
+    def move_file(self, src_folder, dst_folder, name):
+        self.folders[src_folder].discard(name)
+        self.add_folder(dst_folder).add(name)
+
+    def copy_file(self, dst_folder, name):
+        self.add_folder(dst_folder).add(name)
+
+    def remove_folder(self, folder_name):
+        return self.folders.pop(folder_name, None)
+
+
+def is_order_folder(name):
+    return name.isdigit() or SPLIT_FOLDER.match(name) is not None
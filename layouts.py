@@ -0,0 +1,217 @@
+import os
+import json
+import threading
+from functools import partial
+import pdf_cache
+from instrumentation import count_event
+
+
+# A template keeps the first line of a real letter, so learned layouts are kept in the run's
+# directory (set with pdf_cache.use_directory) like the PDF cache, unless PDF_LAYOUTS_PATH names
+# one file for every run. Without either nothing is learned. PDF_LAYOUTS=off reads every PDF
+# the full way.
+LAYOUTS_NAME = 'pdf_layouts.json'
+LAYOUTS_PATH = os.environ.get('PDF_LAYOUTS_PATH')
+LAYOUTS_MODE = os.environ.get('PDF_LAYOUTS', 'on').lower()
+
+# Templates kept per reader and page size, the least used go first
+MAX_TEMPLATES = 64
+
+# Templates tried per page before giving up and reading the page the full way
+MAX_CANDIDATES = 16
+
+# Points added around a learned box, text positions move by fractions of a point between letters
+PAD = 1.0
+
+
+def page_size(page):
+    return f'{round(page.width)}x{round(page.height)}'
+
+
+def clip(page, bbox):
+    x0, top, x1, bottom = bbox
+    return (max(x0, page.bbox[0]), max(top, page.bbox[1]), min(x1, page.bbox[2]), min(bottom, page.bbox[3]))
+
+
+def crop_text(page, bbox):
+    # Text of the characters lying entirely inside bbox, laid out the same way extract_text does it
+    return page.within_bbox(clip(page, bbox)).extract_text()
+
+
+def top_strip(page, bottom):
+    # The part of the page above bottom, the candidate templates only look in there
+    return page.crop(clip(page, (page.bbox[0], page.bbox[1], page.bbox[2], bottom)))
+
+
+class LayoutStore:
+    # Templates by reader ('trying', 'addresses', ...) and page size. A template is the first
+    # line of the page (its text and box, the anchor that identifies the layout) and the strip
+    # from the top of the page down to the last line the reader's parser needs.
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.templates = self.load()
+        self.unlearnable = set()  # (reader, size, anchor text) of layouts learning failed on
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}  # Unreadable store, the layouts are simply learned again
+
+    def candidates(self, reader, size):
+        templates = self.templates.get(reader, {}).get(size, [])
+        return sorted(templates, key=lambda template: -template['hits'])[:MAX_CANDIDATES]
+
+    def hit(self, template):
+        template['hits'] += 1
+
+    def learn(self, reader, size, template):
+        with self.lock:
+            # Merge with what other processes learned meanwhile, then replace the file in one go
+            templates = self.load()
+            for known in (self.templates, templates):
+                kept = [other for other in known.get(reader, {}).get(size, []) if other['anchor_text'] != template['anchor_text']]
+                kept = sorted(kept, key=lambda other: -other['hits'])[:MAX_TEMPLATES - 1]
+                known.setdefault(reader, {})[size] = kept + [template]
+
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(templates, f)
+            os.replace(tmp_path, self.path)
+
+
+_store = None
+_store_pid = None
+
+
+def layouts_path_for(directory):
+    return LAYOUTS_PATH or os.path.join(directory, LAYOUTS_NAME)
+
+
+def get_store():
+    # One store per process, like the PDF cache, None when there is no run directory to keep it in
+    global _store, _store_pid
+    if not (LAYOUTS_PATH or pdf_cache.CACHE_DIR):
+        return None
+    path = layouts_path_for(pdf_cache.CACHE_DIR)
+    if _store is None or _store_pid != os.getpid() or _store.path != path:
+        _store = LayoutStore(path)
+        _store_pid = os.getpid()
+    return _store
+
+
+def clear_layouts(directory):
+    # Forget the layouts learned in a directory's runs, returns the file's path or None when there is none
+    path = layouts_path_for(directory)
+    if not os.path.exists(path):
+        return None
+    os.remove(path)
+    return path
+
+
+def learn_template(page, pages, full_info, parse):
+    # Find how many lines from the top of the first page the parser needs to come to the same
+    # fields as it did on the full text (full_info), and turn that into a template
+    lines = page.extract_text_lines()
+    if not lines:
+        return None
+    texts = [line['text'] for line in lines]
+    if pages[0].split('\n')[:len(texts)] != texts:
+        return None  # Lines don't match what extract_text gave, cropping would not be safe
+
+    # The last line of the page may run into the next page's text, so it is never the cut
+    last = len(lines) - 1 if len(pages) > 1 else len(lines)
+    for count in range(1, last + 1):
+        try:
+            info = parse(['\n'.join(texts[:count])])
+        except Exception:
+            continue  # Too few lines for the parser
+        if info == full_info:
+            break
+    else:
+        return None
+
+    # Cut halfway between the last needed line and the next one
+    bottom = lines[count - 1]['bottom'] + PAD
+    if count < len(lines):
+        bottom = (lines[count - 1]['bottom'] + lines[count]['top']) / 2
+    anchor = lines[0]
+    template = {
+        'anchor_text': anchor['text'],
+        'anchor_bbox': [anchor['x0'] - PAD, anchor['top'] - PAD, anchor['x1'] + PAD, anchor['bottom'] + PAD],
+        'region': [page.bbox[0], page.bbox[1], page.bbox[2], bottom],
+        'lines': count,
+        'hits': 0,
+    }
+
+    # The crop has to read back exactly those lines
+    if crop_text(page, template['region']) != '\n'.join(texts[:count]):
+        return None
+    return template
+
+
+def extract_with_layout(pdf_path, reader, fallback, parse, check):
+    # Page texts for parse(): the learned strip of the first page when the layout is known,
+    # otherwise fallback(pdf_path), after which the layout is learned for the next PDFs.
+    # check(info) tells whether parsed fields look complete; a crop that fails it is not used.
+    store = None if LAYOUTS_MODE == 'off' else get_store()
+    if store is None:
+        return fallback(pdf_path)
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        page = pdf.pages[0]
+        size = page_size(page)
+        candidates = store.candidates(reader, size)
+        if candidates:
+            page = top_strip(page, max(template['region'][3] for template in candidates))
+        for template in candidates:
+            if crop_text(page, template['anchor_bbox']) != template['anchor_text']:
+                continue
+            text = crop_text(page, template['region'])
+            if text.count('\n') + 1 == template['lines']:
+                try:
+                    ok = check(parse([text]))
+                except Exception:
+                    ok = False
+                if ok:
+                    store.hit(template)
+                    count_event('pages.layout')
+                    return [text]
+            break  # Right layout, but this letter doesn't fit the template: relearn it below
+
+    pages = fallback(pdf_path)
+
+    # Only a letter whose full text parses completely can teach a layout, and a layout that
+    # failed to be learned once isn't read for it again
+    try:
+        full_info = parse(pages)
+    except Exception:
+        return pages
+    anchor = (reader, size, pages[0].split('\n', 1)[0] if pages else '')
+    if not check(full_info) or anchor in store.unlearnable:
+        return pages
+
+    # Learn from the whole first page (the one above may be missing its lower part by now)
+    with pdfplumber.open(pdf_path) as pdf:
+        template = learn_template(pdf.pages[0], pages, full_info, parse)
+    if template is not None:
+        store.learn(reader, size, template)
+    else:
+        store.unlearnable.add(anchor)
+    return pages
+
+
+def layout_extractor(reader, extractor, extract, parse, check):
+    # (cache key, extract function) to hand to read_cached: extract with the layout fast path in front
+    if LAYOUTS_MODE == 'off':
+        return extractor, extract
+    return f'layout-{extractor}', partial(extract_with_layout, reader=reader, fallback=extract, parse=parse, check=check)
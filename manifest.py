@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import datetime
+
+
+# Save at most this often while items are being marked, every step end saves regardless.
+# All the steps are safe to redo, so losing the last second of progress in a crash only costs a retry.
+SAVE_INTERVAL = 1.0
+
+
+class RunManifest:
+    # Progress of one day's run, kept in a JSON file next to the data so a rerun after a crash
+    # skips finished steps and items and picks up the unfinished step. Failed items are recorded
+    # (and retried on the next run) instead of aborting the whole run.
+
+    def __init__(self, path, run_date=None):
+        self.path = path
+        self.run_date = run_date or datetime.date.today().isoformat()
+        self.saved_at = 0.0
+
+        self.data = {'date': self.run_date, 'steps': {}}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            # A manifest from an earlier day belongs to a finished (or abandoned) run
+            if data.get('date') == self.run_date:
+                self.data = data
+
+    def step(self, name):
+        return self.data['steps'].setdefault(name, {'status': 'pending', 'items': {}})
+
+    def is_step_done(self, name):
+        return self.step(name)['status'] == 'done'
+
+    def start_step(self, name):
+        step = self.step(name)
+        step['status'] = 'running'
+        step['started'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.save()
+
+    def finish_step(self, name):
+        # A step with failed or held back items stays open, so the next run retries just those items.
+        # So does every step after an open one: it ran without the items that were missing then.
+        step = self.step(name)
+        open_items = any(state['status'] != 'done' for state in step['items'].values())
+        open_before = False
+        for other_name, other in self.data['steps'].items():
+            if other_name == name:
+                break
+            open_before = open_before or other['status'] != 'done'
+        step['status'] = 'incomplete' if open_items or open_before else 'done'
+        step['finished'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.save()
+
+    def is_done(self, name, item):
+        return self.step(name)['items'].get(item, {}).get('status') == 'done'
+
+    def mark_done(self, name, item):
+        self.step(name)['items'][item] = {'status': 'done'}
+        self.save(throttle=True)
+
+    def mark_failed(self, name, item, error):
+        if isinstance(error, BaseException):
+            error = f'{type(error).__name__}: {error}'
+        self.step(name)['items'][item] = {'status': 'failed', 'error': error}
+        self.save(throttle=True)
+
+    def mark_held(self, name, item, reason):
+        self.step(name)['items'][item] = {'status': 'held', 'error': reason}
+        self.save(throttle=True)
+
+    def failed_step_for(self, name, item):
+        # Name of another step where the same order (the 8-digit prefix of zip and folder names) failed
+        order = order_of(item)
+        if order is None:
+            return None
+        for other_name, other in self.data['steps'].items():
+            if other_name == name:
+                continue
+            for other_item, state in other['items'].items():
+                if state['status'] == 'failed' and order_of(other_item) == order:
+                    return other_name
+        return None
+
+    def failures(self):
+        # (step, item, error) for everything that failed or was held back in this run
+        return [(name, item, state['error'])
+                for name, step in self.data['steps'].items()
+                for item, state in step['items'].items() if state['status'] != 'done']
+
+    def save(self, throttle=False):
+        if throttle and time.time() - self.saved_at < SAVE_INTERVAL:
+            return
+        # Write to a temporary file first so a crash mid-write can't corrupt the manifest
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp_path, self.path)
+        self.saved_at = time.time()
+
+
+def order_of(item):
+    # '12345678_a.zip', '12345678' and '12345678.3' all belong to order 12345678
+    prefix = item[:8]
+    return prefix if prefix.isdigit() and len(prefix) == 8 else None
+
+
+def run_item(manifest, step, item, func, *args):
+    # Run one unit of work of a step. Without a manifest errors propagate like they always did,
+    # with one, finished items are skipped and failures are recorded instead of raised.
+    # An order that failed in another step is held back here until that step succeeds for it.
+    if manifest is None:
+        return func(*args)
+    if manifest.is_done(step, item):
+        return None
+    failed_step = manifest.failed_step_for(step, item)
+    if failed_step is not None:
+        manifest.mark_held(step, item, f'waiting for {failed_step}')
+        return None
+    try:
+        result = func(*args)
+    except Exception as e:
+        manifest.mark_failed(step, item, e)
+        return None
+    manifest.mark_done(step, item)
+    return result
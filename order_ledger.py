@@ -0,0 +1,122 @@
+import os
+import csv
+import time
+import sqlite3
+
+
+# The ledger goes next to daily_status.tsv unless ORDER_LEDGER names one file for every directory
+LEDGER_NAME = 'order_ledger.sqlite3'
+LEDGER_PATH = os.environ.get('ORDER_LEDGER')
+
+# Ledger columns, in the order of the fulfillment fields (and of the daily_status.tsv columns)
+COLUMNS = ('vendor_id', 'order_id', 'status', 'received_date', 'ship_date', 'shipping_method',
+           'shipping_cost', 'comments', 'packages_count', 'tracking')
+ORDER_ID = COLUMNS.index('order_id')
+
+
+def normalize(row):
+    # TSV rows and fulfillment rows compare equal once missing values are empty strings
+    row = ['' if value is None else str(value) for value in row]
+    return tuple(row + [''] * (len(COLUMNS) - len(row)))[:len(COLUMNS)]
+
+
+class OrderLedger:
+    # The latest fulfillment row of every order, keyed on OrderID. Each upsert is an index
+    # lookup, so it costs the same however many years of orders the ledger holds, and
+    # daily_status.tsv style files are exported from it when needed.
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        # Callers that share a ledger between threads (the watcher) serialize their calls
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        columns = ', '.join(f'{column} TEXT' for column in COLUMNS if column != 'order_id')
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS orders (order_id TEXT PRIMARY KEY, {columns}, '
+                        'seq INTEGER, run TEXT, updated REAL)')
+        for column in ('status', 'received_date', 'ship_date', 'seq'):
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS orders_{column} ON orders ({column})')
+        # The TSV files already imported, by absolute path
+        self.db.execute('CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, imported REAL)')
+        self.db.commit()
+
+    def imported(self, path):
+        return self.db.execute('SELECT 1 FROM imports WHERE path = ?', (os.path.abspath(path),)).fetchone() is not None
+
+    def get(self, order_id):
+        row = self.db.execute(f'SELECT {", ".join(COLUMNS)} FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+        return None if row is None else tuple(row)
+
+    def upsert(self, rows, run=None):
+        # Insert or replace the rows by OrderID. Every upserted row moves to the end of the
+        # export order, the way a new line would be appended to the TSV. Returns the rows that
+        # were new or different from what the ledger had.
+        changed = []
+        now = time.time()
+        placeholders = ', '.join('?' for _ in COLUMNS)
+        updates = ', '.join(f'{column} = excluded.{column}' for column in COLUMNS if column != 'order_id')
+        with self.db:
+            seq = self.db.execute('SELECT COALESCE(MAX(seq), 0) FROM orders').fetchone()[0]
+            for row in rows:
+                row = normalize(row)
+                if self.get(row[ORDER_ID]) != row:
+                    changed.append(row)
+                seq += 1
+                self.db.execute(f'INSERT INTO orders ({", ".join(COLUMNS)}, seq, run, updated) VALUES ({placeholders}, ?, ?, ?) '
+                                f'ON CONFLICT (order_id) DO UPDATE SET {updates}, seq = excluded.seq, run = excluded.run, '
+                                'updated = excluded.updated', row + (seq, run, now))
+        return changed
+
+    def rows(self, status=None, received_from=None, received_to=None):
+        # Ledger rows in export order, optionally only those of one status or a range of
+        # received dates (YYYY-MM-DD, both ends included)
+        conditions, args = [], []
+        for condition, value in (('status = ?', status), ('received_date >= ?', received_from),
+                                 ('received_date <= ?', received_to)):
+            if value is not None:
+                conditions.append(condition)
+                args.append(value)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self.db.execute(f'SELECT {", ".join(COLUMNS)} FROM orders {where} ORDER BY seq', args)
+
+    def export_tsv(self, path, **filters):
+        # Write the (filtered) ledger as a daily_status.tsv style file, returns the row count
+        count = 0
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', newline='') as tsvfile:
+            writer = csv.writer(tsvfile, delimiter='\t')
+            for row in self.rows(**filters):
+                writer.writerow(row)
+                count += 1
+        os.replace(tmp_path, path)
+        return count
+
+    def import_tsv(self, path):
+        # Load an existing daily_status.tsv, a later line for the same order wins
+        with open(path, 'r', newline='') as tsvfile:
+            rows = [row for row in csv.reader(tsvfile, delimiter='\t') if len(row) > ORDER_ID]
+        self.upsert(rows, run='import')
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO imports (path, imported) VALUES (?, ?)', (os.path.abspath(path), time.time()))
+        return len(rows)
+
+    def close(self):
+        self.db.close()
+
+
+def ledger_path_for(directory):
+    return LEDGER_PATH or os.path.join(directory, LEDGER_NAME)
+
+
+def open_ledger(directory, tsv_path=None):
+    # The ledger of a directory, filled from its daily_status.tsv the first time it is opened
+    # with it, also when something else (status_feedback) created the ledger before that
+    ledger = OrderLedger(ledger_path_for(directory))
+    if tsv_path is not None and os.path.exists(tsv_path) and not ledger.imported(tsv_path):
+        ledger.import_tsv(tsv_path)
+    return ledger
+
@@ -0,0 +1,103 @@
+import os
+
+from instrumentation import count_event
+
+
+# Memory (MB) reading one PDF may add to the worker; once past it the rest of the pages are skipped.
+# PDF_MEMORY_BUDGET_MB=0 turns the check off.
+MEMORY_BUDGET_MB = int(os.environ.get('PDF_MEMORY_BUDGET_MB', '512'))
+
+# PDFs bigger than this on disk (MB) only have their first REDUCED_PAGES pages read. The fields
+# we look for are on the first page or two, the rest of such a file is usually scanned images.
+LARGE_FILE_MB = int(os.environ.get('PDF_LARGE_FILE_MB', '50'))
+REDUCED_PAGES = 2
+
+
+def rss_mb():
+    # Current resident set size of this process, None where /proc isn't there (not Linux)
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+# Why the read of the current file came back short ('reads.reduced', 'reads.over_budget'). Each
+# reason is counted once per file, however many extraction tiers run into it, and pdf_cache
+# doesn't store a read that was cut short.
+_cut_short = set()
+
+
+def cut_short(reason):
+    if reason not in _cut_short:
+        _cut_short.add(reason)
+        count_event(reason)
+
+
+def take_cut_short():
+    # The reasons since the last call, and start over (called before and after reading a file)
+    global _cut_short
+    reasons, _cut_short = _cut_short, set()
+    return reasons
+
+
+def page_limit(pdf_path, max_pages=0):
+    # Pages to read at most from pdf_path (0 = all): large files go the reduced way
+    try:
+        size = os.path.getsize(pdf_path)
+    except OSError:
+        return max_pages
+    if LARGE_FILE_MB and size > LARGE_FILE_MB * 1024 * 1024:
+        return min(max_pages, REDUCED_PAGES) if max_pages else REDUCED_PAGES
+    return max_pages
+
+
+def stop_reading(pages, limit, max_pages):
+    # Whether a read with `limit` pages at most is done before its next page, noting it when the
+    # large-file limit cut off pages the caller wanted
+    if not limit or len(pages) < limit:
+        return False
+    if limit != max_pages:
+        cut_short('reads.reduced')
+    return True
+
+
+class MemoryBudget:
+    # Tells when the memory of the process has grown more than budget_mb since it was created
+
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB):
+        self.budget_mb = budget_mb
+        self.start = rss_mb() if budget_mb else None
+
+    def exceeded(self):
+        if self.start is None:
+            return False
+        now = rss_mb()
+        if now is None or now - self.start <= self.budget_mb:
+            return False
+        cut_short('reads.over_budget')
+        return True
+
+
+def read_page_texts(pdf_path, max_pages=0, stop=None):
+    # pdfplumber's page texts, up to max_pages (0 = all) or until stop(pages) says enough.
+    # Each page drops its cached chars and layout as soon as its text is taken, so a long
+    # PDF doesn't keep every page's objects alive until the file is closed.
+    import pdfplumber  # Loaded on first use, it is slow to import
+
+    limit = page_limit(pdf_path, max_pages)
+    budget = MemoryBudget()
+    pages = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            if stop_reading(pages, limit, max_pages):
+                break
+            pages.append(page.extract_text())
+            page.close()
+            if stop is not None and stop(pages):
+                break
+            if budget.exceeded():
+                break
+    count_event('pages.pdfplumber', len(pages))
+    return pages
@@ -0,0 +1,124 @@
+import os
+import time
+import heapq
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from instrumentation import take_counts
+
+
+# Number of worker processes used when a caller doesn't pass one.
+# Set PDF_WORKERS=1 to run everything in the current process (handy for debugging).
+DEFAULT_WORKERS = int(os.environ.get('PDF_WORKERS', os.cpu_count() or 1))
+
+# Jobs imap_ordered keeps in the pool per worker, which is also how far ahead it looks for the
+# biggest PDFs to start first. Finished results wait there for the jobs before them, so this
+# bounds how many rows are held at once.
+WINDOW_PER_WORKER = int(os.environ.get('PDF_WINDOW', 4))
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def job_size(job):
+    # Size of the first file path among the job's arguments (the PDF for our jobs)
+    for arg in job:
+        if isinstance(arg, str):
+            return file_size(arg)
+    return 0
+
+
+def largest_first(jobs):
+    # Job indexes ordered so the biggest PDFs start first,
+    # that way one slow file doesn't end up running alone at the end of the batch
+    return sorted(range(len(jobs)), key=lambda i: job_size(jobs[i]), reverse=True)
+
+
+class JobFailed:
+    # Stands in for the result of a job that raised, when imap_ordered is asked to keep going
+
+    def __init__(self, error):
+        self.error = error
+
+    def __repr__(self):
+        return f'JobFailed({self.error!r})'
+
+
+def call_catching(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return JobFailed(f'{type(e).__name__}: {e}')
+
+
+def call_timed(func, *args):
+    # Time the job inside the worker, so the queueing time in the pool isn't counted, and hand
+    # back the events the job counted (instrumentation.count_event) along with its result
+    take_counts()
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start, take_counts()
+
+
+def prepare_jobs(func, jobs, workers, keep_going, timed):
+    # The function and jobs the pool runs for keep_going / timed, and the pool size
+    jobs = list(jobs)
+    if keep_going:
+        jobs = [(func,) + tuple(job) for job in jobs]
+        func = call_catching
+    if timed:
+        jobs = [(func,) + tuple(job) for job in jobs]
+        func = call_timed
+    if workers is None:
+        workers = DEFAULT_WORKERS
+    return func, jobs, max(1, min(workers, len(jobs)))
+
+
+def imap_ordered(func, jobs, workers=None, keep_going=False, timed=False):
+    # Run func(*job) for every job and yield the results in the same order as jobs, as soon as
+    # each one (and everything before it) is done. func has to be a module level function so
+    # it can be sent to the worker processes. With keep_going a job that raises yields a
+    # JobFailed instead of stopping the whole batch. With timed every result comes as a
+    # (result, seconds, counts) tuple. Only a window of a few jobs per worker, starting at the
+    # one to yield next, is in the pool at a time, so results stream out and memory stays flat
+    # however many jobs there are. Within that window the biggest PDFs are submitted first.
+    func, jobs, workers = prepare_jobs(func, jobs, workers, keep_going, timed)
+
+    if workers == 1:
+        for job in jobs:
+            yield func(*job)
+        return
+
+    window = workers * max(1, WINDOW_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}  # job index -> future, submitted and not yielded yet
+        waiting = []  # heap of (-size, job index), in the window and not submitted yet
+        seen = 0
+        for position in range(len(jobs)):
+            while seen < min(position + window, len(jobs)):
+                heapq.heappush(waiting, (-job_size(jobs[seen]), seen))
+                seen += 1
+            # futures only holds jobs of this window, so once it is full this position's job is in it
+            while waiting and len(futures) < window:
+                _, i = heapq.heappop(waiting)
+                futures[i] = executor.submit(func, *jobs[i])
+            yield futures.pop(position).result()
+
+
+def imap_unordered(func, jobs, workers=None, keep_going=False, timed=False):
+    # Same as imap_ordered, but yields (job index, result) as soon as each job is done, whatever
+    # its place in jobs. Jobs start in the order given, so a caller that lists them batch by
+    # batch gets the first batches back first.
+    func, jobs, workers = prepare_jobs(func, jobs, workers, keep_going, timed)
+
+    if workers == 1:
+        for i, job in enumerate(jobs):
+            yield i, func(*job)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(func, *job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            yield futures.pop(future), future.result()
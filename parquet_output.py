@@ -0,0 +1,186 @@
+import os
+import glob
+import hashlib
+import datetime
+
+from sheet_writer import EXTRACTED_COLUMNS
+
+
+# The Parquet dataset extracted rows are added to, 'extracted_parquet' next to the date folders
+# unless set. PARQUET_DATASET=off turns it off, without pyarrow installed it is skipped.
+DATASET_PATH = os.environ.get('PARQUET_DATASET')
+
+# Rows are partitioned into <dataset>/order_received=YYYY-MM-DD/ folders
+PARTITION_KEY = 'order_received'
+
+COMPRESSION = 'zstd'
+
+# Rows held per partition before they are written out as a row group
+ROW_GROUP_ROWS = 50000
+
+# Columns that aren't strings, with the conversion from the spreadsheet text. Empty cells are nulls.
+INTEGER_COLUMNS = ('IsKit', 'Qty')
+FLOAT_COLUMNS = ('Unit Price', 'Tax')
+DATE_COLUMN = 'Order Received'  # MM/DD/YYYY in the rows
+
+
+def load_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def dataset_path_for(date_folder_path):
+    if DATASET_PATH:
+        return None if DATASET_PATH.lower() == 'off' else DATASET_PATH
+    return os.path.join(os.path.dirname(os.path.abspath(date_folder_path)), 'extracted_parquet')
+
+
+def parse_received(value):
+    return datetime.datetime.strptime(value, '%m/%d/%Y').date() if value else None
+
+
+def to_number(value, kind):
+    if value is None or value == '':
+        return None
+    return kind(value)
+
+
+class ParquetDataset:
+    # Writes extracted rows into the partitioned dataset as they come in, one file per partition
+    # and source (the date folder the rows came from). Files are written under a temporary name
+    # and put in place at the end, when the source's files from earlier runs are removed from
+    # every partition, so a rerun for the same date folder replaces its rows instead of
+    # duplicating them, and an interrupted run leaves nothing half-written.
+
+    def __init__(self, dataset_path, source, columns=EXTRACTED_COLUMNS, row_group_rows=ROW_GROUP_ROWS):
+        self.pa = load_pyarrow()
+        self.dataset_path = dataset_path
+        self.name = 'part-' + hashlib.sha1(os.path.abspath(source).encode('utf-8')).hexdigest()[:16] + '.parquet'
+        self.columns = columns
+        self.row_group_rows = row_group_rows
+        self.pending = {}  # Partition date -> rows not written yet
+        self.writers = {}  # Partition date -> (pyarrow ParquetWriter, temporary path)
+        self.rows = 0
+
+        pa = self.pa
+        fields = []
+        for column in columns:
+            if column == DATE_COLUMN:
+                fields.append(pa.field(column, pa.date32()))
+            elif column in INTEGER_COLUMNS:
+                fields.append(pa.field(column, pa.int32()))
+            elif column in FLOAT_COLUMNS:
+                fields.append(pa.field(column, pa.float64()))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        self.schema = pa.schema(fields)
+
+    def partition_folder(self, received):
+        return os.path.join(self.dataset_path, f'{PARTITION_KEY}={received.isoformat() if received else "unknown"}')
+
+    def write(self, row):
+        received = parse_received(row.get(DATE_COLUMN))
+        rows = self.pending.setdefault(received, [])
+        rows.append(row)
+        self.rows += 1
+        if len(rows) >= self.row_group_rows:
+            self.flush(received)
+
+    def write_all(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def table(self, rows):
+        arrays = []
+        for column in self.columns:
+            values = [row.get(column) for row in rows]
+            if column == DATE_COLUMN:
+                values = [parse_received(value) for value in values]
+            elif column in INTEGER_COLUMNS:
+                values = [to_number(value, int) for value in values]
+            elif column in FLOAT_COLUMNS:
+                values = [to_number(value, float) for value in values]
+            else:
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(self.pa.array(values, type=self.schema.field(column).type))
+        return self.pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def flush(self, received):
+        rows = self.pending.pop(received, [])
+        if not rows:
+            return
+        if received not in self.writers:
+            folder = self.partition_folder(received)
+            os.makedirs(folder, exist_ok=True)
+            tmp_path = os.path.join(folder, f'.{self.name}.{os.getpid()}.tmp')
+            writer = self.pa.parquet.ParquetWriter(tmp_path, self.schema, compression=COMPRESSION)
+            self.writers[received] = (writer, tmp_path)
+        self.writers[received][0].write_table(self.table(rows))
+
+    def close(self):
+        for received in list(self.pending):
+            self.flush(received)
+        written = set()
+        for received, (writer, tmp_path) in self.writers.items():
+            writer.close()
+            path = os.path.join(self.partition_folder(received), self.name)
+            os.replace(tmp_path, path)
+            written.add(os.path.normpath(path))
+        self.writers = {}
+        self.remove_stale(written)
+
+    def remove_stale(self, written):
+        # An earlier run for the same source may have put its rows in other partitions (run on
+        # another day, or for other received dates), those files are replaced by this run's
+        for path in glob.glob(os.path.join(glob.escape(self.dataset_path), f'{PARTITION_KEY}=*', self.name)):
+            if os.path.normpath(path) not in written:
+                os.remove(path)
+
+    def abort(self):
+        for writer, tmp_path in self.writers.values():
+            writer.close()
+            os.remove(tmp_path)
+        self.writers = {}
+        self.pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class NoDataset:
+    # Stands in for ParquetDataset when the output is off or pyarrow isn't installed
+
+    rows = 0
+
+    def write(self, row):
+        pass
+
+    def write_all(self, rows):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+
+def open_dataset(date_folder_path):
+    # The dataset writer for the rows of one date folder
+    dataset_path = dataset_path_for(date_folder_path)
+    if dataset_path is None:
+        return NoDataset()
+    if load_pyarrow() is None:
+        print('pyarrow is not installed, skipping the Parquet output')
+        return NoDataset()
+    return ParquetDataset(dataset_path, date_folder_path)
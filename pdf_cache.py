@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from page_memory import take_cut_short
+
+
+# The cache holds letter text (names, addresses, MRNs), so it goes into the directory of the run,
+# next to its output, unless PDF_CACHE_PATH names one file for every run. Without either (a
+# module used on its own) nothing is cached. use_directory passes the directory on to the worker
+# processes through PDF_CACHE_DIR, layouts keeps its learned layouts in the same directory.
+CACHE_NAME = 'pdf_extract_cache.sqlite3'
+CACHE_PATH = os.environ.get('PDF_CACHE_PATH')
+CACHE_DIR = os.environ.get('PDF_CACHE_DIR')
+CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+# Entries not read for this many days are dropped
+CACHE_MAX_DAYS = float(os.environ.get('PDF_CACHE_MAX_DAYS', '30'))
+
+# PDF_CACHE=off skips the cache entirely, PDF_CACHE=refresh ignores what is stored and rewrites it
+CACHE_MODE = os.environ.get('PDF_CACHE', 'on').lower()
+
+# How many writes happen between two size checks
+EVICT_EVERY = 50
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PdfCache:
+    # Raw page text per (PDF hash, extractor) and parsed fields per (PDF hash, parser version)
+
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES, max_days=CACHE_MAX_DAYS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_days = max_days
+        self.writes = 0
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        for table in ('pages', 'fields'):
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS {table} (digest TEXT, key TEXT, data TEXT, size INTEGER, used REAL, PRIMARY KEY (digest, key))')
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS {table}_used ON {table} (used)')
+        self.db.commit()
+        self.evict()
+
+    def _get(self, table, digest, key):
+        row = self.db.execute(f'SELECT data FROM {table} WHERE digest = ? AND key = ?', (digest, key)).fetchone()
+        if row is None:
+            return None
+        with self.db:
+            self.db.execute(f'UPDATE {table} SET used = ? WHERE digest = ? AND key = ?', (time.time(), digest, key))
+        return json.loads(row[0])
+
+    def _put(self, table, digest, key, value):
+        data = json.dumps(value)
+        with self.db:
+            self.db.execute(f'INSERT OR REPLACE INTO {table} (digest, key, data, size, used) VALUES (?, ?, ?, ?, ?)',
+                            (digest, key, data, len(data), time.time()))
+        self.writes += 1
+        if self.writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def get_pages(self, digest, extractor):
+        return self._get('pages', digest, extractor)
+
+    def put_pages(self, digest, extractor, pages):
+        self._put('pages', digest, extractor, pages)
+
+    def get_fields(self, digest, parser):
+        return self._get('fields', digest, parser)
+
+    def put_fields(self, digest, parser, info):
+        self._put('fields', digest, parser, info)
+
+    def size(self):
+        return sum(self.db.execute(f'SELECT COALESCE(SUM(size), 0) FROM {table}').fetchone()[0] for table in ('pages', 'fields'))
+
+    def evict(self):
+        # Drop the entries that weren't used for max_days. Once over budget, drop the least
+        # recently used entries until the cache is under 90% of it.
+        with self.db:
+            for table in ('pages', 'fields'):
+                self.db.execute(f'DELETE FROM {table} WHERE used < ?', (time.time() - self.max_days * 86400,))
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * 0.9)
+        rows = self.db.execute("SELECT 'pages', digest, key, size, used FROM pages UNION ALL "
+                               "SELECT 'fields', digest, key, size, used FROM fields ORDER BY used").fetchall()
+        with self.db:
+            for table, digest, key, size, _ in rows:
+                if excess <= 0:
+                    break
+                self.db.execute(f'DELETE FROM {table} WHERE digest = ? AND key = ?', (digest, key))
+                excess -= size
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM pages')
+            self.db.execute('DELETE FROM fields')
+        self.db.execute('VACUUM')
+
+
+_cache = None
+_cache_pid = None
+
+
+def cache_path_for(directory):
+    return CACHE_PATH or os.path.join(directory, CACHE_NAME)
+
+
+def use_directory(directory):
+    # Cache the PDFs of a run in its directory, called before the run reads any
+    global CACHE_DIR
+    CACHE_DIR = os.path.abspath(directory)
+    os.environ['PDF_CACHE_DIR'] = CACHE_DIR
+
+
+def get_cache():
+    # One connection per process, worker processes must not share the parent's connection
+    global _cache, _cache_pid
+    if CACHE_MODE == 'off' or not (CACHE_PATH or CACHE_DIR):
+        return None
+    path = cache_path_for(CACHE_DIR)
+    if _cache is None or _cache_pid != os.getpid() or _cache.path != path:
+        _cache = PdfCache(path)
+        _cache_pid = os.getpid()
+    return _cache
+
+
+def clear_cache(directory):
+    # Empty the cache of a directory's runs, returns its path or None when there is none
+    path = cache_path_for(directory)
+    if not os.path.exists(path):
+        return None
+    cache = PdfCache(path)
+    try:
+        cache.clear()
+    finally:
+        cache.db.close()
+    return path
+
+
+def extract_whole(pdf_path, extract):
+    # extract(pdf_path), and whether the pages may be stored. A read cut short by the large-file
+    # page limit or the memory budget (page_memory) isn't, one memory spike would otherwise
+    # leave a partial letter in the cache for good.
+    take_cut_short()
+    pages = extract(pdf_path)
+    return pages, not take_cut_short()
+
+
+def read_pages_cached(pdf_path, extractor, extract):
+    # extract(pdf_path) -> list of page texts, stored under the extractor key
+    cache = get_cache()
+    if cache is None:
+        return extract_whole(pdf_path, extract)[0]
+
+    digest = file_digest(pdf_path)
+    pages = None if CACHE_MODE == 'refresh' else cache.get_pages(digest, extractor)
+    if pages is None:
+        pages, whole = extract_whole(pdf_path, extract)
+        if whole:
+            cache.put_pages(digest, extractor, pages)
+    return pages
+
+
+def read_cached(pdf_path, extractor, extract, parser, parse):
+    # extract(pdf_path) -> list of page texts, parse(pages) -> field dict.
+    # extractor and parser are the cache keys for those two steps, parser should carry the parser version.
+    cache = get_cache()
+    if cache is None:
+        return parse(extract_whole(pdf_path, extract)[0])
+
+    digest = file_digest(pdf_path)
+    refresh = CACHE_MODE == 'refresh'
+
+    # Parsed fields depend on what was extracted as well as on the parser
+    parser = f'{parser}@{extractor}'
+
+    info = None if refresh else cache.get_fields(digest, parser)
+    if info is not None:
+        return info
+
+    # The page text survives parser changes, only re-run pdfplumber when it is missing
+    pages = None if refresh else cache.get_pages(digest, extractor)
+    whole = True
+    if pages is None:
+        pages, whole = extract_whole(pdf_path, extract)
+        if whole:
+            cache.put_pages(digest, extractor, pages)
+
+    info = parse(pages)
+    if whole:
+        cache.put_fields(digest, parser, info)
+    return info
@@ -0,0 +1,139 @@
+import os
+from functools import partial
+
+from instrumentation import count_event
+from page_memory import page_limit, stop_reading, MemoryBudget
+
+
+# PDF_TIERS=off sends every PDF straight to pdfplumber
+TIERS_MODE = os.environ.get('PDF_TIERS', 'on').lower()
+
+# Same tolerances pdfplumber's extract_text uses by default
+X_TOLERANCE = 3
+Y_TOLERANCE = 3
+
+LIGATURES = {'ﬀ': 'ff', 'ﬃ': 'ffi', 'ﬄ': 'ffl', 'ﬁ': 'fi', 'ﬂ': 'fl', 'ﬆ': 'st', 'ﬅ': 'st'}
+
+
+def make_device_class():
+    # Defined on first use so importing this module doesn't load pdfminer
+    from pdfminer.pdfdevice import PDFTextDevice
+
+    class CharCollector(PDFTextDevice):
+        # Records (top, x0, x1, text) of every glyph the content stream draws, without building
+        # pdfminer's layout objects or pdfplumber's char dicts. Only upright text is supported,
+        # a rotated page makes the collector give up so the page goes to pdfplumber.
+
+        def __init__(self, rsrcmgr):
+            super().__init__(rsrcmgr)
+            self.chars = []
+            self.page_top = 0
+            self.rotated = False
+
+        def begin_page(self, page, ctm):
+            super().begin_page(page, ctm)
+            self.chars = []
+            self.page_top = page.mediabox[3] - page.mediabox[1]  # pdfminer puts the origin at the MediaBox corner
+            self.rotated = page.rotate % 360 != 0
+
+        def render_char(self, matrix, font, fontsize, scaling, rise, cid, ncs, graphicstate):
+            a, b, c, d, e, f = matrix
+            adv = font.char_width(cid) * fontsize * scaling
+            if b != 0 or c != 0 or a <= 0 or d <= 0:
+                self.rotated = True
+                return adv
+            try:
+                text = font.to_unichr(cid)
+            except Exception:
+                text = f'(cid:{cid})'  # What pdfminer prints for glyphs it can't map either
+            # Same box pdfminer gives an LTChar: from the font's descent up one font size
+            descent = font.get_descent() * fontsize
+            y1 = f + d * (descent + rise + fontsize)
+            self.chars.append((self.page_top - y1, e, e + a * adv, LIGATURES.get(text, text)))
+            return adv
+
+    return CharCollector
+
+
+def cluster(items, key):
+    # Group items whose key values chain within Y_TOLERANCE of each other (pdfplumber's cluster_list)
+    groups = []
+    for item in sorted(items, key=key):
+        if groups and key(item) <= key(groups[-1][-1]) + Y_TOLERANCE:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    return groups
+
+
+def chars_to_text(chars):
+    # Lines of words the way pdfplumber's extract_text lays them out without layout=True
+    words = []
+    for line in cluster(chars, key=lambda char: char[0]):
+        word = None
+        for top, x0, x1, text in sorted(line, key=lambda char: char[1]):
+            if text.isspace():
+                word = None
+                continue
+            if word is None or x0 > word[2] + X_TOLERANCE or abs(top - word[0]) > Y_TOLERANCE:
+                word = [top, x0, x1, text]
+                words.append(word)
+            else:
+                word[2] = x1
+                word[3] += text
+                word[0] = min(word[0], top)
+    lines = cluster(words, key=lambda word: word[0])
+    return '\n'.join(' '.join(word[3] for word in sorted(line, key=lambda word: word[1])) for line in lines)
+
+
+def extract_raw_pages(pdf_path, max_pages=0, stop=None):
+    # Page texts straight from the content streams. stop(pages) ends the read early, None is
+    # returned when a page can't be read this way (rotated text). Only one page's chars are
+    # held at a time, and large files get the same page limit and memory budget as pdfplumber.
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+
+    limit = page_limit(pdf_path, max_pages)
+    budget = MemoryBudget()
+    pages = []
+    with open(pdf_path, 'rb') as f:
+        document = PDFDocument(PDFParser(f))
+        rsrcmgr = PDFResourceManager(caching=True)
+        device = make_device_class()(rsrcmgr)
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for page in PDFPage.create_pages(document):
+            if stop_reading(pages, limit, max_pages):
+                break
+            interpreter.process_page(page)
+            if device.rotated:
+                return None
+            pages.append(chars_to_text(device.chars))
+            if stop is not None and stop(pages):
+                break
+            if budget.exceeded():
+                break
+    return pages
+
+
+def extract_tiered(pdf_path, raw_extract, fallback, parse, check):
+    # First tier: raw content-stream text, kept when check(parse(pages)) says the fields came out
+    # whole. Anything else goes to the second tier, fallback(pdf_path) (pdfplumber), which counts
+    # its own pages.
+    try:
+        pages = raw_extract(pdf_path)
+        ok = pages is not None and check(parse(pages))
+    except Exception:
+        pages, ok = None, False
+    if ok:
+        count_event('pages.raw', len(pages))
+        return pages
+    return fallback(pdf_path)
+
+
+def tiered_extractor(extractor, raw_extract, extract, parse, check):
+    # (cache key, extract function) to hand to read_cached, with the raw tier in front of extract
+    if TIERS_MODE == 'off':
+        return extractor, extract
+    return f'tiered-{extractor}', partial(extract_tiered, raw_extract=raw_extract, fallback=extract, parse=parse, check=check)
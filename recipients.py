@@ -0,0 +1,105 @@
+import os
+import re
+from functools import lru_cache
+
+from xml_access import scan
+
+
+# Minimum similarity for the n-gram fallback to accept a near-match
+NGRAM_THRESHOLD = 0.6
+
+
+def normalize_address(address):
+    # Upper-case, drop punctuation and collapse whitespace so "123 Main St." == "123  MAIN ST"
+    address = re.sub(r'[^0-9A-Z ]+', ' ', (address or '').upper())
+    return ' '.join(address.split())
+
+
+def address_ngrams(address, n=3):
+    padded = f' {address} '
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class RecipientIndex:
+    # All recipients of one order XML, built once and looked up by address
+
+    def __init__(self, order_id, recipients):
+        self.order_id = order_id
+        self.recipients = recipients  # List of (mailadr1, data) in document order
+        self.by_address = {}  # Normalized mailadr1 -> first recipient with it
+        self.by_prefix = {}  # First 4 characters of mailadr1 -> first recipient with it
+        self.by_ngram = {}  # Trigram -> positions of the recipients containing it
+        self.ngrams = []
+
+        for position, (mailadr1, data) in enumerate(recipients):
+            normalized = normalize_address(mailadr1)
+            self.by_address.setdefault(normalized, data)
+            self.by_prefix.setdefault(mailadr1[:4], data)
+            grams = address_ngrams(normalized)
+            self.ngrams.append(grams)
+            for gram in grams:
+                self.by_ngram.setdefault(gram, []).append(position)
+
+    @classmethod
+    def from_xml(cls, xml_path):
+        # One streaming pass picks out the details and the recipients, the rest is never kept
+        found, records = scan(xml_path, first=('details',), each='recipient',
+                              fields=('mailadr1', 'sku', 'DOCID', 'region_cd'))
+
+        # Extract OrderID from details
+        details = found['details'][1] if 'details' in found else None
+        order_id = details['orderId'] if details is not None and 'orderId' in details else 'No ID'
+
+        recipients = []
+        for recipient in records:
+            if recipient.get('mailadr1') is None:
+                continue
+
+            data = {'SKU': '', 'DOCID': '', 'Region': ''}
+            for key, tag in (('SKU', 'sku'), ('DOCID', 'DOCID'), ('Region', 'region_cd')):
+                if tag in recipient:
+                    data[key] = recipient[tag]
+            recipients.append((recipient['mailadr1'], data))
+
+        return cls(order_id, recipients)
+
+    def lookup(self, address_line):
+        # 1. Same address once case, punctuation and spacing are ignored
+        normalized = normalize_address(address_line)
+        if normalized in self.by_address:
+            return self.by_address[normalized]
+
+        # 2. First recipient whose mailadr1 starts with the same 4 characters (the old read_xml rule)
+        prefix = (address_line or '')[:4]
+        if len(prefix) == 4:
+            if prefix in self.by_prefix:
+                return self.by_prefix[prefix]
+        else:
+            for mailadr1, data in self.recipients:
+                if mailadr1.startswith(prefix):
+                    return data
+
+        # 3. Closest address by trigram similarity, for OCR slips and reformatted addresses
+        grams = address_ngrams(normalized)
+        shared = {}
+        for gram in grams:
+            for position in self.by_ngram.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+
+        best, best_score = None, NGRAM_THRESHOLD
+        for position in sorted(shared):
+            score = 2 * shared[position] / (len(grams) + len(self.ngrams[position]))
+            if score > best_score:
+                best, best_score = self.recipients[position][1], score
+        return best
+
+
+@lru_cache(maxsize=64)
+def _cached_index(xml_path, mtime_ns, size):
+    return RecipientIndex.from_xml(xml_path)
+
+
+def load_recipient_index(xml_path):
+    # Parse each order XML once per process, a changed file on disk gets re-parsed
+    stat = os.stat(xml_path)
+    return _cached_index(xml_path, stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+
+# Columns of extracted.xlsx, in the order the fulfillment team expects them
+EXTRACTED_COLUMNS = [
+    'Order ID', 'Invoice Number', 'SKU', 'Item Description', 'Vendor', 'Order Received', 'IsKit', 'Qty',
+    'Unit Price', 'Tax', 'Prefix of MRN', 'Medical Record Number', 'First Name', 'Last Name', 'Region',
+    'Address Line', 'Address Line 2', 'City', 'State'
+]
+
+
+class SheetWriter:
+    # Writes rows to an .xlsx as they come in, using openpyxl's write-only mode so rows are
+    # flushed to a temporary file instead of piling up in memory
+
+    def __init__(self, path, headers, sheet_title='Sheet1', bold_headers=True, missing=''):
+        self.path = path
+        self.headers = headers
+        self.missing = missing
+        self.rows = 0
+
+        # openpyxl is only loaded once a spreadsheet is actually written
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Border, Font, Side
+
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(sheet_title)
+
+        header_row = []
+        for header in headers:
+            cell = WriteOnlyCell(self.sheet, value=header)
+            if bold_headers:
+                # Same header look as pandas' to_excel
+                cell.font = Font(bold=True)
+                cell.border = Border(left=Side('thin'), right=Side('thin'), top=Side('thin'), bottom=Side('thin'))
+                cell.alignment = Alignment(horizontal='center', vertical='top')
+            header_row.append(cell)
+        self.sheet.append(header_row)
+
+    def write(self, row):
+        # row is a dict keyed by header
+        self.sheet.append([row.get(header, self.missing) for header in self.headers])
+        self.rows += 1
+
+    def write_all(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+    def discard(self):
+        # Finish the workbook into a scratch file and delete it. That closes openpyxl's row
+        # writer and its temporary file now, rather than when the workbook is collected.
+        fd, scratch = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            self.workbook.save(scratch)
+        finally:
+            os.remove(scratch)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Don't leave a half-written spreadsheet behind that looks like a finished one
+        if exc_type is None:
+            self.close()
+        else:
+            try:
+                self.discard()
+            except Exception:
+                pass  # The error that stopped the run is the one to report
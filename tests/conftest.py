@@ -0,0 +1,37 @@
+import os
+import sys
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep test runs away from the user's PDF cache and Parquet dataset
+os.environ.setdefault('PDF_CACHE', 'off')
+os.environ.setdefault('PARQUET_DATASET', 'off')
+
+
+import random
+
+import pytest
+
+
+@pytest.fixture
+def make_date_folder():
+    # A date folder as trying.py leaves it: one folder per order with its XML and letter PDFs,
+    # built from the benchmark's synthetic letters
+    from benchmark import make_letter, make_order_xml, make_recipient
+
+    def make(path, orders=2, letters=2, seed=1):
+        rng = random.Random(seed)
+        os.makedirs(path, exist_ok=True)
+        for order in range(orders):
+            order_id = f'{10000000 + seed * 100 + order:08d}'
+            folder = os.path.join(path, order_id)
+            os.makedirs(folder)
+            recipients = [make_recipient(rng, order * 100 + i) for i in range(letters)]
+            with open(os.path.join(folder, f'order_{order_id}.xml'), 'w') as f:
+                f.write(make_order_xml(order_id, recipients))
+            for i, recipient in enumerate(recipients):
+                with open(os.path.join(folder, f'letter_{i:03d}.pdf'), 'wb') as f:
+                    f.write(make_letter(recipient, 0))
+        return str(path)
+    return make
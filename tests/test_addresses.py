@@ -0,0 +1,33 @@
+import pytest
+
+from addresses import parse_pages
+
+
+def fields(name, line1, line2, city, state, zip_code):
+    return {'Name': name, 'Address Line 1': line1, 'Address Line 2': line2,
+            'City': city, 'State': state, 'ZIP Code': zip_code}
+
+
+# Letters and the fields the rule-by-rule parser read from them before the rules were compiled
+CASES = [
+    (['Kaiser Permanente', 'California Group Plan', 'line 2 of header', 'line 3 of header',
+      'Jane Doe GROUP 123', '1234 Main Street Apt 5 Health Plan', 'Oakland, CA 94612'],
+     fields('Jane Doe', '1234 Main Street', 'Apt 5', 'Oakland', 'CA', '94612')),
+    (['Hawaii Group', 'header 2', 'John Smith MRN 000', 'PO Box 939001', 'PO Box 1234', 'Honolulu, HI 96813-1234'],
+     fields('John Smith', 'PO Box 1234', '', 'Honolulu', 'HI', '96813-1234')),
+    # Two markers on one line: the longer skip wins
+    (['Member Rights California Group', 'x', 'y', 'Ana Lopez Purchaser', '77 Oak Ave MED 12', 'Denver, CO 80202'],
+     fields('Ana Lopez', '77 Oak Ave', '', 'Denver', 'CO', '80202')),
+    (['Wei Chen', '55 Pine Rd Unit 7 醫療', 'Atlanta, GA 30303'],
+     fields('Wei Chen', '55 Pine Rd', 'Unit 7', 'Atlanta', 'GA', '30303')),
+    (['Nobody here', 'no address at all'],
+     fields('', '', '', '', '', '')),
+    # A one-digit house number isn't an address, the next address block is used
+    (['Sara Kim', '9 Elm St', 'Seattle, WA 98101', 'Other Name', '12 Second St', 'Portland, OR 97201'],
+     fields('Other Name', '12 Second St', '', 'Portland', 'OR', '97201')),
+]
+
+
+@pytest.mark.parametrize('lines, expected', CASES)
+def test_parse_pages(lines, expected):
+    assert parse_pages(['\n'.join(lines)]) == expected
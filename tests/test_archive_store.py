@@ -0,0 +1,78 @@
+import json
+import os
+
+from archive_store import ArchiveStore, file_digest, place_file
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = ArchiveStore(str(tmp_path / 'Complete'))
+    first = write(tmp_path / '12345678_1.zip', b'zip one')
+    again = write(tmp_path / '87654321_1.zip', b'zip one')
+    other = write(tmp_path / '12345678_2.zip', b'zip two')
+
+    digests = [store.add(path, date='2026-10-18') for path in (first, again, other)]
+    assert digests[0] == digests[1] == file_digest(first) != digests[2]
+    assert len(os.listdir(store.blob_folder)) == 2
+
+    # Complete/<name> still holds each zip under its own name
+    for path in (first, again, other):
+        with open(os.path.join(store.folder, os.path.basename(path)), 'rb') as f, open(path, 'rb') as original:
+            assert f.read() == original.read()
+
+
+def test_rerun_adds_nothing_to_the_index(tmp_path):
+    zip_path = write(tmp_path / '12345678_1.zip', b'zip one')
+    ArchiveStore(str(tmp_path / 'Complete')).add(zip_path, date='2026-10-18')
+    ArchiveStore(str(tmp_path / 'Complete')).add(zip_path, date='2026-10-18')
+    ArchiveStore(str(tmp_path / 'Complete')).add(zip_path, date='2026-10-19')
+
+    with open(tmp_path / 'Complete' / 'index.jsonl') as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry['date'] for entry in entries] == ['2026-10-18', '2026-10-19']
+
+
+def test_redelivered_name_points_at_the_new_content(tmp_path):
+    store = ArchiveStore(str(tmp_path / 'Complete'))
+    zip_path = write(tmp_path / '12345678_1.zip', b'first delivery')
+    store.add(zip_path)
+    os.remove(zip_path)
+    zip_path = write(tmp_path / '12345678_1.zip', b'second delivery, different size')
+    store.add(zip_path)
+    with open(os.path.join(store.folder, '12345678_1.zip'), 'rb') as f:
+        assert f.read() == b'second delivery, different size'
+
+
+def test_place_file_copies_the_content(tmp_path):
+    src = write(tmp_path / 'src', b'data' * 1000)
+    method = place_file(src, str(tmp_path / 'dst'))
+    assert method in ('reflink', 'hardlink', 'copy_file_range', 'copy')
+    assert (tmp_path / 'dst').read_bytes() == b'data' * 1000
+    assert not (tmp_path / 'dst.tmp').exists()
+
+
+def test_rewriting_the_inbound_zip_leaves_the_blob_alone(tmp_path):
+    store = ArchiveStore(str(tmp_path / 'Complete'))
+    zip_path = write(tmp_path / '12345678_1.zip', b'first delivery')
+    digest = store.add(zip_path)
+
+    # Redelivered over the same file, same inode
+    with open(zip_path, 'r+b') as f:
+        f.write(b'SECOND')
+    assert file_digest(store.blob_path(digest)) == digest
+    with open(os.path.join(store.folder, '12345678_1.zip'), 'rb') as f:
+        assert f.read() == b'first delivery'
+    assert not os.stat(store.blob_path(digest)).st_mode & 0o222
+
+
+def test_place_file_links_only_when_asked(tmp_path):
+    src = write(tmp_path / 'src', b'data')
+    assert place_file(src, str(tmp_path / 'copied')) != 'hardlink'
+    assert not os.path.samefile(src, tmp_path / 'copied')
+    if place_file(src, str(tmp_path / 'linked'), link=True) == 'hardlink':
+        assert os.path.samefile(src, tmp_path / 'linked')
@@ -0,0 +1,50 @@
+import datetime
+
+from openpyxl import load_workbook
+
+import backfill
+import trying
+
+
+def sheet_rows(path):
+    rows = list(load_workbook(path, read_only=True).active.values)
+    header = rows[0]
+    return [dict(zip(header, row)) for row in rows[1:]]
+
+
+def test_folder_date_is_never_in_the_future():
+    today = datetime.date(2026, 1, 5)
+    assert backfill.folder_date('1.5', today) == datetime.date(2026, 1, 5)
+    assert backfill.folder_date('12.30', today) == datetime.date(2025, 12, 30)
+
+
+def test_folders_in_range_keeps_the_latest_date(tmp_path):
+    for name in ('12.31', '1.1', '1.2', '7.4'):
+        (tmp_path / name).mkdir()
+    days = backfill.folders_in_range(str(tmp_path), datetime.date(2025, 12, 30), datetime.date(2026, 1, 3))
+    assert days == [('12.31', datetime.date(2025, 12, 31)), ('1.1', datetime.date(2026, 1, 1)),
+                    ('1.2', datetime.date(2026, 1, 2))]
+
+    days = backfill.folders_in_range(str(tmp_path), datetime.date(2024, 12, 31), datetime.date(2025, 12, 31))
+    assert days == [('1.1', datetime.date(2025, 1, 1)), ('1.2', datetime.date(2025, 1, 2)),
+                    ('7.4', datetime.date(2025, 7, 4)), ('12.31', datetime.date(2025, 12, 31))]
+
+
+def test_backfill_stamps_each_day_with_its_own_date(tmp_path, make_date_folder):
+    make_date_folder(tmp_path / '10.1', seed=1)
+    make_date_folder(tmp_path / '10.2', orders=3, seed=2)
+    (tmp_path / '10.3').mkdir()
+
+    days = backfill.main(str(tmp_path), datetime.date(2025, 10, 1), datetime.date(2025, 10, 3), workers=1)
+    assert [(day.name, len(day.jobs), day.failed) for day in days] == [('10.1', 4, 0), ('10.2', 6, 0), ('10.3', 0, 0)]
+
+    for name, stamp in (('10.1', '10/01/2025'), ('10.2', '10/02/2025')):
+        rows = sheet_rows(tmp_path / name / 'extracted.xlsx')
+        assert {row['Order Received'] for row in rows} == {stamp}
+
+        # Same rows as a run by hand, apart from the date
+        backfilled = [{**row, 'Order Received': None} for row in rows]
+        trying.process_data_in_date_folder(str(tmp_path / name), workers=1)
+        by_hand = [{**row, 'Order Received': None} for row in sheet_rows(tmp_path / name / 'extracted.xlsx')]
+        assert backfilled == by_hand
+    assert sheet_rows(tmp_path / '10.3' / 'extracted.xlsx') == []
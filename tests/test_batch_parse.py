@@ -0,0 +1,63 @@
+import os
+import random
+
+import pytest
+
+pytest.importorskip('pandas')
+
+import trying
+from batch_parse import compare_parsers, parse_folder, parse_texts, PARSED_FIELDS
+from benchmark import make_recipient
+
+
+def letter_pages(rng, i):
+    recipient = make_recipient(rng, i)
+    lines = ['Kaiser Permanente', 'Member Services', recipient['name'],
+             f'{recipient["street"]}{recipient["unit"]}', recipient['city_line'], f'MRN {recipient["mrn"]}']
+    return ['\n'.join(lines) + '\n']
+
+
+def test_batch_matches_parse_pages():
+    rng = random.Random(3)
+    page_lists = [letter_pages(rng, i) for i in range(200)]
+    # Keywords the address lines are cut at, a second page, a labelled MRN, no MRN at all
+    page_lists += [
+        ['a\nb\nAna Lopez\n12 Main St Apt 4 Medical\nOakland, CA 94612\n'],
+        ['a\nb\nAna B Lopez\n12 Health Rd Co\nDenver, CO\n', 'MRN: 12345678\n'],
+        ['a\nb\nWei Chen\n9 Pine Rd UNIT 12Comprador\nNo comma here\n'],
+        ['a\nb\nLinh Kim\n1 Elm St\nOakland, CA, 94612\nMRN 11-22334455\n'],
+    ]
+    assert compare_parsers(page_lists) == []
+
+    rows = parse_texts(page_lists)
+    assert list(rows.columns) == list(PARSED_FIELDS) and len(rows) == len(page_lists)
+    assert rows.iloc[-4]['Address Line 2'] == 'Apt 4' and rows.iloc[-4]['Address Line'] == '12 Main St'
+
+
+def test_letters_parse_pages_rejects_get_empty_rows():
+    page_lists = [['only\ntwo lines\n'], ['a\nb\nCher\n1 Main St\nOakland, CA\n'], ['a\nb\nAna Lopez\n1 Main St\nOakland, CA\n']]
+    rows = parse_texts(page_lists)
+    assert rows.iloc[0].isna().all() and rows.iloc[1].isna().all()
+    assert rows.iloc[2]['Last Name'] == 'Lopez'
+    assert compare_parsers(page_lists) == []
+    assert parse_texts([]).empty
+
+
+def test_differences_are_reported():
+    page_lists = [['a\nb\nAna Lopez\n1 Main St\nOakland, CA\n']]
+
+    def other(pages):
+        return dict(trying.parse_pages(pages), City='Denver')
+
+    assert compare_parsers(page_lists, other) == [(0, 'City', 'Oakland', 'Denver')]
+
+
+def test_parse_folder(make_date_folder, tmp_path):
+    date_folder = make_date_folder(tmp_path / '1.2', orders=2, letters=3)
+    pdf_paths, rows = parse_folder(date_folder, workers=1)
+    assert len(pdf_paths) == 6 == len(rows)
+    for pdf_path, (_, row) in zip(pdf_paths, rows.iterrows()):
+        assert row.to_dict() == trying.read_pdf(pdf_path)
+
+    order_folder = os.path.join(date_folder, sorted(os.listdir(date_folder))[0])
+    assert parse_folder(order_folder, workers=1)[0] == pdf_paths[:3]
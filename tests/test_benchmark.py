@@ -0,0 +1,29 @@
+import os
+import zipfile
+
+from benchmark import compare, generate_batch
+
+
+def test_generated_batch_looks_like_a_delivery(tmp_path):
+    root = str(tmp_path / 'batch')
+    generate_batch(root, orders=4, letters=2, seed=3)
+    zips = sorted(name for name in os.listdir(root) if name.endswith('.zip'))
+    assert zips and all(name[:8].isdigit() and name[8] == '_' for name in zips)
+    assert os.path.exists(os.path.join(root, 'daily_status.tsv'))
+    assert os.listdir(os.path.join(root, 'status'))
+
+    with zipfile.ZipFile(os.path.join(root, zips[0])) as zf:
+        names = zf.namelist()
+    assert any(name.endswith('.pdf') for name in names)
+
+    # The same seed gives the same batch
+    again = str(tmp_path / 'again')
+    generate_batch(again, orders=4, letters=2, seed=3)
+    assert sorted(os.listdir(again)) == sorted(os.listdir(root))
+
+
+def test_compare_flags_only_real_slowdowns(capsys):
+    baseline = {'a': {'seconds': 1.0}, 'b': {'seconds': 0.010}, 'c': {'seconds': 1.0}}
+    results = {'a': {'seconds': 1.5}, 'b': {'seconds': 0.020}, 'c': {'seconds': 1.05}, 'd': {'seconds': 1.0}}
+    assert compare(results, baseline, tolerance=0.10) == ['a']
+    assert 'SLOWER' in capsys.readouterr().out
@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+import trying
+from benchmark import LETTER_BODY, PLAN_LINES, make_letter, make_pdf, make_recipient
+
+
+@pytest.fixture
+def recipient():
+    return make_recipient(random.Random(4), 0)
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_bounded_read_stops_once_the_fields_are_complete(tmp_path, recipient):
+    pdf_path = write(tmp_path, 'letter.pdf', make_letter(recipient, 3))
+    full = trying.extract_pages(pdf_path)
+    bounded = trying.extract_pages_bounded(pdf_path)
+    assert len(full) == 4 and len(bounded) == 1
+    assert trying.parse_pages(bounded) == trying.parse_pages(full)
+
+
+def test_bounded_read_goes_on_to_the_page_with_the_mrn(tmp_path, recipient):
+    first = PLAN_LINES + [recipient['name'], recipient['street'], recipient['city_line']] + [LETTER_BODY] * 5
+    pdf_path = write(tmp_path, 'letter.pdf', make_pdf([first, [f'MRN {recipient["mrn"]}', LETTER_BODY], [LETTER_BODY]]))
+    bounded = trying.extract_pages_bounded(pdf_path)
+    assert len(bounded) == 2
+    assert trying.parse_pages(bounded) == trying.parse_pages(trying.extract_pages(pdf_path))
+    assert trying.field_pages(trying.extract_pages(pdf_path))['Medical Record Number'] == 2
+
+    # A page cap wins over the fields
+    assert len(trying.extract_pages_bounded(pdf_path, max_pages=1)) == 1
@@ -0,0 +1,55 @@
+import datetime
+import random
+import xml.etree.ElementTree as ET
+
+from business_days import BusinessCalendar, federal_holidays, read_holidays_file
+from fulfillment_xml import FULFILLMENT_FIELDS, render_fulfillment
+
+
+def step_forward(date, days, closed):
+    # One day at a time, skipping weekends and closed days, like the old add_business_days
+    while days > 0:
+        date += datetime.timedelta(days=1)
+        if date.weekday() < 5 and date not in closed:
+            days -= 1
+    return date
+
+
+def test_add_days_matches_stepping_forward():
+    rng = random.Random(7)
+    extra = [datetime.date(2026, 12, 24), datetime.date(2027, 1, 2)]
+    calendar = BusinessCalendar(extra)
+    dates = [datetime.date(2025, 1, 1) + datetime.timedelta(days=rng.randrange(900)) for _ in range(300)]
+    closed = set(extra) | {day for year in (2024, 2025, 2026, 2027, 2028) for day in federal_holidays(year)}
+    for days in (1, 5):
+        assert calendar.add_days(dates, days) == [step_forward(date, days, closed) for date in dates]
+
+
+def test_without_federal_holidays_only_weekends_are_closed():
+    calendar = BusinessCalendar(federal=False)
+    thanksgiving = datetime.date(2026, 11, 26)
+    assert calendar.add_days([datetime.datetime(2026, 11, 25, 9, 30)], 1) == [thanksgiving]
+    assert BusinessCalendar().add_days([datetime.date(2026, 11, 25)], 1) == [datetime.date(2026, 11, 27)]
+    assert calendar.add_days([], 5) == []
+
+
+def test_federal_holidays_are_observed_on_weekdays():
+    holidays = federal_holidays(2026)
+    assert datetime.date(2026, 7, 3) in holidays  # July 4th is a Saturday
+    assert datetime.date(2026, 11, 26) in holidays  # Thanksgiving
+    assert datetime.date(2026, 5, 25) in holidays  # Memorial Day, the last Monday of May
+    assert all(day.weekday() < 5 for day in holidays)
+
+
+def test_read_holidays_file(tmp_path):
+    path = tmp_path / 'holidays.txt'
+    path.write_text('# plant closures\n2026-12-24\n\n2026-12-31  # New Year\'s Eve\n')
+    assert read_holidays_file(str(path)) == [datetime.date(2026, 12, 24), datetime.date(2026, 12, 31)]
+
+
+def test_render_matches_elementtree():
+    row = ['N', '12345678', 'Received', '2026-10-18', '2026-10-23', 'USPS', '', 'a < b & "c"', None, 'Ünïcode']
+    root = ET.Element('fulfillment')
+    for tag, text in zip(FULFILLMENT_FIELDS, row):
+        ET.SubElement(root, tag).text = text
+    assert render_fulfillment(row) == ET.tostring(root)
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import cli
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_status_loads_no_pdf_or_spreadsheet_modules(tmp_path):
+    for part in (1, 2):
+        with zipfile.ZipFile(tmp_path / f'20000000_done_{part}.zip', 'w') as zf:
+            zf.writestr(f's{part}.xml', f'<status><details><orderId>3000000{part}</orderId></details></status>')
+    code = ('import sys, cli; cli.main(["status", sys.argv[1]]); '
+            'print(sorted(m for m in ("pdfplumber", "pdfminer", "openpyxl", "pandas", "tkinter") if m in sys.modules))')
+    result = subprocess.run([sys.executable, '-c', code, str(tmp_path)], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+
+
+def test_unknown_directory_is_rejected(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        cli.main(['split', str(tmp_path / 'missing')])
+    assert 'is not a directory' in capsys.readouterr().err
+
+
+def test_backfill_needs_folders_or_a_start(tmp_path):
+    with pytest.raises(SystemExit, match='needs date folders'):
+        cli.main(['backfill', str(tmp_path)])
+    (tmp_path / 'notes').mkdir()
+    with pytest.raises(SystemExit, match='not an M.D date folder'):
+        cli.main(['backfill', str(tmp_path), 'notes'])
+
+
+def test_ledger_export(tmp_path, capsys):
+    (tmp_path / 'daily_status.tsv').write_text('N\t12345678\tReceived\t2026-10-16\t2026-10-23\tUSPS\t\t\t\t\n')
+    output = tmp_path / 'export.tsv'
+    assert cli.main(['ledger', str(tmp_path), '-o', str(output), '--status', 'Received']) == 0
+    assert '1 orders written' in capsys.readouterr().out
+    assert output.read_text().split('\t')[1] == '12345678'
@@ -0,0 +1,20 @@
+import os
+import shutil
+
+import pandas as pd
+
+import trying
+
+
+def test_worker_pool_writes_the_same_spreadsheet(tmp_path, make_date_folder):
+    serial = make_date_folder(tmp_path / 'serial', orders=3, letters=3)
+    pooled = str(tmp_path / 'pooled')
+    shutil.copytree(serial, pooled)
+
+    trying.process_data_in_date_folder(serial, workers=1)
+    trying.process_data_in_date_folder(pooled, workers=2)
+
+    rows = pd.read_excel(os.path.join(serial, 'extracted.xlsx'), dtype=str).fillna('')
+    assert len(rows) == 9
+    assert rows.equals(pd.read_excel(os.path.join(pooled, 'extracted.xlsx'), dtype=str).fillna(''))
+    assert rows['Medical Record Number'].str.len().gt(0).all()
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from instrumentation import RunReport, count_event, take_counts
+
+
+def test_report_has_stages_counters_and_slowest_files(tmp_path):
+    report = RunReport('test', str(tmp_path / 'report.json'), str(tmp_path / 'progress.jsonl'), slowest=2)
+    with report.stage('extract', total=3):
+        for path, seconds in (('a.pdf', 0.1), ('b.pdf', 0.3), ('c.pdf', 0.2)):
+            report.file_done(path, seconds, failed=path == 'c.pdf', counts={'pages.raw': 2})
+    report.count('pages.pdfplumber', 2)
+    report.failure('extract', 'c.pdf', ValueError('bad'))
+    with open(report.save()) as f:
+        data = json.load(f)
+
+    assert [stage['name'] for stage in data['stages']] == ['extract']
+    assert data['stages'][0]['files'] == 3
+    assert data['counters'] == {'files': 3, 'pages.raw': 6, 'files_failed': 1, 'pages.pdfplumber': 2, 'failures': 1}
+    assert data['mean_file_seconds'] == 0.2
+    assert data['page_tiers'] == {'raw': 0.75, 'pdfplumber': 0.25}
+    assert [entry['path'] for entry in data['slowest_files']] == ['b.pdf', 'c.pdf']
+    assert data['failures'] == [{'stage': 'extract', 'item': 'c.pdf', 'error': 'bad'}]
+
+    # The stage's end always makes it into the progress stream
+    with open(tmp_path / 'progress.jsonl') as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[-1]['event'] == 'stage_done' and lines[-1]['done'] == 3 and lines[-1]['total'] == 3
+
+
+def test_failed_stage_is_recorded(tmp_path):
+    report = RunReport('test')
+    with pytest.raises(KeyError):
+        with report.stage('inventory'):
+            raise KeyError('x')
+    assert report.stages[0]['error'] == "KeyError: 'x'"
+    assert report.save() is None  # Nowhere to write it
+
+
+def test_counts_are_taken_once():
+    take_counts()
+    count_event('pages.layout')
+    count_event('pages.layout', 2)
+    assert take_counts() == {'pages.layout': 3}
+    assert take_counts() == {}
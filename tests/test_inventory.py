@@ -0,0 +1,48 @@
+import os
+import zipfile
+
+import trying
+from inventory import Inventory, is_order_folder, scan_order_folders
+
+
+def snapshot(inventory):
+    return {name: (sorted(contents.pdfs), sorted(contents.xmls), sorted(contents.xml_refs))
+            for name, contents in inventory.folders.items()}
+
+
+def test_kept_up_to_date_through_the_stages(tmp_path):
+    main_directory = str(tmp_path)
+    for order_id, letters in (('12345678', 3), ('87654321', 1)):
+        for part in (1, 2):
+            with zipfile.ZipFile(tmp_path / f'{order_id}_{part}.zip', 'w') as zf:
+                if part == 1:
+                    zf.writestr(f'order_{order_id}.xml', '<order/>')
+                for i in range(letters):
+                    zf.writestr(f'letter_{part}_{i}.pdf', b'%PDF')
+    (tmp_path / 'notes').mkdir()
+
+    inventory = Inventory(main_directory)
+    assert inventory.zip_files() == ['12345678_1.zip', '12345678_2.zip', '87654321_1.zip', '87654321_2.zip']
+    trying.extract_and_combine_zips(main_directory, inventory=inventory)
+    trying.separate_pdf_files(main_directory, inventory=inventory)
+
+    # What the stages recorded is what a fresh listing finds
+    assert snapshot(inventory) == snapshot(Inventory(main_directory))
+    assert inventory.order_folders() == ['12345678', '87654321']
+    assert inventory.split_folders_of('12345678') == [f'12345678.{k}' for k in range(2, 7)]
+    assert all(len(contents.pdfs) == 1 for contents in inventory.folders.values())
+
+
+def test_scan_order_folders(tmp_path):
+    (tmp_path / '12345678').mkdir()
+    (tmp_path / '12345678' / 'a.pdf').write_bytes(b'%PDF')
+    (tmp_path / '12345678' / 'a.xml.ref').write_text('../x.xml')
+    (tmp_path / 'extracted.xlsx').write_bytes(b'')
+    folders = scan_order_folders(str(tmp_path))
+    assert list(folders) == ['12345678']
+    assert folders['12345678'].pdfs == {'a.pdf'} and folders['12345678'].xml_refs == {'a.xml.ref'}
+
+
+def test_is_order_folder():
+    assert is_order_folder('12345678') and is_order_folder('12345678.12')
+    assert not is_order_folder('Complete') and not is_order_folder('10.18') and not is_order_folder('12345678.x')
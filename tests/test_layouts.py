@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+import layouts
+import folder_excel
+from benchmark import LETTER_BODY, PLAN_LINES, make_letter, make_pdf, make_recipient
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = layouts.LayoutStore(str(tmp_path / 'layouts.json'))
+    monkeypatch.setattr(layouts, 'LAYOUTS_MODE', 'on')
+    monkeypatch.setattr(layouts, 'get_store', lambda: store)
+    return store
+
+
+def write_letter(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def read(pdf_path):
+    _, extract = layouts.layout_extractor('folder_excel', 'all-pages', folder_excel.extract_pages,
+                                          folder_excel.parse_pages, folder_excel.fields_found)
+    return extract(pdf_path)
+
+
+def test_learned_layout_reads_the_same_fields(tmp_path, store):
+    rng = random.Random(1)
+    first = write_letter(tmp_path / 'a.pdf', make_letter(make_recipient(rng, 0), 1))
+    second = write_letter(tmp_path / 'b.pdf', make_letter(make_recipient(rng, 1), 1))
+
+    read(first)
+    assert store.candidates('folder_excel', '612x792')
+    pages = read(second)
+    assert len(pages) == 1  # The top strip of the first page only
+    assert folder_excel.parse_pages(pages) == folder_excel.parse_pages(folder_excel.extract_pages(second))
+
+
+def test_letter_that_cannot_be_learned_is_not_read_again(tmp_path, store, monkeypatch):
+    rng = random.Random(2)
+    recipient = make_recipient(rng, 0)
+    no_mrn = [PLAN_LINES + [recipient['name'], recipient['street'], recipient['city_line']] + [LETTER_BODY] * 5]
+    pdf_path = write_letter(tmp_path / 'a.pdf', make_pdf(no_mrn))
+
+    learned = []
+    monkeypatch.setattr(layouts, 'learn_template', lambda *args: learned.append(args))
+    read(pdf_path)
+    assert learned == []
+    assert store.templates == {}
+
+
+def test_layout_that_failed_to_learn_is_not_retried(tmp_path, store, monkeypatch):
+    rng = random.Random(3)
+    paths = [write_letter(tmp_path / f'{i}.pdf', make_letter(make_recipient(rng, i), 0)) for i in range(3)]
+
+    learned = []
+    monkeypatch.setattr(layouts, 'learn_template', lambda *args: learned.append(args))
+    for pdf_path in paths:
+        read(pdf_path)
+    assert len(learned) == 1
+
+
+def test_layouts_live_in_the_run_directory(tmp_path, monkeypatch):
+    import pdf_cache
+    monkeypatch.setattr(layouts, 'LAYOUTS_MODE', 'on')
+    monkeypatch.setattr(layouts, 'LAYOUTS_PATH', None)
+    monkeypatch.setattr(pdf_cache, 'CACHE_DIR', None)
+    monkeypatch.setattr(layouts, '_store', None)
+    rng = random.Random(4)
+    first = write_letter(tmp_path / 'a.pdf', make_letter(make_recipient(rng, 0), 0))
+    second = write_letter(tmp_path / 'b.pdf', make_letter(make_recipient(rng, 1), 0))
+
+    # No run directory, nothing is learned or written anywhere
+    assert layouts.get_store() is None
+    read(first)
+    read(second)
+    assert layouts.get_store() is None and not list(tmp_path.rglob(layouts.LAYOUTS_NAME))
+
+    run_directory = tmp_path / 'run'
+    run_directory.mkdir()
+    monkeypatch.setattr(pdf_cache, 'CACHE_DIR', str(run_directory))
+    read(first)
+    assert (run_directory / layouts.LAYOUTS_NAME).exists()
+    assert layouts.get_store().candidates('folder_excel', '612x792')
+
+    # cli.py clear-cache removes it with the PDF cache
+    import cli
+    cli.main(['clear-cache', str(run_directory)])
+    assert not (run_directory / layouts.LAYOUTS_NAME).exists()
+    assert layouts.clear_layouts(str(run_directory)) is None
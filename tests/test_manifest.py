@@ -0,0 +1,77 @@
+import pytest
+
+import manifest as manifest_module
+from manifest import RunManifest, order_of, run_item
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'run_manifest.json')
+
+
+def test_rerun_skips_finished_items_and_retries_failed_ones(path):
+    calls = []
+
+    def work(item):
+        calls.append(item)
+        if item == '12345678_b.zip':
+            raise OSError('disk full')
+        return item
+
+    manifest = RunManifest(path, run_date='2026-10-18')
+    manifest.start_step('copy')
+    for item in ('12345678_a.zip', '12345678_b.zip'):
+        run_item(manifest, 'copy', item, work, item)
+    manifest.finish_step('copy')
+    assert manifest.step('copy')['status'] == 'incomplete'
+    assert manifest.failures() == [('copy', '12345678_b.zip', 'OSError: disk full')]
+
+    # The next run on the same day picks up the manifest and only redoes the failed item
+    rerun = RunManifest(path, run_date='2026-10-18')
+    for item in ('12345678_a.zip', '12345678_b.zip'):
+        run_item(rerun, 'copy', item, lambda item: calls.append(item), item)
+    assert calls == ['12345678_a.zip', '12345678_b.zip', '12345678_b.zip']
+
+
+def test_manifest_of_another_day_is_ignored(path):
+    manifest = RunManifest(path, run_date='2026-10-17')
+    manifest.start_step('copy')
+    manifest.finish_step('copy')
+    assert RunManifest(path, run_date='2026-10-18').data['steps'] == {}
+    assert RunManifest(path, run_date='2026-10-17').is_step_done('copy')
+
+
+def test_order_that_failed_elsewhere_is_held(path):
+    manifest = RunManifest(path)
+    manifest.mark_failed('extract', '12345678_a.zip', 'BadZipFile: truncated')
+    assert run_item(manifest, 'separate', '12345678.2', lambda: 'ran') is None
+    assert manifest.step('separate')['items']['12345678.2'] == {'status': 'held', 'error': 'waiting for extract'}
+    assert run_item(manifest, 'separate', '87654321', lambda: 'ran') == 'ran'
+
+
+def test_step_after_an_open_one_stays_open(path):
+    manifest = RunManifest(path)
+    manifest.mark_failed('extract', '12345678_a.zip', 'error')
+    manifest.finish_step('extract')
+    manifest.finish_step('separate')
+    assert manifest.step('separate')['status'] == 'incomplete'
+
+
+def test_without_a_manifest_errors_propagate():
+    with pytest.raises(ValueError):
+        run_item(None, 'copy', 'x', int, 'not a number')
+
+
+def test_item_saves_are_throttled(path, monkeypatch):
+    manifest = RunManifest(path)
+    manifest.start_step('copy')
+    monkeypatch.setattr(manifest_module, 'SAVE_INTERVAL', 3600)
+    manifest.mark_done('copy', 'a')
+    assert not RunManifest(path).is_done('copy', 'a')
+    manifest.finish_step('copy')
+    assert RunManifest(path).is_done('copy', 'a')
+
+
+def test_order_of():
+    assert order_of('12345678_a.zip') == order_of('12345678.3') == '12345678'
+    assert order_of('XML') is None
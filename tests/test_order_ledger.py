@@ -0,0 +1,77 @@
+import os
+import zipfile
+
+from order_ledger import OrderLedger, open_ledger
+import status_feedback
+
+
+def row(order_id, status='Received', received='2026-10-16'):
+    return ['N', order_id, status, received, '2026-10-23', 'USPS', '', '', '', '']
+
+
+def test_rerun_changes_nothing(tmp_path):
+    ledger = OrderLedger(str(tmp_path / 'ledger.sqlite3'))
+    rows = [row('10000001'), row('10000002')]
+    assert len(ledger.upsert(rows)) == 2
+    assert ledger.upsert(rows) == []
+    assert [list(r) for r in ledger.rows()] == rows
+
+
+def test_changed_row_replaces_and_moves_to_the_end(tmp_path):
+    ledger = OrderLedger(str(tmp_path / 'ledger.sqlite3'))
+    ledger.upsert([row('10000001'), row('10000002')])
+    assert ledger.upsert([row('10000001', status='Shipped')]) == [tuple(row('10000001', status='Shipped'))]
+    assert [r[1:3] for r in ledger.rows()] == [('10000002', 'Received'), ('10000001', 'Shipped')]
+    assert [r[1] for r in ledger.rows(status='Received')] == ['10000002']
+
+
+def test_export_and_import_round_trip(tmp_path):
+    ledger = OrderLedger(str(tmp_path / 'ledger.sqlite3'))
+    rows = [row('10000001', received='2026-10-15'), row('10000002')]
+    ledger.upsert(rows)
+    tsv_path = str(tmp_path / 'export.tsv')
+    assert ledger.export_tsv(tsv_path, received_from='2026-10-16') == 1
+    ledger.close()
+
+    # A new ledger is filled from the TSV the first time it is opened
+    os.makedirs(tmp_path / 'other')
+    os.replace(tsv_path, tmp_path / 'other' / 'daily_status.tsv')
+    other = open_ledger(str(tmp_path / 'other'), str(tmp_path / 'other' / 'daily_status.tsv'))
+    assert [list(r) for r in other.rows()] == [rows[1]]
+
+
+def test_status_feedback_writes_one_line_per_xml(tmp_path):
+    directory = str(tmp_path)
+    order = '<status><details><orderId>30000001</orderId><vendorIndicator>N</vendorIndicator></details></status>'
+    unknown = '<status><details><vendorIndicator>N</vendorIndicator></details></status>'
+    for part, members in ((1, {'a.xml': order, 'b.xml': unknown}), (2, {'c.xml': order, 'd.xml': unknown})):
+        with zipfile.ZipFile(os.path.join(directory, f'20000000_done_{part}.zip'), 'w') as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+
+    status_feedback.process_zip_files(directory, workers=1)
+    daily_folder = status_feedback.create_daily_folder(directory)
+    with open(os.path.join(daily_folder, 'daily_status.tsv')) as f:
+        order_ids = [line.split('\t')[1] for line in f]
+    assert sorted(order_ids) == ['30000001', '30000001', 'Unknown', 'Unknown']
+
+
+def test_tsv_is_imported_into_a_ledger_created_before(tmp_path):
+    directory = str(tmp_path)
+    tsv_path = str(tmp_path / 'daily_status.tsv')
+    with open(tsv_path, 'w') as f:
+        f.write('\t'.join(row('10000001')) + '\n')
+
+    # status_feedback creates the ledger without the TSV, the next open with it still imports it
+    ledger = open_ledger(directory)
+    ledger.upsert([row('10000002', status='Shipped')])
+    ledger.close()
+    ledger = open_ledger(directory, tsv_path)
+    assert sorted(r[1] for r in ledger.rows()) == ['10000001', '10000002']
+    ledger.upsert([row('10000001', status='Shipped')])
+    ledger.close()
+
+    # Only once: a later open doesn't bring the old TSV line back over the newer row
+    ledger = open_ledger(directory, tsv_path)
+    assert ledger.get('10000001')[2] == 'Shipped'
+    ledger.close()
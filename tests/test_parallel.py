@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import parallel
+from parallel import JobFailed, imap_ordered, imap_unordered, largest_first
+
+
+def slow_square(n, delay):
+    time.sleep(delay)
+    return n * n
+
+
+def fail_on_three(n):
+    if n == 3:
+        raise ValueError('three')
+    return n
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_imap_ordered_yields_in_job_order(workers):
+    # Later jobs finish first, the results still come back in job order
+    jobs = [(n, 0.05 if n < 2 else 0.0) for n in range(12)]
+    assert list(imap_ordered(slow_square, jobs, workers)) == [n * n for n in range(12)]
+
+
+def test_imap_ordered_streams_with_a_bounded_window(monkeypatch):
+    # The first result is handed out before the later jobs are submitted
+    monkeypatch.setattr(parallel, 'WINDOW_PER_WORKER', 1)
+    submitted = []
+    real_submit = parallel.ProcessPoolExecutor.submit
+
+    def submit(self, func, *args):
+        submitted.append(args)
+        return real_submit(self, func, *args)
+
+    monkeypatch.setattr(parallel.ProcessPoolExecutor, 'submit', submit)
+    results = imap_ordered(slow_square, [(n, 0.0) for n in range(10)], 2)
+    assert next(results) == 0
+    assert len(submitted) == 2
+    assert list(results) == [n * n for n in range(1, 10)]
+    assert len(submitted) == 10
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_keep_going_yields_job_failed(workers):
+    results = list(imap_ordered(fail_on_three, [(n,) for n in range(5)], workers, keep_going=True))
+    assert results[:3] == [0, 1, 2] and results[4] == 4
+    assert isinstance(results[3], JobFailed) and 'three' in results[3].error
+
+
+def test_timed_results_carry_seconds_and_counts():
+    (result, seconds, counts), = imap_ordered(slow_square, [(4, 0.0)], 1, timed=True)
+    assert result == 16 and seconds >= 0 and isinstance(counts, dict)
+
+
+def test_imap_unordered_reports_every_job_index():
+    results = dict(imap_unordered(slow_square, [(n, 0.0) for n in range(6)], 2))
+    assert results == {n: n * n for n in range(6)}
+
+
+def test_largest_first(tmp_path):
+    paths = []
+    for size in (10, 30, 20):
+        path = tmp_path / f'{size}.pdf'
+        path.write_bytes(b'x' * size)
+        paths.append((str(path),))
+    assert largest_first(paths) == [1, 2, 0]
+
+
+def test_imap_ordered_starts_the_biggest_files_in_the_window_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel, 'WINDOW_PER_WORKER', 2)
+    submitted = []
+    real_submit = parallel.ProcessPoolExecutor.submit
+
+    def submit(self, func, *args):
+        submitted.append(args[0])
+        return real_submit(self, func, *args)
+
+    monkeypatch.setattr(parallel.ProcessPoolExecutor, 'submit', submit)
+    sizes = [1, 5, 3, 8, 2, 9, 4, 7]
+    jobs = []
+    for i, size in enumerate(sizes):
+        path = tmp_path / f'{i}.pdf'
+        path.write_bytes(b'x' * size)
+        jobs.append((str(path),))
+
+    assert list(imap_ordered(parallel.file_size, jobs, 2)) == sizes
+    order = [sizes[jobs.index((path,))] for path in submitted]
+    # Window of 4: the first four by size, then each slot freed by a yield takes the job that
+    # came into the window, or a bigger one still waiting
+    assert order == [8, 5, 3, 1, 2, 9, 4, 7]
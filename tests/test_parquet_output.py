@@ -0,0 +1,64 @@
+import os
+import glob
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.parquet  # noqa: E402
+
+from parquet_output import ParquetDataset  # noqa: E402
+from sheet_writer import EXTRACTED_COLUMNS  # noqa: E402
+
+
+def make_rows(received, count, start=0):
+    rows = []
+    for i in range(start, start + count):
+        row = {column: '' for column in EXTRACTED_COLUMNS}
+        row.update({'Order ID': f'{10000000 + i}', 'Order Received': received, 'Qty': '1', 'IsKit': '0'})
+        rows.append(row)
+    return rows
+
+
+def dataset_rows(dataset_path):
+    files = sorted(glob.glob(os.path.join(dataset_path, 'order_received=*', '*.parquet')))
+    return files, sum(pyarrow.parquet.read_metadata(path).num_rows for path in files)
+
+
+def write(dataset_path, source, rows):
+    with ParquetDataset(dataset_path, source) as dataset:
+        dataset.write_all(rows)
+
+
+def test_rerun_replaces_rows_in_every_partition(tmp_path):
+    dataset_path = str(tmp_path / 'dataset')
+    source = str(tmp_path / '10.1')
+    write(dataset_path, source, make_rows('10/01/2025', 3))
+    write(dataset_path, str(tmp_path / '10.2'), make_rows('10/02/2025', 2, start=10))
+
+    # Same rows again, same partition
+    write(dataset_path, source, make_rows('10/01/2025', 3))
+    assert dataset_rows(dataset_path)[1] == 5
+
+    # Rerun on another day: the rows move to that day's partition, the old file goes
+    write(dataset_path, source, make_rows('10/18/2025', 3))
+    files, count = dataset_rows(dataset_path)
+    assert count == 5
+    assert sorted(os.path.basename(os.path.dirname(path)) for path in files) == [
+        'order_received=2025-10-02', 'order_received=2025-10-18']
+
+    table = pyarrow.parquet.read_table(files[-1])
+    assert table.schema.field('Order Received').type == pa.date32()
+    assert table.schema.field('Qty').type == pa.int32()
+
+
+def test_failed_run_keeps_the_earlier_files(tmp_path):
+    dataset_path = str(tmp_path / 'dataset')
+    source = str(tmp_path / '10.1')
+    write(dataset_path, source, make_rows('10/01/2025', 3))
+    with pytest.raises(RuntimeError):
+        with ParquetDataset(dataset_path, source, row_group_rows=1) as dataset:
+            dataset.write_all(make_rows('10/05/2025', 2))
+            raise RuntimeError('interrupted')
+    files, count = dataset_rows(dataset_path)
+    assert count == 3
+    assert not glob.glob(os.path.join(dataset_path, '*', '.*.tmp'))
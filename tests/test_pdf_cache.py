@@ -0,0 +1,145 @@
+import pytest
+
+import page_memory
+import pdf_cache
+from benchmark import make_pdf
+from instrumentation import take_counts
+from page_memory import cut_short, read_page_texts
+from pdf_cache import PdfCache, read_cached, read_pages_cached
+from raw_text import extract_raw_pages
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = PdfCache(str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(pdf_cache, 'get_cache', lambda: cache)
+    monkeypatch.setattr(pdf_cache, 'CACHE_MODE', 'on')
+    yield cache
+    cache.db.close()
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / 'letter.pdf'
+    path.write_bytes(make_pdf([['page one'], ['page two'], ['page three']]))
+    return str(path)
+
+
+class Recorder:
+    def __init__(self, pages=('a', 'b'), reason=None):
+        self.pages = list(pages)
+        self.reason = reason
+        self.extracted = 0
+        self.parsed = 0
+
+    def extract(self, pdf_path):
+        self.extracted += 1
+        if self.reason:
+            cut_short(self.reason)
+        return self.pages
+
+    def parse(self, pages):
+        self.parsed += 1
+        return {'text': ''.join(pages)}
+
+
+def test_second_read_is_a_hit(cache, pdf_path):
+    recorder = Recorder()
+    for _ in range(2):
+        assert read_cached(pdf_path, 'x', recorder.extract, 'p1', recorder.parse) == {'text': 'ab'}
+    assert (recorder.extracted, recorder.parsed) == (1, 1)
+
+    # A new parser version reuses the stored pages
+    assert read_cached(pdf_path, 'x', recorder.extract, 'p2', recorder.parse) == {'text': 'ab'}
+    assert (recorder.extracted, recorder.parsed) == (1, 2)
+    assert read_pages_cached(pdf_path, 'x', recorder.extract) == ['a', 'b']
+    assert recorder.extracted == 1
+
+
+def test_refresh_reads_again(cache, pdf_path, monkeypatch):
+    recorder = Recorder()
+    read_cached(pdf_path, 'x', recorder.extract, 'p1', recorder.parse)
+    monkeypatch.setattr(pdf_cache, 'CACHE_MODE', 'refresh')
+    read_cached(pdf_path, 'x', recorder.extract, 'p1', recorder.parse)
+    assert recorder.extracted == 2
+
+
+@pytest.mark.parametrize('reason', ['reads.reduced', 'reads.over_budget'])
+def test_reads_cut_short_are_not_stored(cache, pdf_path, reason):
+    short = Recorder(pages=['a'], reason=reason)
+    assert read_cached(pdf_path, 'x', short.extract, 'p1', short.parse) == {'text': 'a'}
+    assert read_pages_cached(pdf_path, 'x', short.extract) == ['a']
+    assert short.extracted == 2
+
+    # The next whole read is stored as usual
+    whole = Recorder()
+    read_cached(pdf_path, 'x', whole.extract, 'p1', whole.parse)
+    read_cached(pdf_path, 'x', whole.extract, 'p1', whole.parse)
+    assert whole.extracted == 1
+
+
+def test_large_file_limit_is_counted_once_per_file(pdf_path, monkeypatch):
+    monkeypatch.setattr(page_memory, 'LARGE_FILE_MB', 1e-6)  # Every file is "large"
+    take_counts()
+
+    def both_tiers(path):
+        extract_raw_pages(path)
+        return read_page_texts(path)
+
+    assert read_cached(pdf_path, 'x', both_tiers, 'p', len) == page_memory.REDUCED_PAGES
+    assert take_counts().get('reads.reduced') == 1
+
+    # A caller that only wants the first page loses nothing to the limit
+    page_memory.take_cut_short()
+    assert read_page_texts(pdf_path, max_pages=1) == ['page one']
+    assert page_memory.take_cut_short() == set()
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = PdfCache(str(tmp_path / 'cache.sqlite3'), max_bytes=300)
+    for i in range(5):
+        cache.put_pages(f'digest{i}', 'x', ['y' * 100])
+        cache.get_pages('digest0', 'x')  # Keep the first one in use
+    cache.evict()
+    assert cache.size() <= 300
+    assert cache.get_pages('digest0', 'x') is not None
+    assert cache.get_pages('digest1', 'x') is None
+    cache.db.close()
+
+
+def test_cache_lives_in_the_run_directory(tmp_path, monkeypatch, pdf_path):
+    monkeypatch.setattr(pdf_cache, 'CACHE_MODE', 'on')
+    monkeypatch.setattr(pdf_cache, 'CACHE_PATH', None)
+    monkeypatch.setattr(pdf_cache, 'CACHE_DIR', None)
+    monkeypatch.setattr(pdf_cache, '_cache', None)
+    monkeypatch.setenv('PDF_CACHE_DIR', '')
+    monkeypatch.delenv('PDF_CACHE_DIR')
+    assert pdf_cache.get_cache() is None  # No run directory, nothing is cached
+
+    run_directory = tmp_path / 'run'
+    run_directory.mkdir()
+    pdf_cache.use_directory(str(run_directory))
+    recorder = Recorder()
+    read_cached(pdf_path, 'x', recorder.extract, 'p1', recorder.parse)
+    assert (run_directory / pdf_cache.CACHE_NAME).exists()
+    pdf_cache.get_cache().db.close()
+    monkeypatch.setattr(pdf_cache, '_cache', None)
+
+    # cli.py clear-cache empties it
+    import cli
+    cli.main(['clear-cache', str(run_directory)])
+    read_cached(pdf_path, 'x', recorder.extract, 'p1', recorder.parse)
+    assert recorder.extracted == 2
+    pdf_cache.get_cache().db.close()
+
+
+def test_entries_expire(tmp_path, monkeypatch):
+    cache = PdfCache(str(tmp_path / 'cache.sqlite3'), max_days=1)
+    cache.put_pages('old', 'x', ['y'])
+    cache.put_pages('new', 'x', ['y'])
+    with cache.db:
+        cache.db.execute("UPDATE pages SET used = used - 2 * 86400 WHERE digest = 'old'")
+    cache.evict()
+    assert cache.get_pages('old', 'x') is None
+    assert cache.get_pages('new', 'x') == ['y']
+    cache.db.close()
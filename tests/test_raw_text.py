@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+import trying
+from benchmark import make_letter, make_recipient
+from instrumentation import take_counts
+from raw_text import extract_raw_pages, extract_tiered
+
+
+@pytest.fixture
+def recipient():
+    return make_recipient(random.Random(4), 0)
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_raw_text_reads_like_pdfplumber(tmp_path):
+    rng = random.Random(9)
+    for i in range(5):
+        pdf_path = write(tmp_path, f'{i}.pdf', make_letter(make_recipient(rng, i), i % 3))
+        assert extract_raw_pages(pdf_path) == trying.extract_pages(pdf_path)
+
+
+def test_tiered_falls_back_when_the_raw_fields_are_incomplete(tmp_path, recipient):
+    pdf_path = write(tmp_path, 'letter.pdf', make_letter(recipient, 0))
+    fallback_calls = []
+
+    def fallback(path):
+        fallback_calls.append(path)
+        return ['from the fallback']
+
+    take_counts()
+    pages = extract_tiered(pdf_path, extract_raw_pages, fallback, trying.parse_pages, trying.fields_found)
+    assert pages == trying.extract_pages(pdf_path) and fallback_calls == []
+    assert take_counts().get('pages.raw') == 1
+
+    never = lambda info: False
+    assert extract_tiered(pdf_path, extract_raw_pages, fallback, trying.parse_pages, never) == ['from the fallback']
+    broken = lambda path: 1 / 0
+    assert extract_tiered(pdf_path, broken, fallback, trying.parse_pages, trying.fields_found) == ['from the fallback']
@@ -0,0 +1,51 @@
+import os
+
+from recipients import RecipientIndex, load_recipient_index, normalize_address
+
+
+ORDER_XML = ('<order><details><orderId>12345678</orderId></details><recipients>'
+             '<recipient><mailadr1>123 Main St</mailadr1><sku>A1</sku><DOCID>D1</DOCID><region_cd>NCA</region_cd></recipient>'
+             '<recipient><mailadr1>123 Main St Apt 4</mailadr1><sku>A2</sku><DOCID>D2</DOCID><region_cd>SCA</region_cd></recipient>'
+             '<recipient><mailadr1>77 Oak Avenue</mailadr1><sku>A3</sku><DOCID>D3</DOCID></recipient>'
+             '<recipient><sku>no address</sku></recipient>'
+             '</recipients></order>')
+
+
+def write_xml(tmp_path, text=ORDER_XML):
+    path = tmp_path / 'order.xml'
+    path.write_text(text)
+    return str(path)
+
+
+def test_lookup_by_address(tmp_path):
+    index = RecipientIndex.from_xml(write_xml(tmp_path))
+    assert index.order_id == '12345678'
+    assert len(index.recipients) == 3
+
+    # The same address in another case and spacing beats an earlier recipient with the same start
+    assert index.lookup('123 MAIN ST.  APT 4')['SKU'] == 'A2'
+    # Otherwise the first recipient with the same first 4 characters, like read_xml always did
+    assert index.lookup('123 Elsewhere')['SKU'] == 'A1'
+    # A slip in the address still finds the closest one
+    assert index.lookup('77 0ak Avenue') == {'SKU': 'A3', 'DOCID': 'D3', 'Region': ''}
+    assert index.lookup('9 Unrelated Road') is None
+
+
+def test_order_without_details(tmp_path):
+    index = RecipientIndex.from_xml(write_xml(tmp_path, '<order><recipients></recipients></order>'))
+    assert index.order_id == 'No ID'
+    assert index.lookup('123 Main St') is None
+
+
+def test_changed_file_is_parsed_again(tmp_path):
+    path = write_xml(tmp_path)
+    assert load_recipient_index(path) is load_recipient_index(path)
+    with open(path, 'w') as f:
+        f.write(ORDER_XML.replace('12345678', '87654321') + ' ')
+    os.utime(path, ns=(0, 0))
+    assert load_recipient_index(path).order_id == '87654321'
+
+
+def test_normalize_address():
+    assert normalize_address('123 Main St.') == normalize_address(' 123  MAIN st ') == '123 MAIN ST'
+    assert normalize_address(None) == ''
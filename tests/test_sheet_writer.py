@@ -0,0 +1,42 @@
+import openpyxl
+import pandas as pd
+import pytest
+
+from sheet_writer import EXTRACTED_COLUMNS, SheetWriter
+
+
+def test_rows_read_back_like_pandas_wrote_them(tmp_path):
+    rows = [{column: f'{column} {i}' for column in EXTRACTED_COLUMNS} for i in range(3)]
+    rows[1].pop('Region')
+    path = str(tmp_path / 'extracted.xlsx')
+    with SheetWriter(path, EXTRACTED_COLUMNS) as writer:
+        writer.write_all(iter(rows))
+    assert writer.rows == 3
+
+    expected = pd.DataFrame(rows, columns=EXTRACTED_COLUMNS).fillna('')
+    pandas_path = str(tmp_path / 'pandas.xlsx')
+    expected.to_excel(pandas_path, index=False)
+    assert pd.read_excel(path, dtype=str).fillna('').equals(pd.read_excel(pandas_path, dtype=str).fillna(''))
+
+    header = openpyxl.load_workbook(path)['Sheet1']['A1']
+    assert header.value == 'Order ID' and header.font.bold
+
+
+def test_missing_value_and_plain_headers(tmp_path):
+    path = str(tmp_path / 'addresses.xlsx')
+    with SheetWriter(path, ['Name', 'City'], sheet_title='Sheet', bold_headers=False, missing='NOT FOUND') as writer:
+        writer.write({'Name': 'Jane'})
+    sheet = openpyxl.load_workbook(path)['Sheet']
+    assert [[cell.value for cell in row] for row in sheet.iter_rows()] == [['Name', 'City'], ['Jane', 'NOT FOUND']]
+    assert not sheet['A1'].font.bold
+
+
+def test_failed_run_leaves_no_spreadsheet(tmp_path):
+    path = tmp_path / 'extracted.xlsx'
+    with pytest.raises(RuntimeError):
+        with SheetWriter(str(path), EXTRACTED_COLUMNS) as writer:
+            writer.write({})
+            raise RuntimeError('worker died')
+    assert not path.exists() and list(tmp_path.iterdir()) == []
+    # The workbook is finished, not left for the garbage collector to close
+    assert writer.sheet.closed
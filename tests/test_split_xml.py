@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+import trying
+from inventory import Inventory, order_xml_path
+
+
+def make_order(main_directory, order_id='12345678', letters=3):
+    folder = os.path.join(main_directory, order_id)
+    os.makedirs(folder)
+    with open(os.path.join(folder, f'order_{order_id}.xml'), 'w') as f:
+        f.write('<order><details><orderId>12345678</orderId></details></order>')
+    for i in range(letters):
+        with open(os.path.join(folder, f'letter_{i}.pdf'), 'wb') as f:
+            f.write(b'%PDF')
+    return folder
+
+
+@pytest.mark.parametrize('mode', ['link', 'copy', 'manifest'])
+def test_every_split_folder_reaches_the_order_xml(tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(trying, 'SPLIT_XML_MODE', mode)
+    main_directory = str(tmp_path)
+    parent = make_order(main_directory)
+    parent_xml = os.path.join(parent, 'order_12345678.xml')
+
+    trying.separate_pdf_files(main_directory)
+    # A rerun (after a crash) changes nothing
+    trying.separate_pdf_files(main_directory)
+
+    inventory = Inventory(main_directory)
+    assert inventory.all_folders() == ['12345678', '12345678.2', '12345678.3']
+    for name in inventory.split_folders_of('12345678'):
+        folder = os.path.join(main_directory, name)
+        xml_path = order_xml_path(folder, inventory.contents(name))
+        with open(xml_path) as f, open(parent_xml) as original:
+            assert f.read() == original.read()
+        if mode == 'manifest':
+            assert os.path.samefile(xml_path, parent_xml)
+            assert inventory.contents(name).xmls == set()
+        elif mode == 'link':
+            assert os.path.samefile(xml_path, parent_xml)
+
+
+def test_copy_mode_keeps_separate_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(trying, 'SPLIT_XML_MODE', 'copy')
+    parent = make_order(str(tmp_path), letters=2)
+    trying.separate_pdf_files(str(tmp_path))
+    assert not os.path.samefile(os.path.join(parent, 'order_12345678.xml'),
+                                os.path.join(str(tmp_path), '12345678.2', 'order_12345678.xml'))
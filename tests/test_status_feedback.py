@@ -0,0 +1,47 @@
+import hashlib
+import os
+import zipfile
+
+import pytest
+
+import status_feedback
+
+
+def build(directory):
+    # Two orders, each delivered as two 'done' zips of status XMLs with their DTL files
+    os.makedirs(directory)
+    for order_id in ('20000000', '20000001'):
+        for part in range(2):
+            with zipfile.ZipFile(os.path.join(directory, f'{order_id}_done_{part}.zip'), 'w', zipfile.ZIP_DEFLATED) as zf:
+                for k in range(3):
+                    member_id = f'3{order_id[-1]}{part}{k}'
+                    zf.writestr(f's_{member_id}.xml', f'<status><details><orderId>{member_id}</orderId>'
+                                                      f'<vendorIndicator>V{k}</vendorIndicator></details></status>')
+                    zf.writestr(f's_{member_id}.DTL', 'dtl')
+    return str(directory)
+
+
+def tree(directory):
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.startswith('status_') or name.startswith('order_ledger'):
+                continue  # Timings and the ledger's own bookkeeping
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, directory)] = hashlib.md5(f.read()).hexdigest()
+    return files
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_streaming_matches_extracting_to_disk(tmp_path, workers):
+    legacy = build(tmp_path / 'legacy')
+    stream = build(tmp_path / 'stream')
+    status_feedback.process_zip_files(legacy, stream=False, workers=workers)
+    status_feedback.process_zip_files(stream, stream=True, workers=workers)
+
+    files = tree(stream)
+    assert files == tree(legacy)
+    daily_folder = os.path.basename(status_feedback.create_daily_folder(stream))
+    assert sum(name.startswith(os.path.join(daily_folder, 'XML')) for name in files) == 12
+    assert not any(name.endswith('.zip') for name in os.listdir(stream))
@@ -0,0 +1,77 @@
+import os
+import json
+import random
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import make_letter, make_order_xml, make_recipient
+from watcher import FolderWatcher, ROWS_FILE, date_folder_name
+
+
+def deliver(main_directory, zip_name, files):
+    with zipfile.ZipFile(os.path.join(main_directory, zip_name), 'w') as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return zip_name
+
+
+def test_late_part_keeps_earlier_letters_where_they_are(tmp_path):
+    main_directory = str(tmp_path)
+    order_id = '12345678'
+    rng = random.Random(3)
+    recipients = [make_recipient(rng, i) for i in range(4)]
+    xml = make_order_xml(order_id, recipients)
+    letter = lambda i: make_letter(recipients[i], 0)
+
+    watcher = FolderWatcher(main_directory)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        first = deliver(main_directory, f'{order_id}_1.zip',
+                        {f'order_{order_id}.xml': xml, 'letter_b.pdf': letter(1), 'letter_d.pdf': letter(3)})
+        assert watcher.process_order(executor, order_id, [first]) == []
+        # The late part sorts in between the letters placed already and sends one of them again
+        late = deliver(main_directory, f'{order_id}_2.zip',
+                       {'letter_a.pdf': letter(0), 'letter_c.pdf': letter(2), 'letter_d.pdf': letter(3)})
+        assert watcher.process_order(executor, order_id, [late]) == []
+
+    date_folder = os.path.join(main_directory, date_folder_name())
+    placement = {}
+    for folder in sorted(os.listdir(date_folder)):
+        if folder.startswith(order_id):
+            pdfs = [name for name in os.listdir(os.path.join(date_folder, folder)) if name.endswith('.pdf')]
+            assert len(pdfs) == 1, (folder, pdfs)
+            assert os.path.exists(os.path.join(date_folder, folder, f'order_{order_id}.xml'))
+            placement[pdfs[0]] = folder
+    assert placement == {'letter_b.pdf': order_id, 'letter_d.pdf': f'{order_id}.2',
+                         'letter_a.pdf': f'{order_id}.3', 'letter_c.pdf': f'{order_id}.4'}
+
+    # Every row still names the folder its PDF is in, so the rebuilt spreadsheet has no stale rows
+    with open(os.path.join(date_folder, ROWS_FILE)) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    assert {(entry['folder'], entry['pdf']) for entry in entries} == {(folder, pdf) for pdf, folder in placement.items()}
+
+
+def test_zips_of_an_order_with_failed_letters_are_kept(tmp_path):
+    main_directory = str(tmp_path)
+    order_id = '12345678'
+    recipients = [make_recipient(random.Random(4), i) for i in range(2)]
+    files = {f'order_{order_id}.xml': make_order_xml(order_id, recipients),
+             'letter_a.pdf': make_letter(recipients[0], 0), 'letter_b.pdf': b'not a pdf'}
+    zip_name = deliver(main_directory, f'{order_id}_1.zip', files)
+    zip_path = os.path.join(main_directory, zip_name)
+    stat = os.stat(zip_path)
+
+    watcher = FolderWatcher(main_directory, settle=0)
+    watcher.queue.put((order_id, [zip_name], [(stat.st_size, stat.st_mtime_ns)]))
+    watcher.queue.put(None)
+    watcher.busy = 1
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        watcher.work(executor)
+
+    # Still there, and left alone until it is delivered again
+    assert os.path.exists(zip_path)
+    assert watcher.scan() == {} and watcher.scan() == {}
+
+    files['letter_b.pdf'] = make_letter(recipients[1], 0)
+    deliver(main_directory, zip_name, files)
+    watcher.scan()
+    assert watcher.scan() == {order_id: [zip_name]}
@@ -0,0 +1,44 @@
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import xml_access
+from xml_access import first_texts, scan
+
+
+DOCUMENT = ('<order><!-- comment --><details><orderId>12345678</orderId><vendorIndicator>N</vendorIndicator></details>'
+            '<recipients>'
+            '<recipient><mailadr1>1 A St</mailadr1><sku>S1</sku><extra>x</extra></recipient>'
+            '<group><recipient><mailadr1>2 B St</mailadr1><sku>S2</sku></recipient></group>'
+            '<recipient><mailadr1>3 C St</mailadr1><recipient><mailadr1>nested</mailadr1></recipient></recipient>'
+            '</recipients><details><orderId>second</orderId></details></order>')
+
+
+@pytest.fixture(params=['etree', 'lxml'])
+def backend(request, monkeypatch):
+    if request.param == 'lxml':
+        pytest.importorskip('lxml')
+    monkeypatch.setattr(xml_access, 'XML_BACKEND', 'etree' if request.param == 'etree' else 'auto')
+    return request.param
+
+
+def test_scan_matches_find_and_findall(backend):
+    root = ET.fromstring(DOCUMENT)
+    found, records = scan(io.BytesIO(DOCUMENT.encode()), first=('details', 'orderId'), each='recipient')
+
+    details = root.find('.//details')
+    assert found['details'] == (details.text, {child.tag: child.text for child in details})
+    assert found['orderId'][0] == root.find('.//orderId').text == '12345678'
+    assert records == [{child.tag: child.text for child in recipient} for recipient in root.findall('.//recipient')]
+
+
+def test_scan_keeps_only_the_fields_asked_for(backend):
+    _, records = scan(io.BytesIO(DOCUMENT.encode()), each='recipient', fields=('sku',))
+    assert records == [{'sku': 'S1'}, {'sku': 'S2'}, {}, {}]
+
+
+def test_first_texts(backend, tmp_path):
+    path = tmp_path / 'status.xml'
+    path.write_text(DOCUMENT)
+    assert first_texts(str(path), ('orderId', 'vendorIndicator', 'missing')) == {'orderId': '12345678', 'vendorIndicator': 'N'}
@@ -0,0 +1,78 @@
+import os
+import zipfile
+
+import pytest
+
+import zip_extract
+from zip_extract import group_by_prefix, stage_zips, staging_folder
+
+
+def tree(folder):
+    files = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, folder)] = f.read()
+    return files
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_bytes', [zip_extract.CHUNK_BYTES, 1])
+def test_staged_files_match_extractall(tmp_path, monkeypatch, chunk_bytes):
+    # chunk_bytes=1 splits the zip into one run per worker
+    monkeypatch.setattr(zip_extract, 'CHUNK_BYTES', chunk_bytes)
+    members = [(f'sub{i % 3}/deeper/letter_{i}.pdf', os.urandom(64) * (i + 1)) for i in range(50)]
+    members += [('order.xml', b'<order/>'), ('emptydir/', b'')]
+    zip_path = make_zip(tmp_path / '10000000_a.zip', members)
+
+    expected = tmp_path / 'expected'
+    with zipfile.ZipFile(zip_path) as zf:
+        zf.extractall(expected)
+
+    dest = tmp_path / 'dest'
+    with staging_folder(str(tmp_path)) as staging_root:
+        staged = stage_zips([zip_path], staging_root, workers=4)
+        names = staged[zip_path].move_into(str(dest))
+    assert names == [name for name, _ in members]
+    assert tree(dest) == tree(expected)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.staging-')]
+
+
+def test_later_member_of_the_same_name_wins(tmp_path, monkeypatch):
+    monkeypatch.setattr(zip_extract, 'CHUNK_BYTES', 1)
+    with pytest.warns(UserWarning):
+        zip_path = make_zip(tmp_path / 'dup.zip', [('a.txt', b'first'), ('b.txt', b'b'), ('a.txt', b'second')])
+    staged = stage_zips([zip_path], str(tmp_path / 'staging'), workers=4)
+    staged[zip_path].move_into(str(tmp_path / 'dest'))
+    assert (tmp_path / 'dest' / 'a.txt').read_bytes() == b'second'
+
+
+def test_damaged_zip_moves_nothing(tmp_path):
+    good = make_zip(tmp_path / 'good.zip', [('a.pdf', b'a' * 1000)])
+    bad = make_zip(tmp_path / 'bad.zip', [('b.pdf', b'b' * 1000), ('c.pdf', b'c' * 1000)])
+    # Flip a byte of the first member's data, its CRC no longer matches
+    data = bytearray(open(bad, 'rb').read())
+    data[40] ^= 0xFF
+    open(bad, 'wb').write(bytes(data))
+    not_a_zip = tmp_path / 'junk.zip'
+    not_a_zip.write_bytes(b'not a zip')
+
+    staged = stage_zips([good, bad, str(not_a_zip)], str(tmp_path / 'staging'), workers=2)
+    assert staged[good].error is None
+    dest = tmp_path / 'dest'
+    for zip_path in (bad, str(not_a_zip)):
+        with pytest.raises(Exception):
+            staged[zip_path].move_into(str(dest))
+    assert not dest.exists()
+
+
+def test_group_by_prefix_keeps_order():
+    names = ['12345678_b.zip', 'readme.txt', '12345678_a.zip', '87654321_a.zip', '1234_a.zip']
+    assert group_by_prefix(names) == {'12345678': ['12345678_b.zip', '12345678_a.zip'], '87654321': ['87654321_a.zip']}
@@ -1,426 +1,741 @@
-import os
-import zipfile
-import shutil
-import datetime
-from pathlib import Path
-import pdfplumber
-import xml.etree.ElementTree as ET
-import pandas as pd
-import re
-from xml.dom import minidom
-import xml.etree.ElementTree as ET
-import csv
-
-
-
-def copy_zips_to_complete(main_directory):
-    # Ensure the 'Complete' folder exists
-    complete_folder = os.path.join(main_directory, 'Complete')
-    if not os.path.exists(complete_folder):
-        os.makedirs(complete_folder)
-
-    # Iterate over all files in the main directory
-    for file in os.listdir(main_directory):
-        if file.endswith('.zip'):
-            # Construct full file path
-            file_path = os.path.join(main_directory, file)
-
-            # Copy the zip file to the 'Complete' folder
-            shutil.copy(file_path, complete_folder)
-
-
-def extract_and_combine_zips(main_directory):
-    # Create a dictionary to track zip files with the same 8-digit prefix
-    zip_groups = {}
-
-    # Iterate over all files in the main directory
-    for file in os.listdir(main_directory):
-        if file.endswith('.zip'):
-            # Extract the 8-digit prefix
-            match = re.match(r'(\d{8})_.*\.zip$', file)
-            if match:
-                prefix = match.group(1)
-                # Group files by their 8-digit prefix
-                if prefix in zip_groups:
-                    zip_groups[prefix].append(file)
-                else:
-                    zip_groups[prefix] = [file]
-
-    # Process each group of files
-    for prefix, files in zip_groups.items():
-        # Create a directory for the group
-        group_dir = os.path.join(main_directory, prefix)
-        if not os.path.exists(group_dir):
-            os.makedirs(group_dir)
-
-        # Extract files from each zip in the group
-        for zip_file in files:
-            with zipfile.ZipFile(os.path.join(main_directory, zip_file), 'r') as zip_ref:
-                zip_ref.extractall(group_dir)
-
-
-def calculate_ship_date(received_date):
-    # Calculate ship date, 5 business days from received date excluding weekends
-    ship_date = received_date
-    for _ in range(5):
-        ship_date += datetime.timedelta(days=1)
-        while ship_date.weekday() >= 5:  # Mon-Fri are 0-4
-            ship_date += datetime.timedelta(days=1)
-    return ship_date
-
-def create_fulfillment_xml(main_directory):
-    # Ensure the XML folder exists
-    xml_folder = os.path.join(main_directory, 'XML')
-    if not os.path.exists(xml_folder):
-        os.makedirs(xml_folder)
-
-    # Iterate over all directories in the main directory
-    for folder_name in os.listdir(main_directory):
-        folder_path = os.path.join(main_directory, folder_name)
-        if os.path.isdir(folder_path) and folder_name.isdigit():
-            # For each folder, create an XML file
-            xml_file_path = os.path.join(xml_folder, f'order_{folder_name}.xml')
-            root = ET.Element('fulfillment')
-            
-            # Add elements to the XML
-            ET.SubElement(root, 'VendorID').text = 'N'
-            ET.SubElement(root, 'OrderID').text = folder_name
-            ET.SubElement(root, 'Status').text = 'Received'
-            received_date = datetime.datetime.now().date()
-            ET.SubElement(root, 'ReceivedDate').text = str(received_date)
-            ship_date = calculate_ship_date(received_date)
-            ET.SubElement(root, 'ShipDate').text = str(ship_date)
-            ET.SubElement(root, 'ShippingMethod').text = 'USPS'
-            ET.SubElement(root, 'ShippingCost').text = '10.00'
-            ET.SubElement(root, 'Comments')
-            ET.SubElement(root, 'PackagesCount')
-            ET.SubElement(root, 'Tracking')
-
-            # Write the XML file
-            tree = ET.ElementTree(root)
-            tree.write(xml_file_path)
-
-
-def update_daily_status(main_directory):
-    xml_folder = os.path.join(main_directory, 'XML')
-    tsv_file_path = os.path.join(main_directory, 'daily_status.tsv')
-
-    # Read existing data from TSV
-    existing_data = []
-    with open(tsv_file_path, 'r', newline='') as tsvfile:
-        reader = csv.reader(tsvfile, delimiter='\t')
-        existing_data.extend(list(reader))
-
-    # Iterate over XML files and append new data
-    new_data = []
-    for xml_file in os.listdir(xml_folder):
-        if xml_file.endswith('.xml'):
-            xml_file_path = os.path.join(xml_folder, xml_file)
-            tree = ET.parse(xml_file_path)
-            root = tree.getroot()
-
-            # Extract required fields
-            vendor_id = root.find('VendorID').text
-            order_id = root.find('OrderID').text
-            status = root.find('Status').text
-            received_date = root.find('ReceivedDate').text
-            ship_date = root.find('ShipDate').text
-            shipping_method = root.find('ShippingMethod').text
-            shipping_cost = root.find('ShippingCost').text
-            comments = root.find('Comments').text
-            packages_count = root.find('PackagesCount').text
-            tracking = root.find('Tracking').text
-
-            # Create a row for the TSV
-            row = [vendor_id, order_id, status, received_date, ship_date, shipping_method, shipping_cost, comments, packages_count, tracking]
-            if row not in existing_data:
-                new_data.append(row)
-
-    # Append new data to the TSV
-    with open(tsv_file_path, 'a', newline='') as tsvfile:
-        writer = csv.writer(tsvfile, delimiter='\t')
-        writer.writerows(new_data)
-
-def separate_pdf_files(main_directory):
-    for folder_name in os.listdir(main_directory):
-        folder_path = os.path.join(main_directory, folder_name)
-        if os.path.isdir(folder_path) and folder_name.isdigit():
-            pdf_files = [f for f in os.listdir(folder_path) if f.endswith('.pdf')]
-            original_xml_files = [f for f in os.listdir(folder_path) if f.endswith('.xml')]
-
-            if not original_xml_files:
-                continue  # Skip if there are no XML files
-
-            for index, pdf_file in enumerate(pdf_files, start=1):
-                if index == 1:
-                    # Keep the first PDF in the original folder
-                    continue
-
-                # Create a new folder for each subsequent PDF
-                new_folder_name = f"{folder_name}.{index}"
-                new_folder_path = os.path.join(main_directory, new_folder_name)
-                if not os.path.exists(new_folder_path):
-                    os.makedirs(new_folder_path)
-
-                # Move the PDF file to the new folder
-                src_pdf_path = os.path.join(folder_path, pdf_file)
-                dst_pdf_path = os.path.join(new_folder_path, pdf_file)
-                shutil.move(src_pdf_path, dst_pdf_path)
-
-                # Copy the original XML file(s) to the new folder
-                for xml_file in original_xml_files:
-                    src_xml_path = os.path.join(folder_path, xml_file)
-                    shutil.copy(src_xml_path, new_folder_path)
-
-
-def move_folders_to_date_directory(main_directory):
-    # Get current date
-    current_date = datetime.datetime.now()
-    date_folder_name = f"{current_date.month}.{current_date.day}"
-    date_folder_path = os.path.join(main_directory, date_folder_name)
-
-    # Create the date directory if it doesn't exist
-    if not os.path.exists(date_folder_path):
-        os.makedirs(date_folder_path)
-
-    # Move the [8 digits] and suffixed folders to the date directory
-    for folder_name in os.listdir(main_directory):
-        folder_path = os.path.join(main_directory, folder_name)
-        if os.path.isdir(folder_path) and (folder_name.isdigit() or re.match(r'\d{8}\.\d+', folder_name)):
-            shutil.move(folder_path, date_folder_path)
-
-
-
-def read_pdf(pdf_path):
-    with pdfplumber.open(pdf_path) as pdf:
-        text = ''.join(page.extract_text() for page in pdf.pages)
-
-    # Initialize dictionary to store extracted data
-    info = {
-        'First Name': '',
-        'Last Name': '',
-        'Address Line': '',
-        'Address Line 2': '',
-        'City': '',
-        'State': '',
-        'Prefix of MRN': '',
-        'Medical Record Number': ''
-    }
-
-    # Split the text by lines
-    lines = text.split('\n')
-
-    # Extracting Name, which is on line 3
-    name_line = lines[2]
-    name_parts = name_line.split()
-
-    # Name extraction logic
-    info['First Name'] = name_parts[0]
-    if len(name_parts) > 2 and len(name_parts[1]) == 1:
-        info['Last Name'] = name_parts[2]
-    else:
-        info['Last Name'] = name_parts[1]
-
-    # Address extraction logic
-    address_line = lines[3].strip()
-
-    # Regex for Address Line 2
-    address_line_2_pattern = re.compile(r'\b(UNIT|unit|APT|Apt|Apt\.)\s.{1,7}')
-    addr2_match = address_line_2_pattern.search(address_line)
-
-    # Stop keywords for filtering address lines
-    stop_keywords = ['Medical', 'COMPRADOR', 'Comprador', '醫', 'Health', 'Me','He',"Co"]
-
-    if addr2_match:
-        # Extract Address Line 2
-        addr2_text = addr2_match.group()
-
-        # Apply stop_keywords to Address Line 2
-        for keyword in stop_keywords:
-            index = addr2_text.find(keyword)
-            if index != -1:
-                addr2_text = addr2_text[:index].strip()
-                break
-
-        info['Address Line 2'] = addr2_text
-        address_line = address_line[:addr2_match.start()].strip()
-
-    # Apply stop_keywords to Address Line 1
-    for keyword in stop_keywords:
-        index = address_line.find(keyword)
-        if index != -1:
-            address_line = address_line[:index].strip()
-
-    info['Address Line'] = address_line
-
-    # City and State extraction logic
-    city_state_line = lines[4]
-    city_state_parts = city_state_line.split(',')
-    if len(city_state_parts) == 2:
-        city, state_zip = city_state_parts
-        info['City'] = city.strip()
-        state_zip_parts = state_zip.strip().split(' ')
-        if state_zip_parts:
-            info['State'] = state_zip_parts[0]
-
-    # MRN extraction logic
-    mrn_pattern = re.compile(
-        r'(\b\d{2})-(\d{6,14})\b|'
-        r'(?:Medical\s+Record\s+Number|Record\s+Number):\s*(\d+)'
-    )
-    mrn_match = mrn_pattern.search(text)
-    if mrn_match:
-        if mrn_match.group(1) and mrn_match.group(2):
-            info['Prefix of MRN'] = mrn_match.group(1)
-            info['Medical Record Number'] = mrn_match.group(2)
-        elif mrn_match.group(3):
-            info['Medical Record Number'] = mrn_match.group(3)
-            info['Prefix of MRN'] = ''
-
-    return info
-
-
-def read_xml(xml_path, address_line_start):
-    # Initialize dictionary to store extracted data
-    xml_data = {
-        'OrderID': '',
-        'SKU': '',
-        'Item Description': '',
-        'DOCID': '',  # To store DOCID
-        'Region': ''  # To store region code
-    }
-
-    # Parse the XML file
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
-    # Extract OrderID from details
-    details = root.find('.//details')
-    order_id = details.find('orderId').text if details is not None and details.find('orderId') is not None else 'No ID'
-    xml_data['OrderID'] = order_id
-
-    # Find the recipient that contains the address line starting with 'address_line_start'
-    for recipient in root.findall('.//recipient'):
-        address = recipient.find('mailadr1')
-        if address is not None and address.text.startswith(address_line_start[:4]):
-            # Extract SKU
-            sku_node = recipient.find('sku')
-            if sku_node is not None:
-                xml_data['SKU'] = sku_node.text
-
-            # Extract DOCID
-            docid_node = recipient.find('DOCID')  
-            if docid_node is not None:
-                xml_data['DOCID'] = docid_node.text
-
-            # Extract Region Code
-            region_cd_node = recipient.find('region_cd')  
-            if region_cd_node is not None:
-                xml_data['Region'] = region_cd_node.text
-
-            # Assuming that both SKU and DOCID are mandatory for Item Description
-            if xml_data['SKU'] and xml_data['DOCID']:
-                xml_data['Item Description'] = get_item_description(xml_data['SKU'], xml_data['DOCID'])
-
-            break  # Break the loop once the correct recipient is found
-
-    return xml_data
-
-
-
-
-# Function to determine item description based on SKU and DOCID
-def get_item_description(sku, doc_id):
-    if sku == 'AIA_0300':
-        return f'Audio CD, {doc_id}'
-    elif sku == 'AIB_0200':
-        return f'Braille, {doc_id}'
-    return 'Unknown Description'
-
-
-def process_data_in_date_folder(date_folder_path):
-    data_list = []  # List to hold all the data dictionaries
-    current_date = datetime.datetime.now().strftime('%m/%d/%Y')
-
-    # Function to process a single folder
-    def process_folder(folder_path):
-        nonlocal data_list
-        pdf_files = [f for f in os.listdir(folder_path) if f.endswith('.pdf')]
-        xml_files = [f for f in os.listdir(folder_path) if f.endswith('.xml')]
-
-        if not pdf_files or not xml_files:
-            return
-
-        xml_path = os.path.join(folder_path, xml_files[0])
-
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(folder_path, pdf_file)
-            pdf_info = read_pdf(pdf_path)
-            xml_data = read_xml(xml_path, pdf_info['Address Line'][:4])
-
-            data_list.append({
-                'Order ID': xml_data['OrderID'],
-                'Invoice Number': '',
-                'SKU': xml_data['SKU'],
-                'Item Description': xml_data['Item Description'],
-                'Vendor': 'AI',
-                'Order Received': current_date,  # Set to the current date
-                'IsKit': '1',
-                'Qty': '1',
-                'Unit Price': '',
-                'Tax': '',
-                'Prefix of MRN': pdf_info['Prefix of MRN'],
-                'Medical Record Number': pdf_info['Medical Record Number'],
-                'First Name': pdf_info['First Name'],
-                'Last Name': pdf_info['Last Name'],
-                'Region': xml_data['Region'],
-                'Address Line': pdf_info['Address Line'],
-                'Address Line 2': pdf_info['Address Line 2'],
-                'City': pdf_info['City'],
-                'State': pdf_info['State']
-            })
-
-    # Iterate through each subfolder in the date folder
-    for folder_name in os.listdir(date_folder_path):
-        folder_path = os.path.join(date_folder_path, folder_name)
-        if os.path.isdir(folder_path):
-            process_folder(folder_path)
-
-    # Export to Excel
-    df = pd.DataFrame(data_list)
-    output_path = os.path.join(date_folder_path, 'extracted.xlsx')
-    df.to_excel(output_path, index=False)
-    print(f'Excel spreadsheet has been created at {output_path}')
-
-
-def main():
-    # Set the main directory to the current script's directory
-    main_directory = os.path.dirname(os.path.realpath(__file__))
-
-    # Step 1: Copy zips to Complete folder
-    copy_zips_to_complete(main_directory)
-
-    # Step 2: Extract and combine zips
-    extract_and_combine_zips(main_directory)
-
-    # Step 3: Create fulfillment XML
-    create_fulfillment_xml(main_directory)
-
-    # Step 4: Update daily_status.tsv
-    update_daily_status(main_directory)
-
-    # Step 5: Separate PDF files
-    separate_pdf_files(main_directory)
-
-    # Step 6: Move folders to date directory
-    move_folders_to_date_directory(main_directory)
-
-     # Step 7: Process data in date folder
-    date_folder_name = f"{datetime.datetime.now().month}.{datetime.datetime.now().day}"
-    date_folder_path = os.path.join(main_directory, date_folder_name)
-    process_data_in_date_folder(date_folder_path)
-
-    # ... rest of the main function ...
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+import os
+import zipfile
+import shutil
+import datetime
+import re
+import csv
+import bisect
+from parallel import imap_ordered, JobFailed
+from recipients import load_recipient_index
+from pdf_cache import read_cached, read_pages_cached, use_directory
+from sheet_writer import SheetWriter, EXTRACTED_COLUMNS
+from manifest import RunManifest, run_item
+from archive_store import ArchiveStore
+from inventory import Inventory, scan_order_folders, order_xml_path, XML_REF_SUFFIX
+from instrumentation import RunReport
+from layouts import layout_extractor
+from raw_text import tiered_extractor, extract_raw_pages
+from page_memory import read_page_texts
+from zip_extract import group_by_prefix, stage_zips, staging_folder
+from business_days import ship_dates
+from fulfillment_xml import write_fulfillment_batch, FULFILLMENT_FIELDS
+from parquet_output import open_dataset
+from order_ledger import open_ledger
+from xml_access import first_texts
+
+
+# Bump when the parsing in parse_pages changes, so cached results from the old parser are not reused
+PARSER_VERSION = 1
+
+# 'bounded' reads pages lazily and stops once every field is found, 'full' reads every page
+EXTRACT_MODE = os.environ.get('PDF_EXTRACT_MODE', 'bounded')
+# Most pages the bounded mode will read, 0 means no cap
+MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', '0'))
+
+# How the NNNNNNNN.k folders get the order XML: 'link' hardlinks it (copying where the filesystem
+# can't link), 'copy' copies it, 'manifest' writes a <name>.xml.ref pointing at the parent's XML
+SPLIT_XML_MODE = os.environ.get('SPLIT_XML', 'link').lower()
+
+MRN_PATTERN = re.compile(
+    r'(\b\d{2})-(\d{6,14})\b|'
+    r'(?:Medical\s+Record\s+Number|Record\s+Number):\s*(\d+)'
+)
+
+# Lines of the joined text holding each field (name on line 3, address on 4, city/state on 5)
+FIELD_LINES = {
+    'First Name': 2,
+    'Last Name': 2,
+    'Address Line': 3,
+    'Address Line 2': 3,
+    'City': 4,
+    'State': 4,
+}
+
+
+
+def copy_zips_to_complete(main_directory, manifest=None, inventory=None):
+    if inventory is None:
+        inventory = Inventory(main_directory)
+
+    # Ensure the 'Complete' folder exists
+    complete_folder = os.path.join(main_directory, 'Complete')
+    if not os.path.exists(complete_folder):
+        os.makedirs(complete_folder)
+
+    # 'Complete' stores every distinct zip once, by content hash, and links it in place
+    # of a copy where the filesystem allows it. Zips archived on an earlier run are skipped.
+    store = ArchiveStore(complete_folder)
+
+    # Iterate over all zip files in the main directory
+    for file in inventory.zip_files():
+        # Construct full file path
+        file_path = os.path.join(main_directory, file)
+
+        # Archive the zip file in the 'Complete' folder
+        run_item(manifest, 'copy_zips_to_complete', file, store.add, file_path)
+
+
+def extract_zip(zip_path, group_dir, inventory):
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        zip_ref.extractall(group_dir)
+        inventory.add_extracted(os.path.basename(group_dir), zip_ref.namelist())
+
+
+def place_staged(staged, group_dir, inventory):
+    inventory.add_extracted(os.path.basename(group_dir), staged.move_into(group_dir))
+
+
+def extract_and_combine_zips(main_directory, manifest=None, inventory=None, workers=None):
+    if inventory is None:
+        inventory = Inventory(main_directory)
+
+    # Group the zip files by their 8-digit prefix
+    zip_groups = group_by_prefix(inventory.zip_files())
+
+    # Every zip still to do is extracted at the same time into a staging folder, which checks
+    # its members' CRCs. The files are then moved into the group folders zip by zip, in the same
+    # order as before, so later zips still overwrite files of the same name from earlier ones.
+    pending = [os.path.join(main_directory, zip_file) for files in zip_groups.values() for zip_file in files
+               if manifest is None or not manifest.is_done('extract_and_combine_zips', zip_file)]
+    with staging_folder(main_directory) as staging_root:
+        staged = stage_zips(pending, staging_root, workers)
+
+        # Process each group of files
+        for prefix, files in zip_groups.items():
+            # Create a directory for the group
+            group_dir = os.path.join(main_directory, prefix)
+            if prefix not in inventory.folders:
+                os.makedirs(group_dir, exist_ok=True)
+                inventory.add_folder(prefix)
+
+            # Move the files of each zip in the group
+            for zip_file in files:
+                zip_path = os.path.join(main_directory, zip_file)
+                if zip_path in staged:
+                    run_item(manifest, 'extract_and_combine_zips', zip_file, place_staged, staged[zip_path], group_dir, inventory)
+
+
+def fulfillment_rows(folder_names, received_date):
+    # The fulfillment of each order folder, ship dates (5 business days, holidays excluded) for the
+    # whole batch in one calendar call
+    received_dates = [received_date] * len(folder_names)
+    return [['N', folder_name, 'Received', str(received_date), str(ship), 'USPS', '10.00', '', '', '']
+            for folder_name, ship in zip(folder_names, ship_dates(received_dates))]
+
+
+def write_fulfillment_xml(xml_folder, folder_name):
+    # Create the XML file for one order folder
+    write_fulfillment_batch(xml_folder, fulfillment_rows([folder_name], datetime.datetime.now().date()))
+
+
+def create_fulfillment_xml(main_directory, manifest=None, inventory=None):
+    if inventory is None:
+        inventory = Inventory(main_directory)
+
+    # Ensure the XML folder exists
+    xml_folder = os.path.join(main_directory, 'XML')
+    if not os.path.exists(xml_folder):
+        os.makedirs(xml_folder)
+
+    # Render the XMLs of all order folders from one batch, then write each order's file
+    folder_names = inventory.order_folders()
+    rows = fulfillment_rows(folder_names, datetime.datetime.now().date())
+    for folder_name, row in zip(folder_names, rows):
+        run_item(manifest, 'create_fulfillment_xml', folder_name, write_fulfillment_batch, xml_folder, [row])
+
+
+def update_daily_status(main_directory, manifest=None):
+    run_item(manifest, 'update_daily_status', 'daily_status.tsv', append_daily_status, main_directory)
+
+
+def status_row(xml_file_path):
+    # Extract required fields, in one pass that stops after the last of them
+    texts = first_texts(xml_file_path, FULFILLMENT_FIELDS)
+
+    # Create a row for the TSV
+    return [texts[tag] for tag in FULFILLMENT_FIELDS]
+
+
+def append_daily_status(main_directory):
+    xml_folder = os.path.join(main_directory, 'XML')
+    tsv_file_path = os.path.join(main_directory, 'daily_status.tsv')
+
+    # Upsert every XML's row into the order ledger (filled from the TSV the first time), which
+    # finds the rows that are new or changed by OrderID instead of scanning the whole TSV
+    ledger = open_ledger(main_directory, tsv_file_path)
+    try:
+        rows = [status_row(os.path.join(xml_folder, xml_file))
+                for xml_file in os.listdir(xml_folder) if xml_file.endswith('.xml')]
+        new_data = ledger.upsert(rows)
+    finally:
+        ledger.close()
+
+    # Append new data to the TSV
+    with open(tsv_file_path, 'a', newline='') as tsvfile:
+        writer = csv.writer(tsvfile, delimiter='\t')
+        writer.writerows(new_data)
+
+def share_xml(src_xml_path, new_folder_path, mode=None):
+    # Give a split folder the order XML, returns the name of the file placed there
+    mode = mode or SPLIT_XML_MODE
+    xml_file = os.path.basename(src_xml_path)
+    if mode == 'manifest':
+        ref_file = os.path.splitext(xml_file)[0] + XML_REF_SUFFIX
+        with open(os.path.join(new_folder_path, ref_file), 'w') as f:
+            f.write(os.path.relpath(src_xml_path, new_folder_path).replace(os.sep, '/'))
+        return ref_file
+
+    if mode == 'link':
+        dst_xml_path = os.path.join(new_folder_path, xml_file)
+        if os.path.exists(dst_xml_path):
+            os.remove(dst_xml_path)  # Left by an interrupted run
+        try:
+            os.link(src_xml_path, dst_xml_path)
+            return xml_file
+        except OSError:
+            pass  # No hardlinks here (other filesystem, share without support), copy it
+
+    shutil.copy(src_xml_path, new_folder_path)
+    return xml_file
+
+
+def separate_folder(main_directory, folder_name, inventory):
+    folder_path = os.path.join(main_directory, folder_name)
+    contents = inventory.contents(folder_name)
+    original_xml_files = sorted(contents.xmls)
+
+    if not original_xml_files:
+        return  # Skip if there are no XML files
+
+    # Number the PDFs over the parent folder plus any NNNNNNNN.k folders an interrupted run
+    # already made, so a rerun gives every PDF the same folder as the first attempt would have
+    pdf_files = set(contents.pdfs)
+    for split_folder in inventory.split_folders_of(folder_name):
+        pdf_files.update(inventory.contents(split_folder).pdfs)
+
+    for index, pdf_file in enumerate(sorted(pdf_files), start=1):
+        if index == 1:
+            # Keep the first PDF in the original folder
+            continue
+
+        if pdf_file not in contents.pdfs:
+            continue  # Already moved by an earlier run
+
+        # Create a new folder for each subsequent PDF
+        new_folder_name = f"{folder_name}.{index}"
+        new_folder_path = os.path.join(main_directory, new_folder_name)
+        if new_folder_name not in inventory.folders:
+            os.makedirs(new_folder_path, exist_ok=True)
+            inventory.add_folder(new_folder_name)
+
+        # Share the original XML file(s) with the new folder, then move the PDF file there
+        for xml_file in original_xml_files:
+            src_xml_path = os.path.join(folder_path, xml_file)
+            inventory.copy_file(new_folder_name, share_xml(src_xml_path, new_folder_path))
+
+        src_pdf_path = os.path.join(folder_path, pdf_file)
+        dst_pdf_path = os.path.join(new_folder_path, pdf_file)
+        shutil.move(src_pdf_path, dst_pdf_path)
+        inventory.move_file(folder_name, new_folder_name, pdf_file)
+
+
+def placed_pdfs(inventory, folder_name):
+    # {PDF name: folder name} of the PDFs already in an order's folder and its NNNNNNNN.k folders
+    placed = {}
+    for name in [folder_name] + inventory.split_folders_of(folder_name):
+        if name in inventory.folders:
+            for pdf_file in inventory.contents(name).pdfs:
+                placed[pdf_file] = name
+    return placed
+
+
+def place_late_pdfs(main_directory, folder_name, inventory, placed):
+    # The PDFs a late part of an order that was already separated brought into its folder
+    # (placed is placed_pdfs from before the part was extracted). A PDF that replaces one of
+    # the same name goes to where that one is, the others get new NNNNNNNN.k folders numbered
+    # after the order's highest. The PDFs placed earlier stay in their folders.
+    folder_path = os.path.join(main_directory, folder_name)
+    contents = inventory.contents(folder_name)
+    original_xml_files = sorted(contents.xmls)
+    if not original_xml_files:
+        return
+
+    last = 1
+    for split_folder in inventory.split_folders_of(folder_name):
+        index = split_folder.rsplit('.', 1)[1]
+        if index.isdigit():
+            last = max(last, int(index))
+
+    for pdf_file in sorted(contents.pdfs):
+        if placed.get(pdf_file) == folder_name:
+            continue  # The PDF the order folder keeps
+
+        if pdf_file in placed:
+            new_folder_name = placed[pdf_file]
+            new_folder_path = os.path.join(main_directory, new_folder_name)
+        else:
+            last += 1
+            new_folder_name = f"{folder_name}.{last}"
+            new_folder_path = os.path.join(main_directory, new_folder_name)
+            os.makedirs(new_folder_path, exist_ok=True)
+            inventory.add_folder(new_folder_name)
+            for xml_file in original_xml_files:
+                src_xml_path = os.path.join(folder_path, xml_file)
+                inventory.copy_file(new_folder_name, share_xml(src_xml_path, new_folder_path))
+
+        shutil.move(os.path.join(folder_path, pdf_file), os.path.join(new_folder_path, pdf_file))
+        inventory.move_file(folder_name, new_folder_name, pdf_file)
+
+
+def separate_pdf_files(main_directory, manifest=None, inventory=None):
+    if inventory is None:
+        inventory = Inventory(main_directory)
+
+    for folder_name in inventory.order_folders():
+        run_item(manifest, 'separate_pdf_files', folder_name, separate_folder, main_directory, folder_name, inventory)
+
+
+def move_into(folder_path, date_folder_path):
+    # Move a folder into the date directory. If a folder with that name is already there
+    # (an earlier run moved it and then crashed), merge the contents into it instead
+    dest_path = os.path.join(date_folder_path, os.path.basename(folder_path))
+    if not os.path.exists(dest_path):
+        shutil.move(folder_path, date_folder_path)
+        return
+
+    for entry in os.listdir(folder_path):
+        src_path = os.path.join(folder_path, entry)
+        dst_path = os.path.join(dest_path, entry)
+        if os.path.isdir(src_path) and os.path.isdir(dst_path):
+            move_into(src_path, dest_path)
+            continue
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+        shutil.move(src_path, dst_path)
+    os.rmdir(folder_path)
+
+
+def move_folder(folder_path, date_folder_path, inventory):
+    move_into(folder_path, date_folder_path)
+    inventory.remove_folder(os.path.basename(folder_path))
+
+
+def move_folders_to_date_directory(main_directory, manifest=None, inventory=None):
+    if inventory is None:
+        inventory = Inventory(main_directory)
+
+    # Get current date
+    current_date = datetime.datetime.now()
+    date_folder_name = f"{current_date.month}.{current_date.day}"
+    date_folder_path = os.path.join(main_directory, date_folder_name)
+
+    # Create the date directory if it doesn't exist
+    if not os.path.exists(date_folder_path):
+        os.makedirs(date_folder_path)
+
+    # Move the [8 digits] and suffixed folders to the date directory
+    for folder_name in inventory.all_folders():
+        folder_path = os.path.join(main_directory, folder_name)
+        run_item(manifest, 'move_folders_to_date_directory', folder_name, move_folder, folder_path, date_folder_path, inventory)
+
+
+
+def extract_pages(pdf_path):
+    return read_page_texts(pdf_path)
+
+
+def fields_complete(text):
+    # Lines 0-4 must be finished (a page break inside them would still change them)
+    # and the first MRN match must not run up to the end of what has been read so far
+    if text.count('\n') < 5:
+        return False
+    mrn_match = MRN_PATTERN.search(text)
+    return mrn_match is not None and mrn_match.end() < len(text)
+
+
+def extract_pages_bounded(pdf_path, max_pages=None):
+    if max_pages is None:
+        max_pages = MAX_PAGES
+    return read_page_texts(pdf_path, max_pages, stop=lambda pages: fields_complete(''.join(pages)))
+
+
+def extract_raw_bounded(pdf_path):
+    # The bounded read on the raw content-stream text
+    return extract_raw_pages(pdf_path, MAX_PAGES, stop=lambda pages: fields_complete(''.join(pages)))
+
+
+def fields_found(info):
+    # A cropped read is only trusted when it found the address block and the MRN
+    return bool(info['City'] and info['Medical Record Number'])
+
+
+def pdf_extractor():
+    # (cache key, extract function) read_pdf gets its page texts with.
+    # The raw content-stream text is tried first, pdfplumber only reads the letters where it
+    # doesn't parse cleanly, and only the top strip of those with a known layout.
+    if EXTRACT_MODE == 'full':
+        extractor, raw_extract, extract = 'all-pages', extract_raw_pages, extract_pages
+    else:
+        extractor, raw_extract, extract = f'bounded-{MAX_PAGES}', extract_raw_bounded, extract_pages_bounded
+    extractor, extract = layout_extractor('trying', extractor, extract, parse_pages, fields_found)
+    return tiered_extractor(extractor, raw_extract, extract, parse_pages, fields_found)
+
+
+def read_pages(pdf_path):
+    # Just the page texts of a letter (cached like read_pdf's), for parsing in batches
+    return read_pages_cached(pdf_path, *pdf_extractor())
+
+
+def read_pdf(pdf_path):
+    # Extracted page text and parsed fields are cached on disk by PDF content hash
+    extractor, extract = pdf_extractor()
+    return read_cached(pdf_path, extractor, extract, f'trying/{PARSER_VERSION}', parse_pages)
+
+
+def field_pages(pages):
+    # 1-based page number each field was read from, None when the field isn't in the text
+    text = ''.join(pages)
+    page_starts = []
+    offset = 0
+    for page in pages:
+        page_starts.append(offset)
+        offset += len(page)
+
+    def page_of(position):
+        return bisect.bisect_right(page_starts, position)
+
+    # A line belongs to the page its last character is on, that page has to be read to complete it
+    line_ends = []
+    position = 0
+    for line in text.split('\n'):
+        position += len(line)
+        line_ends.append(position - 1 if line else position)
+        position += 1
+
+    sources = {field: page_of(line_ends[line]) if line < len(line_ends) else None for field, line in FIELD_LINES.items()}
+    mrn_match = MRN_PATTERN.search(text)
+    mrn_page = page_of(mrn_match.end() - 1) if mrn_match else None
+    sources['Prefix of MRN'] = mrn_page
+    sources['Medical Record Number'] = mrn_page
+    return sources
+
+
+def report_field_pages(folder_path, max_pages=None):
+    # Read every PDF under folder_path in full and print the deepest page each field came from,
+    # to check that a page cap is safe for the layouts we receive
+    if max_pages is None:
+        max_pages = MAX_PAGES
+
+    deepest = {}
+    over_cap = []
+    for root, _, files in os.walk(folder_path):
+        for file in sorted(files):
+            if not file.endswith('.pdf'):
+                continue
+            pdf_path = os.path.join(root, file)
+            sources = field_pages(extract_pages(pdf_path))
+            for field, page in sources.items():
+                if page is not None:
+                    deepest[field] = max(deepest.get(field, 0), page)
+            if max_pages and any(page is not None and page > max_pages for page in sources.values()):
+                over_cap.append(pdf_path)
+
+    for field, page in deepest.items():
+        print(f'{field}: found by page {page}')
+    if max_pages:
+        print(f'{len(over_cap)} PDF(s) need more than {max_pages} page(s)')
+        for pdf_path in over_cap:
+            print(f'  {pdf_path}')
+    return deepest, over_cap
+
+
+def parse_pages(pages):
+    text = ''.join(pages)
+
+    # Initialize dictionary to store extracted data
+    info = {
+        'First Name': '',
+        'Last Name': '',
+        'Address Line': '',
+        'Address Line 2': '',
+        'City': '',
+        'State': '',
+        'Prefix of MRN': '',
+        'Medical Record Number': ''
+    }
+
+    # Split the text by lines
+    lines = text.split('\n')
+
+    # Extracting Name, which is on line 3
+    name_line = lines[2]
+    name_parts = name_line.split()
+
+    # Name extraction logic
+    info['First Name'] = name_parts[0]
+    if len(name_parts) > 2 and len(name_parts[1]) == 1:
+        info['Last Name'] = name_parts[2]
+    else:
+        info['Last Name'] = name_parts[1]
+
+    # Address extraction logic
+    address_line = lines[3].strip()
+
+    # Regex for Address Line 2
+    address_line_2_pattern = re.compile(r'\b(UNIT|unit|APT|Apt|Apt\.)\s.{1,7}')
+    addr2_match = address_line_2_pattern.search(address_line)
+
+    # Stop keywords for filtering address lines
+    stop_keywords = ['Medical', 'COMPRADOR', 'Comprador', '醫', 'Health', 'Me','He',"Co"]
+
+    if addr2_match:
+        # Extract Address Line 2
+        addr2_text = addr2_match.group()
+
+        # Apply stop_keywords to Address Line 2
+        for keyword in stop_keywords:
+            index = addr2_text.find(keyword)
+            if index != -1:
+                addr2_text = addr2_text[:index].strip()
+                break
+
+        info['Address Line 2'] = addr2_text
+        address_line = address_line[:addr2_match.start()].strip()
+
+    # Apply stop_keywords to Address Line 1
+    for keyword in stop_keywords:
+        index = address_line.find(keyword)
+        if index != -1:
+            address_line = address_line[:index].strip()
+
+    info['Address Line'] = address_line
+
+    # City and State extraction logic
+    city_state_line = lines[4]
+    city_state_parts = city_state_line.split(',')
+    if len(city_state_parts) == 2:
+        city, state_zip = city_state_parts
+        info['City'] = city.strip()
+        state_zip_parts = state_zip.strip().split(' ')
+        if state_zip_parts:
+            info['State'] = state_zip_parts[0]
+
+    # MRN extraction logic
+    mrn_match = MRN_PATTERN.search(text)
+    if mrn_match:
+        if mrn_match.group(1) and mrn_match.group(2):
+            info['Prefix of MRN'] = mrn_match.group(1)
+            info['Medical Record Number'] = mrn_match.group(2)
+        elif mrn_match.group(3):
+            info['Medical Record Number'] = mrn_match.group(3)
+            info['Prefix of MRN'] = ''
+
+    return info
+
+
+def read_xml(xml_path, address_line):
+    # Initialize dictionary to store extracted data
+    xml_data = {
+        'OrderID': '',
+        'SKU': '',
+        'Item Description': '',
+        'DOCID': '',  # To store DOCID
+        'Region': ''  # To store region code
+    }
+
+    # The order XML is parsed once per folder, then recipients are looked up by address
+    index = load_recipient_index(xml_path)
+    xml_data['OrderID'] = index.order_id
+
+    recipient = index.lookup(address_line)
+    if recipient is not None:
+        xml_data['SKU'] = recipient['SKU']
+        xml_data['DOCID'] = recipient['DOCID']
+        xml_data['Region'] = recipient['Region']
+
+        # Assuming that both SKU and DOCID are mandatory for Item Description
+        if xml_data['SKU'] and xml_data['DOCID']:
+            xml_data['Item Description'] = get_item_description(xml_data['SKU'], xml_data['DOCID'])
+
+    return xml_data
+
+
+
+
+# Function to determine item description based on SKU and DOCID
+def get_item_description(sku, doc_id):
+    if sku == 'AIA_0300':
+        return f'Audio CD, {doc_id}'
+    elif sku == 'AIB_0200':
+        return f'Braille, {doc_id}'
+    return 'Unknown Description'
+
+
+def extract_record(pdf_path, xml_path, current_date):
+    # Build one spreadsheet row from a letter PDF and its order XML (runs in a worker process)
+    pdf_info = read_pdf(pdf_path)
+    xml_data = read_xml(xml_path, pdf_info['Address Line'])
+
+    return {
+        'Order ID': xml_data['OrderID'],
+        'Invoice Number': '',
+        'SKU': xml_data['SKU'],
+        'Item Description': xml_data['Item Description'],
+        'Vendor': 'AI',
+        'Order Received': current_date,  # Set to the current date
+        'IsKit': '1',
+        'Qty': '1',
+        'Unit Price': '',
+        'Tax': '',
+        'Prefix of MRN': pdf_info['Prefix of MRN'],
+        'Medical Record Number': pdf_info['Medical Record Number'],
+        'First Name': pdf_info['First Name'],
+        'Last Name': pdf_info['Last Name'],
+        'Region': xml_data['Region'],
+        'Address Line': pdf_info['Address Line'],
+        'Address Line 2': pdf_info['Address Line 2'],
+        'City': pdf_info['City'],
+        'State': pdf_info['State']
+    }
+
+
+def date_folder_jobs(date_folder_path, current_date=None):
+    # One (pdf_path, xml_path, current_date) job per PDF of the order folders in a date folder,
+    # returned with the folders themselves
+    jobs = []
+    current_date = current_date or datetime.datetime.now().strftime('%m/%d/%Y')
+    shared_xmls = {}  # (device, inode) -> path, hardlinked XMLs of one order are one file
+
+    # Function to collect the jobs of a single folder
+    def process_folder(folder_path, contents):
+        pdf_files = sorted(contents.pdfs)
+        xml_path = order_xml_path(folder_path, contents)
+
+        if not pdf_files or xml_path is None:
+            return
+
+        # The split folders of an order all get the parent's XML path, so the worker processes
+        # parse that XML once (load_recipient_index caches by path) instead of once per letter
+        stat = os.stat(xml_path)
+        xml_path = shared_xmls.setdefault((stat.st_dev, stat.st_ino), xml_path)
+
+        for pdf_file in pdf_files:
+            pdf_path = os.path.join(folder_path, pdf_file)
+            jobs.append((pdf_path, xml_path, current_date))
+
+    # Iterate through each subfolder in the date folder (one scandir pass per folder)
+    folders = scan_order_folders(date_folder_path)
+    for folder_name in sorted(folders):
+        process_folder(os.path.join(date_folder_path, folder_name), folders[folder_name])
+    return jobs, folders
+
+
+def write_date_folder(date_folder_path, jobs, results, report=None):
+    # Write each row to the date folder's extracted.xlsx as soon as it is ready. results are the
+    # (row, seconds, counts) of the jobs, in job order; a row that is a JobFailed is left out.
+    # Returns {order folder name: [errors]}.
+    output_path = os.path.join(date_folder_path, 'extracted.xlsx')
+    folder_errors = {}
+    # The rows also go to the Parquet dataset partitioned by order received date (parquet_output)
+    with SheetWriter(output_path, EXTRACTED_COLUMNS) as writer, open_dataset(date_folder_path) as dataset:
+        for (pdf_path, _, _), (row, seconds, counts) in zip(jobs, results):
+            folder_name = os.path.basename(os.path.dirname(pdf_path))
+            folder_errors.setdefault(folder_name, [])
+            failed = isinstance(row, JobFailed)
+            if report is not None:
+                report.file_done(pdf_path, seconds, failed, counts)
+            if failed:
+                folder_errors[folder_name].append(f'{os.path.basename(pdf_path)}: {row.error}')
+                continue
+            writer.write(row)
+            dataset.write(row)
+    print(f'Excel spreadsheet has been created at {output_path}')
+    return folder_errors
+
+
+def process_data_in_date_folder(date_folder_path, workers=None, manifest=None, report=None):
+    jobs, folders = date_folder_jobs(date_folder_path)
+
+    # Read the PDFs and XMLs across the worker pool, rows come back in job order. With a
+    # manifest a broken PDF is recorded against its order folder and skipped instead of
+    # stopping the whole spreadsheet.
+    if report is not None:
+        report.set_total(len(jobs))
+        report.count('folders', len(folders))
+    results = imap_ordered(extract_record, jobs, workers, keep_going=manifest is not None, timed=True)
+    folder_errors = write_date_folder(date_folder_path, jobs, results, report)
+
+    if manifest is not None:
+        for folder_name, errors in folder_errors.items():
+            if errors:
+                manifest.mark_failed('process_data_in_date_folder', folder_name, '; '.join(errors))
+            else:
+                manifest.mark_done('process_data_in_date_folder', folder_name)
+
+
+def run_step(manifest, step, *args, run_report=None, **kwargs):
+    # Run one pipeline step unless the manifest says an earlier run already finished it
+    name = step.__name__
+    if manifest.is_step_done(name):
+        print(f'Skipping {name}, already done in an earlier run')
+        return
+    manifest.start_step(name)
+    if run_report is None:
+        step(*args, manifest=manifest, **kwargs)
+    else:
+        with run_report.stage(name):
+            step(*args, manifest=manifest, **kwargs)
+    manifest.finish_step(name)
+
+
+def main(workers=None, main_directory=None):
+    # Default to the current script's directory, the CLI passes the directory to work on
+    if main_directory is None:
+        main_directory = os.path.dirname(os.path.realpath(__file__))
+    use_directory(main_directory)
+
+    # Progress is recorded per step and per zip / order folder, a rerun on the same day resumes
+    manifest = RunManifest(os.path.join(main_directory, 'run_manifest.json'))
+
+    # Timings per step and per PDF, written to run_report.json at the end of the run, with
+    # run_progress.jsonl growing while it goes
+    report = RunReport('trying', os.path.join(main_directory, 'run_report.json'),
+                       os.path.join(main_directory, 'run_progress.jsonl'))
+
+    # List the main directory once, the steps keep the listing up to date as they go
+    with report.stage('inventory'):
+        inventory = Inventory(main_directory)
+    report.count('zips', len(inventory.zips))
+
+    try:
+        # Step 1: Copy zips to Complete folder
+        run_step(manifest, copy_zips_to_complete, main_directory, inventory=inventory, run_report=report)
+
+        # Step 2: Extract and combine zips
+        run_step(manifest, extract_and_combine_zips, main_directory, inventory=inventory, workers=workers, run_report=report)
+
+        # Step 3: Create fulfillment XML
+        run_step(manifest, create_fulfillment_xml, main_directory, inventory=inventory, run_report=report)
+
+        # Step 4: Update daily_status.tsv
+        run_step(manifest, update_daily_status, main_directory, run_report=report)
+
+        # Step 5: Separate PDF files
+        run_step(manifest, separate_pdf_files, main_directory, inventory=inventory, run_report=report)
+
+        # Step 6: Move folders to date directory
+        run_step(manifest, move_folders_to_date_directory, main_directory, inventory=inventory, run_report=report)
+
+         # Step 7: Process data in date folder
+        date_folder_name = f"{datetime.datetime.now().month}.{datetime.datetime.now().day}"
+        date_folder_path = os.path.join(main_directory, date_folder_name)
+        run_step(manifest, process_data_in_date_folder, date_folder_path, workers=workers, report=report, run_report=report)
+    finally:
+        # Report what needs attention, those items are retried on the next run
+        for step, item, error in manifest.failures():
+            print(f'NOT DONE {step} {item}: {error}')
+            report.failure(step, item, error)
+        report.save()
+
+if __name__ == "__main__":
+    main()
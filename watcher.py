@@ -0,0 +1,353 @@
+import os
+import csv
+import json
+import time
+import queue
+import select
+import zipfile
+import datetime
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import trying
+from parallel import DEFAULT_WORKERS, call_catching, call_timed, JobFailed
+from archive_store import ArchiveStore
+from inventory import Inventory, order_xml_path
+from instrumentation import RunReport
+from pdf_cache import use_directory
+from sheet_writer import SheetWriter, EXTRACTED_COLUMNS
+from parquet_output import open_dataset
+from order_ledger import open_ledger
+from zip_extract import PREFIX_PATTERN
+
+
+# inotify(7) event bits: a file finished writing, or was moved/renamed into the folder
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Rows of the day's spreadsheet as they are extracted, extracted.xlsx is rebuilt from them
+ROWS_FILE = 'extracted_rows.jsonl'
+
+
+class InotifyWaiter:
+    # Wakes the watcher as soon as something is written or moved into the folder (Linux only)
+
+    def __init__(self, folder):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0 or libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            raise OSError(ctypes.get_errno(), 'inotify is not available', folder)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # The events themselves don't matter, the folder is rescanned either way
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWaiter:
+    # Fallback where inotify doesn't exist (Windows, macOS, network shares that don't report events)
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+
+    def close(self):
+        pass
+
+
+def make_waiter(folder, polling=False):
+    if not polling:
+        try:
+            return InotifyWaiter(folder)
+        except (OSError, AttributeError):
+            pass
+    return PollingWaiter()
+
+
+def date_folder_name(now=None):
+    now = now or datetime.datetime.now()
+    return f'{now.month}.{now.day}'
+
+
+class FolderWatcher:
+    # Processes zips as they land in the main directory instead of once at the end of the day.
+    # A zip counts as delivered once its size and modification time stop changing for settle
+    # seconds and it opens as a zip. Zips of one order (same 8-digit prefix) are handled together,
+    # once none of them has changed for settle seconds. Per order the watcher archives the zips,
+    # extracts them into today's date folder, splits one PDF per folder, writes the fulfillment
+    # XML, appends to daily_status.tsv and extracts the spreadsheet rows. Whenever the queue
+    # runs dry, the date folder's extracted.xlsx is rebuilt from the rows extracted so far.
+    # Orders go through a bounded queue, so a burst of deliveries waits on disk instead of in memory.
+
+    def __init__(self, main_directory, settle=5.0, interval=2.0, queue_size=16, threads=2, workers=None, polling=False):
+        self.main_directory = main_directory
+        self.settle = settle
+        self.interval = interval
+        self.threads = threads
+        self.workers = workers or DEFAULT_WORKERS
+        self.polling = polling
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.seen = {}           # Zip name -> ((size, mtime_ns), first time seen with that stat)
+        self.queued = set()      # Zip names waiting in the queue or being processed
+        self.failed = {}         # Zip name -> stat it failed with, retried only once it changes
+        self.inventories = {}    # Date folder name -> Inventory of that folder
+        self.ledger = None       # Order ledger behind daily_status.tsv, opened on first use
+        self.dirty = set()       # Date folders whose extracted.xlsx is behind their rows file
+        self.busy = 0
+        self.pending = 0         # Zips in the main directory that are not known to fail
+        self.stopping = threading.Event()
+
+        use_directory(main_directory)
+        self.store = ArchiveStore(os.path.join(main_directory, 'Complete'))
+        self.xml_folder = os.path.join(main_directory, 'XML')
+        os.makedirs(self.xml_folder, exist_ok=True)
+        self.report = RunReport('watcher', os.path.join(main_directory, 'watch_report.json'),
+                                os.path.join(main_directory, 'watch_progress.jsonl'))
+
+    def scan(self):
+        # Zips in the main directory that have stopped changing, grouped by order
+        now = time.time()
+        stable = {}
+        waiting = set()
+        current = set()
+        with os.scandir(self.main_directory) as entries:
+            for entry in entries:
+                match = PREFIX_PATTERN.match(entry.name)
+                if not match or not entry.is_file():
+                    continue
+                name = entry.name
+                current.add(name)
+                stat = entry.stat()
+                key = (stat.st_size, stat.st_mtime_ns)
+
+                if name in self.queued or self.failed.get(name) == key:
+                    continue
+                previous = self.seen.get(name)
+                if previous is None or previous[0] != key:
+                    # New or still growing, wait until it has looked the same for settle seconds
+                    self.seen[name] = (key, now)
+                    waiting.add(match.group(1))
+                    continue
+                if now - previous[1] < self.settle:
+                    waiting.add(match.group(1))
+                    continue
+                if not zipfile.is_zipfile(entry.path):
+                    # Stopped changing but still not a zip: set it aside until it changes again
+                    print(f'NOT DONE {name}: not a zip file')
+                    self.failed[name] = key
+                    continue
+                stable.setdefault(match.group(1), []).append(name)
+
+        self.pending = len([name for name in current if name not in self.failed])
+
+        # Forget zips that are gone (processed, or taken away by someone)
+        for name in list(self.seen):
+            if name not in current:
+                del self.seen[name]
+        for name in list(self.failed):
+            if name not in current:
+                del self.failed[name]
+
+        # Hold back an order while any of its parts is still arriving
+        return {prefix: sorted(names) for prefix, names in stable.items() if prefix not in waiting}
+
+    def inventory_for(self, date_folder):
+        # Called with the lock held
+        if date_folder not in self.inventories:
+            date_folder_path = os.path.join(self.main_directory, date_folder)
+            os.makedirs(date_folder_path, exist_ok=True)
+            self.inventories = {date_folder: Inventory(date_folder_path)}  # Yesterday's is no longer needed
+        return self.inventories[date_folder]
+
+    def append_status(self, order_id):
+        # Called with the lock held. Same row as update_daily_status writes, for this one order
+        tsv_file_path = os.path.join(self.main_directory, 'daily_status.tsv')
+        if self.ledger is None:
+            self.ledger = open_ledger(self.main_directory, tsv_file_path)
+
+        row = trying.status_row(os.path.join(self.xml_folder, f'order_{order_id}.xml'))
+        new_data = self.ledger.upsert([row])
+        if new_data:
+            with open(tsv_file_path, 'a', newline='') as tsvfile:
+                csv.writer(tsvfile, delimiter='\t').writerows(new_data)
+
+    def process_order(self, executor, order_id, zip_names):
+        date_folder = date_folder_name()
+        date_folder_path = os.path.join(self.main_directory, date_folder)
+
+        with self.lock:
+            inventory = self.inventory_for(date_folder)
+            group_dir = os.path.join(date_folder_path, order_id)
+            # A late part of an order processed earlier today leaves the PDFs already placed
+            # where they are, so their folders and rows don't change under them
+            placed = trying.placed_pdfs(inventory, order_id)
+            for zip_name in zip_names:
+                zip_path = os.path.join(self.main_directory, zip_name)
+                self.store.add(zip_path)
+                trying.extract_zip(zip_path, group_dir, inventory)
+            if placed:
+                trying.place_late_pdfs(date_folder_path, order_id, inventory, placed)
+            else:
+                trying.separate_folder(date_folder_path, order_id, inventory)
+
+            # The client sees the order as received from here on
+            trying.write_fulfillment_xml(self.xml_folder, order_id)
+            self.append_status(order_id)
+
+            folders = [order_id] + inventory.split_folders_of(order_id)
+            jobs = []
+            current_date = datetime.datetime.now().strftime('%m/%d/%Y')
+            for folder_name in folders:
+                contents = inventory.contents(folder_name)
+                folder_path = os.path.join(date_folder_path, folder_name)
+                xml_path = order_xml_path(folder_path, contents)
+                if xml_path is None:
+                    continue
+                for pdf_file in sorted(contents.pdfs):
+                    jobs.append((folder_name, pdf_file, os.path.join(folder_path, pdf_file), xml_path))
+
+        # The PDFs are read in the shared worker pool, outside the lock, so other orders keep going
+        futures = [executor.submit(call_timed, call_catching, trying.extract_record, pdf_path, xml_path, current_date)
+                   for _, _, pdf_path, xml_path in jobs]
+        lines = []
+        errors = []
+        for (folder_name, pdf_file, pdf_path, _), future in zip(jobs, futures):
+            row, seconds, counts = future.result()
+            failed = isinstance(row, JobFailed)
+            with self.lock:
+                self.report.file_done(pdf_path, seconds, failed, counts)
+            if failed:
+                errors.append(f'{folder_name}/{pdf_file}: {row.error}')
+                continue
+            lines.append(json.dumps({'folder': folder_name, 'pdf': pdf_file, 'row': row}) + '\n')
+
+        with self.lock:
+            with open(os.path.join(date_folder_path, ROWS_FILE), 'a') as f:
+                f.writelines(lines)
+            self.dirty.add(date_folder)
+
+            # Archived in Complete, so the inbound copy can go once every letter is read. That is
+            # also what keeps a restarted watcher from processing the order again. With letters
+            # that failed the zips stay, to be processed again when they are redelivered or the
+            # watcher restarts.
+            if not errors:
+                for zip_name in zip_names:
+                    os.remove(os.path.join(self.main_directory, zip_name))
+        return errors
+
+    def work(self, executor):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            order_id, zip_names, stats = item
+            try:
+                errors = self.process_order(executor, order_id, zip_names)
+                with self.lock:
+                    for error in errors:
+                        print(f'NOT DONE {order_id}: {error}')
+                        self.report.failure('extract_record', order_id, error)
+                    if errors:
+                        for zip_name, stat in zip(zip_names, stats):
+                            self.failed[zip_name] = stat
+                    self.report.count('orders')
+                    self.report.count('zips', len(zip_names))
+                print(f'Processed order {order_id} ({len(zip_names)} zip(s))')
+            except Exception as e:
+                print(f'NOT DONE {order_id}: {type(e).__name__}: {e}')
+                with self.lock:
+                    self.report.failure('process_order', order_id, f'{type(e).__name__}: {e}')
+                    for zip_name, stat in zip(zip_names, stats):
+                        self.failed[zip_name] = stat
+            finally:
+                with self.lock:
+                    self.queued.difference_update(zip_names)
+                    self.busy -= 1
+                self.queue.task_done()
+
+    def rebuild_spreadsheets(self):
+        # Rewrite extracted.xlsx of every date folder that got new rows, in the same order
+        # process_data_in_date_folder writes them (folder, then PDF, sorted by name)
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+        for date_folder in dirty:
+            date_folder_path = os.path.join(self.main_directory, date_folder)
+            rows = {}
+            with open(os.path.join(date_folder_path, ROWS_FILE), 'r') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        rows[(entry['folder'], entry['pdf'])] = entry['row']  # A reprocessed PDF replaces its row
+            with SheetWriter(os.path.join(date_folder_path, 'extracted.xlsx'), EXTRACTED_COLUMNS) as writer, \
+                    open_dataset(date_folder_path) as dataset:
+                for key in sorted(rows):
+                    writer.write(rows[key])
+                    dataset.write(rows[key])
+            print(f'Excel spreadsheet has been updated at {os.path.join(date_folder_path, "extracted.xlsx")}')
+        self.report.save()
+
+    def run(self, once=False):
+        # With once, stop as soon as everything that was delivered has been processed
+        waiter = make_waiter(self.main_directory, self.polling)
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        workers = [threading.Thread(target=self.work, args=(executor,), daemon=True) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        print(f'Watching {self.main_directory} ({type(waiter).__name__})')
+
+        try:
+            with self.report.stage('watch'):
+                self.watch_loop(waiter, once)
+        except KeyboardInterrupt:
+            print('Stopping, letting the orders in progress finish')
+        finally:
+            for _ in workers:
+                self.queue.put(None)
+            for worker in workers:
+                worker.join()
+            executor.shutdown()
+            waiter.close()
+            if self.dirty:
+                self.rebuild_spreadsheets()
+            if self.ledger is not None:
+                self.ledger.close()
+            self.report.save()
+
+    def watch_loop(self, waiter, once):
+        while not self.stopping.is_set():
+            ready = self.scan()
+            for order_id, zip_names in sorted(ready.items()):
+                stats = [self.seen[name][0] for name in zip_names]
+                with self.lock:
+                    self.queued.update(zip_names)
+                    self.busy += 1
+                # Blocks while the queue is full, nothing new is picked up until there is room
+                self.queue.put((order_id, zip_names, stats))
+
+            with self.lock:
+                idle = self.busy == 0
+            if idle and self.dirty:
+                self.rebuild_spreadsheets()
+            if once and idle and not self.pending:
+                break
+            waiter.wait(min(self.interval, self.settle) if self.seen else self.interval)
+
+    def stop(self):
+        self.stopping.set()
+
+
+def watch(main_directory, **options):
+    FolderWatcher(main_directory, **options).run()
@@ -0,0 +1,103 @@
+import os
+import contextlib
+import xml.etree.ElementTree as ET
+
+
+# 'auto' parses with lxml when it is installed and with the standard library otherwise,
+# XML_BACKEND=etree always uses the standard library
+XML_BACKEND = os.environ.get('XML_BACKEND', 'auto').lower()
+
+
+def load_lxml():
+    if XML_BACKEND == 'etree':
+        return None
+    try:
+        from lxml import etree
+    except ImportError:
+        return None
+    return etree
+
+
+def open_source(source):
+    # A path is opened (and closed again, also when the scan stops early), an open file is used as is
+    if isinstance(source, (str, bytes, os.PathLike)):
+        return open(source, 'rb')
+    return contextlib.nullcontext(source)
+
+
+def child_texts(elem, fields=None):
+    # {tag: text} of the direct children of an element, the first child of each tag (of each
+    # tag in fields, when given)
+    texts = {}
+    for child in elem:
+        tag = child.tag
+        if isinstance(tag, str) and (fields is None or tag in fields):  # lxml gives comments too
+            texts.setdefault(tag, child.text)
+    return texts
+
+
+def scan(source, first=(), each=None, fields=None):
+    # One pass over an XML document, keeping only what is asked for:
+    #   first: tags whose first element in document order is wanted (what root.find('.//tag')
+    #          gives), returned as {tag: (text, child_texts)} for the tags that occur
+    #   each:  a tag whose every element is wanted (what root.findall('.//tag') gives),
+    #          returned as a list of child_texts, only of the children in fields when given
+    # Everything else is cleared as soon as it ends, so memory stays flat however many elements
+    # the document holds. Without `each`, reading stops once all the `first` tags are found.
+    wanted = set(first)
+    tags = wanted | ({each} if each else set())
+    found, records = {}, []
+    opened = {}  # Tag -> its first element, between its start and its end
+    slots = []   # Places in records of the open `each` elements, records stay in document order
+    holding = 0  # Wanted elements open, nothing inside them can be cleared yet
+    stack = []   # Open elements, the standard library parser has no parent links
+
+    etree = load_lxml()
+    with open_source(source) as f:
+        if etree is not None:
+            # lxml only reports the wanted tags, the rest of the document never reaches Python
+            events = etree.iterparse(f, events=('start', 'end'), tag=sorted(tags))
+        else:
+            events = ET.iterparse(f, events=('start', 'end'))
+
+        for event, elem in events:
+            tag = elem.tag
+            if event == 'start':
+                if tag == each:
+                    slots.append(len(records))
+                    records.append(None)
+                    holding += 1
+                if tag in wanted and tag not in found and tag not in opened:
+                    opened[tag] = elem
+                    holding += 1
+                if etree is None:
+                    stack.append(elem)
+                continue
+
+            if etree is None:
+                stack.pop()
+            if tag == each:
+                records[slots.pop()] = child_texts(elem, fields)
+                holding -= 1
+            if opened.get(tag) is elem:
+                found[tag] = (elem.text, child_texts(opened.pop(tag)))
+                holding -= 1
+                if each is None and len(found) == len(wanted):
+                    break
+
+            if holding == 0:
+                # Let go of the element and of the finished elements before it
+                elem.clear()
+                if etree is not None:
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+                elif stack:
+                    del stack[-1][:]
+    return found, records
+
+
+def first_texts(source, tags):
+    # {tag: text} of the first element of each tag, like root.find('.//tag').text; tags that
+    # don't occur are left out
+    found, _ = scan(source, first=tags)
+    return {tag: text for tag, (text, _) in found.items()}
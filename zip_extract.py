@@ -0,0 +1,154 @@
+import os
+import re
+import shutil
+import zipfile
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from parallel import DEFAULT_WORKERS
+
+
+# Threads used to inflate zip members. zlib lets go of the GIL while it decompresses, so threads
+# are enough here and nothing has to be sent to other processes.
+ZIP_WORKERS = int(os.environ.get('ZIP_WORKERS', DEFAULT_WORKERS))
+
+# A zip is only split across threads in runs of at least this many uncompressed bytes
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# What ZipFile.extract replaces with '_' in member names on Windows
+WINDOWS_ILLEGAL = str.maketrans(':<>|"?*', '_______')
+
+PREFIX_PATTERN = re.compile(r'(\d{8})_.*\.zip$')
+
+
+def group_by_prefix(zip_names, pattern=PREFIX_PATTERN):
+    # {8-digit prefix: [zip names]} in the order the names come in, names the pattern doesn't
+    # match are left out
+    groups = {}
+    for name in zip_names:
+        match = pattern.match(name)
+        if match:
+            groups.setdefault(match.group(1), []).append(name)
+    return groups
+
+
+class StagedZip:
+    # The members of one zip, extracted into a folder of their own under the staging folder
+
+    def __init__(self, zip_path, folder):
+        self.zip_path = zip_path
+        self.folder = folder
+        self.names = []
+        self.error = None
+
+    def move_into(self, dest_dir):
+        # Put the staged files into dest_dir the way extractall would have, replacing files of
+        # the same name. A zip that failed to extract (bad CRC, truncated, ...) raises here,
+        # before any of its files are moved.
+        if self.error is not None:
+            raise self.error
+        for root, _, files in os.walk(self.folder):
+            relative = os.path.relpath(root, self.folder)
+            target = dest_dir if relative == '.' else os.path.join(dest_dir, relative)
+            os.makedirs(target, exist_ok=True)
+            for name in files:
+                os.replace(os.path.join(root, name), os.path.join(target, name))
+        return self.names
+
+
+def member_path(folder, name):
+    # Where ZipFile.extract puts a member: '..', '.', drive letters and empty parts dropped,
+    # characters Windows can't take in a name replaced by '_'
+    arcname = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [part for part in arcname.split(os.path.sep) if part not in ('', os.path.curdir, os.path.pardir)]
+    if os.path.sep == '\\':
+        parts = [part.translate(WINDOWS_ILLEGAL).rstrip('.') for part in parts]
+        parts = [part for part in parts if part]
+    return os.path.join(folder, *parts)
+
+
+def make_member_folders(staged, infos):
+    # Create every folder the members go into up front, one thread at a time. extract checks
+    # for a member's folder and then creates it, which races when two threads do it at once.
+    folders = {staged.folder}
+    for info in infos:
+        target = member_path(staged.folder, info.filename)
+        folders.add(target if info.is_dir() else os.path.dirname(target))
+    for folder in sorted(folders):
+        os.makedirs(folder, exist_ok=True)
+
+
+def chunk_members(infos, chunks):
+    # Split the members into at most `chunks` runs of neighbouring members of about the same
+    # uncompressed size
+    total = sum(info.file_size for info in infos) or 1
+    runs, run, size = [], [], 0
+    for info in infos:
+        run.append(info)
+        size += info.file_size
+        if size * chunks >= total * (len(runs) + 1) and len(runs) < chunks - 1:
+            runs.append(run)
+            run = []
+    if run:
+        runs.append(run)
+    return runs
+
+
+def stage_members(staged, members):
+    # Extract a run of members of one zip with a single open ZipFile (opening it reads the
+    # whole central directory). Reading a member through to its end checks its CRC, a damaged
+    # member raises BadZipFile.
+    try:
+        with zipfile.ZipFile(staged.zip_path, 'r') as zip_ref:
+            for member in members:
+                zip_ref.extract(member, staged.folder)
+    except Exception as e:
+        return e
+    return None
+
+
+def stage_zips(zip_paths, staging_root, workers=None):
+    # Extract the members of all the zips concurrently, each zip into its own folder under
+    # staging_root. A big zip is split into runs of members so its runs go to several threads,
+    # small zips are one job each. Returns {zip path: StagedZip}; nothing outside staging_root
+    # is touched.
+    workers = workers or ZIP_WORKERS
+    staged = {}
+    jobs = []
+    for i, zip_path in enumerate(zip_paths):
+        staged[zip_path] = StagedZip(zip_path, os.path.join(staging_root, str(i)))
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                infos = zip_ref.infolist()
+            staged[zip_path].names = [info.filename for info in infos]
+            make_member_folders(staged[zip_path], infos)
+        except (OSError, zipfile.BadZipFile) as e:
+            staged[zip_path].error = e
+            continue
+
+        # Members of the same name have to be extracted in order, the last one wins
+        chunks = min(workers, len(infos), sum(info.file_size for info in infos) // CHUNK_BYTES + 1)
+        if len(set(staged[zip_path].names)) < len(infos):
+            chunks = 1
+        jobs.extend((staged[zip_path], run) for run in chunk_members(infos, chunks))
+
+    workers = max(1, min(workers, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (zip_staged, _), error in zip(jobs, executor.map(lambda job: stage_members(*job), jobs)):
+            if error is not None and zip_staged.error is None:
+                zip_staged.error = error
+    return staged
+
+
+@contextmanager
+def staging_folder(directory):
+    # A scratch folder next to the destination folders (so moving out of it is a rename),
+    # removed with whatever is left in it at the end
+    folder = tempfile.mkdtemp(prefix='.staging-', dir=directory)
+    try:
+        yield folder
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)